@@ -1,19 +1,27 @@
 """Non-API adapters to web resources: reddit.com, gfycat.com, imgur.com"""
 
 import abc
+import collections
+import concurrent.futures
 import os
 import re
-import time
 from urllib.parse import urlparse, urlunparse
 
 import requests
 from bs4 import BeautifulSoup
+from lxml import etree
+from urllib3.util.request import ACCEPT_ENCODING
 
+from download_filter import DownloadFilter
+from rate_limit import DEFAULT_LIMITER
+from retry import DEFAULT_RETRY_POLICY
 from submission import SubmissionRL
+from transfer_stats import DEFAULT_COUNTER
 
 BROWSER_HEADERS = {
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-    "Accept-Encoding": "gzip, deflate, br",
+    # codings urllib3 decodes: br and zstd only if their decoders are installed
+    "Accept-Encoding": ", ".join(ACCEPT_ENCODING.split(",")),
     "Accept-Language": "en-US,en;q=0.5",
     "Connection": "keep-alive",
     "DNT": "1",
@@ -22,6 +30,15 @@ BROWSER_HEADERS = {
             " (KHTML, like Gecko) Chrome/77.0.3835.0 Safari/537.36"
 }
 
+Page = collections.namedtuple("Page", ("url", "content"))
+""" HTML page or it's prefix fetched by SubmissionResolver
+
+Attributes:
+    url (str): final URL of page.
+
+    content (bytes): page content.
+"""
+
 
 class SubredditIterator:
     """old.reddit.com scraper
@@ -44,6 +61,16 @@ class SubredditIterator:
 
         SUBMISSIONS_PER_PAGE (int): 25.
 
+        STREAMING_PARSE (bool): parse pages with streaming lxml parser,
+        BeautifulSoup is used as a fallback. Initially True.
+
+        PARSE_CHUNK_SIZE (int): size of page chunks fed to streaming parser.
+
+        RETRY_POLICY (retry.RetryPolicy): retries failed page requests.
+
+        TRANSFER_COUNTER (transfer_stats.TransferCounter): counts bytes
+        of fetched pages.
+
     Instance attributes:
         subreddit_url (str): https://old.reddit.com/r/<subreddit>.
 
@@ -57,11 +84,31 @@ class SubredditIterator:
 
         submission_idx (int): points to next submission in submissions list.
 
+        prefetch_watermark (int): count of consumed submissions of current page
+        after which next page is requested in background, None if prefetch
+        is disabled.
+
+        prefetch_future (concurrent.futures.Future): pending background request
+        of next page or None.
+
+        prefetch_executor (concurrent.futures.ThreadPoolExecutor): single worker
+        of prefetch, created on first prefetch and released by close.
+
+        rate_limiter (rate_limit.RateLimiter): paces requests of pages.
+
     Args:
         subreddit_name (str): name of subreddit to browse.
 
         http_headers (dict): HTTP session headers. If not explicitly specified
         used BROWSER_HEADERS.
+
+        prefetch_watermark (int): enables prefetch of next page, e.g. 15 of 25.
+
+        state (dict): state saved by get_state to continue iteration from.
+        If specified first page is not requested.
+
+        rate_limiter (rate_limit.RateLimiter): shared limiter,
+        rate_limit.DEFAULT_LIMITER if not specified.
     """
 
     class NoSubmissionsAvailable(Exception):
@@ -78,31 +125,78 @@ class SubredditIterator:
 
     REDDIT_URL = "https://old.reddit.com"
     SUBMISSIONS_PER_PAGE = 25
+    STREAMING_PARSE = True
+    PARSE_CHUNK_SIZE = 16384
+    RETRY_POLICY = DEFAULT_RETRY_POLICY
+    TRANSFER_COUNTER = DEFAULT_COUNTER
 
-    def __init__(self, subreddit_name, http_headers=None):
+    def __init__(self, subreddit_name, http_headers=None, prefetch_watermark=None,
+                 state=None, rate_limiter=None):
         self.subreddit_url = self.REDDIT_URL + "/r/" + subreddit_name
         self.referer = ""
         self.after = ""
         self.count = 0
         self.submissions = []
         self.submission_idx = 0
+        self.prefetch_watermark = prefetch_watermark
+        self.prefetch_future = None
+        self.prefetch_executor = None
+        self.rate_limiter = rate_limiter if rate_limiter is not None else DEFAULT_LIMITER
         self.session = requests.Session()
         if http_headers is None:
             http_headers = BROWSER_HEADERS
         self.session.headers.update(**http_headers, **{"Host": "old.reddit.com"})
+        if state is not None:
+            self.set_state(state)
+            return
+
         try:
             self.load_submissions()
         except self.NoSubmissionsAvailable:
             pass
 
+    def get_state(self):
+        """
+        Returns:
+            dict: json serializable listing cursor and cached submissions
+            not yet iterated over. Prefetched page is not included.
+        """
+        return {
+            "subreddit_url": self.subreddit_url,
+            "referer": self.referer,
+            "after": self.after,
+            "count": self.count,
+            "submissions": [SubmissionRL.to_json(submission) for submission
+                            in self.submissions[self.submission_idx:]]
+        }
+
+    def set_state(self, state):
+        """
+        Continue iteration from state returned by get_state.
+        HTTP session is untouched.
+
+        Args:
+            state (dict).
+        """
+        self.reset("")
+        self.subreddit_url = state["subreddit_url"]
+        self.referer = state["referer"]
+        self.after = state["after"]
+        self.count = state["count"]
+        self.submissions = [SubmissionRL.from_json(submission)
+                            for submission in state["submissions"]]
+
     def reset(self, subreddit_name):
         """
         Clear internal state and assign /r/<subreddit_name>.
-        HTTP session is untouched.
+        HTTP session is untouched. Pending prefetch is awaited and discarded.
 
         Args:
             subreddit_name (str): new subreddit to browse.
         """
+        if self.prefetch_future is not None:
+            concurrent.futures.wait((self.prefetch_future,))
+            self.prefetch_future = None
         self.subreddit_url = self.REDDIT_URL + "/r/" + subreddit_name
         self.referer = ""
         self.after = ""
@@ -110,12 +204,23 @@ class SubredditIterator:
         self.submissions = []
         self.submission_idx = 0
 
+    def close(self):
+        """Cancel pending prefetch, release it's worker."""
+        if self.prefetch_future is not None:
+            self.prefetch_future.cancel()
+            self.prefetch_future = None
+        if self.prefetch_executor is not None:
+            self.prefetch_executor.shutdown(wait=False)
+            self.prefetch_executor = None
+
     def __iter__(self):
         return self
 
     def __next__(self):
         """
         Get next cached submission related URLs.
+        If prefetch is enabled and consumption of current page passes
+        the watermark start background request of next page.
 
         Returns:
             SubmissionRL: parsed submission related URLs encapsulated
@@ -134,7 +239,8 @@ class SubredditIterator:
             except self.NoSubmissionsAvailable as error:
                 raise StopIteration from error
 
-        next_submission = self.get_next_submission()
+            next_submission = self.get_next_submission()
+        self.__prefetch_if_due()
         return next_submission
 
     def get_next_submission(self):
@@ -153,26 +259,46 @@ class SubredditIterator:
 
     def load_submissions(self):
         """
-        Request and parse next page.
+        Request and parse next page or take prefetched one.
         Update submissions cache and internal state accordingly.
 
         Raises:
             NoSubmissionsAvailable.
         """
         try:
-            response = self.__request_next_page()
+            if self.prefetch_future is not None:
+                prefetch_future, self.prefetch_future = self.prefetch_future, None
+                response = prefetch_future.result()
+            else:
+                response = self.__request_next_page()
             self.__update(response)
         except (self.HTTPRequestsFailed, self.NoSubmissionsOnPage) as error:
             raise self.NoSubmissionsAvailable from error
 
+    def __prefetch_if_due(self):
+        """
+        Submit background request of next page if prefetch is enabled,
+        watermark is passed and no request is pending.
+        Internal state is updated later in load_submissions.
+        """
+        if (self.prefetch_watermark is None
+                or self.prefetch_future is not None
+                or self.submission_idx < min(self.prefetch_watermark,
+                                             len(self.submissions))):
+            return
+
+        if self.prefetch_executor is None:
+            self.prefetch_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1)
+        self.prefetch_future = self.prefetch_executor.submit(self.__request_next_page)
+
     def __request_next_page(self):
         """
         Do series of requests of next subreddit page.
 
         Note:
-            !Function retries request if response code is not 200.
-            !Function blocks between requests by time.sleep(interval).
-            Initially suggested interval=2s.
+            !Function retries request according to RETRY_POLICY.
+            !Function blocks until each request is allowed by rate limiter.
 
         Returns:
             requests.Response: HTTP response containing next subreddit page.
@@ -184,34 +310,36 @@ class SubredditIterator:
         if self.count != 0:
             url += f"/?count={self.count}&after={self.after}"
         referer_header = {"Referer": self.referer} if self.referer is not None else {}
-        tries = 2
-        interval = 2
-        while True:
-            response = self.session.get(url, headers=referer_header)
-            if response.status_code == 200:
-                break
-            tries -= 1
-            if tries == 0:
+        try:
+            response = self.RETRY_POLICY.request(
+                self.rate_limiter, url,
+                lambda: self.session.get(url, headers=referer_header))
+            if response.status_code != 200:
                 raise self.HTTPRequestsFailed(f"Code {response.status_code}"
                                               f", {response.url}")
-            time.sleep(interval)
-
-        if os.path.basename(urlparse(response.url).path) == "over18":
-            time.sleep(interval)
-            response = self.session.post(
-                response.url,
-                headers={
-                    "Origin": self.REDDIT_URL,
-                    "Referer": self.REDDIT_URL,
-                    "Content-Type": "application/x-www-form-urlencoded"
-                },
-                params={"dest": url},
-                data={"over18": "yes"}
-            )
+
+            if os.path.basename(urlparse(response.url).path) == "over18":
+                response = self.RETRY_POLICY.request(
+                    self.rate_limiter, response.url,
+                    lambda: self.session.post(
+                        response.url,
+                        headers={
+                            "Origin": self.REDDIT_URL,
+                            "Referer": self.REDDIT_URL,
+                            "Content-Type": "application/x-www-form-urlencoded"
+                        },
+                        params={"dest": url},
+                        data={"over18": "yes"}
+                    )
+                )
+        except requests.exceptions.RequestException as error:
+            raise self.HTTPRequestsFailed(f"Request failed: {error}, {url}") from error
+
         if response.status_code != 200:
             raise self.HTTPRequestsFailed("Age verification step"
                                           f", code {response.status_code}"
                                           f", {response.url}")
+        self.TRANSFER_COUNTER.add_response(response, len(response.content))
         return response
 
     def __update(self, response):
@@ -236,10 +364,12 @@ class SubredditIterator:
         self.after = last_submission_id
         self.count += self.SUBMISSIONS_PER_PAGE
 
-    @staticmethod
-    def parse(response):
+    @classmethod
+    def parse(cls, response):
         """
         Scrape submitted URLs.
+        Streaming parser is tried first, BeautifulSoup is used as a fallback
+        if it is disabled or finds nothing.
 
         Args:
             response (requests.Response): response with subreddit page.
@@ -250,6 +380,57 @@ class SubredditIterator:
             str: id of last submission on page used by reddit as HTTP
             request parameter 'after'.
         """
+        if cls.STREAMING_PARSE:
+            parsed_submissions, last_submission_id = cls.parse_streaming(response)
+            if parsed_submissions is not None:
+                return parsed_submissions, last_submission_id
+
+        return cls.parse_soup(response)
+
+    @classmethod
+    def parse_streaming(cls, response):
+        """
+        Scrape submitted URLs without building document tree.
+        Page is fed to lxml parser by chunks, submissions are collected by
+        parser target as thing divs close. Feeding stops as soon as
+        the element containing submissions is closed.
+
+        Args:
+            response (requests.Response): response with subreddit page.
+
+        Returns:
+            list, str: see parse. Pair of None if nothing is found
+            or page is malformed.
+        """
+        target = _ListingParserTarget()
+        parser = etree.HTMLParser(target=target)
+        content = response.content
+        chunk_size = cls.PARSE_CHUNK_SIZE
+        try:
+            for i in range(0, len(content), chunk_size):
+                parser.feed(content[i:i + chunk_size])
+                if target.is_done:
+                    break
+            parser.close()
+        except etree.LxmlError:
+            return None, None
+
+        if target.last_submission_id is None:
+            return None, None
+
+        return target.submissions, target.last_submission_id.replace("thing_", "")
+
+    @staticmethod
+    def parse_soup(response):
+        """
+        Scrape submitted URLs with BeautifulSoup.
+
+        Args:
+            response (requests.Response): response with subreddit page.
+
+        Returns:
+            list, str: see parse.
+        """
         parsed_submissions = []
         submission_id_pattern = re.compile("thing_t3")
         thing = BeautifulSoup(response.content, "lxml")\
@@ -267,18 +448,111 @@ class SubredditIterator:
         return parsed_submissions, last_submission_id.replace("thing_", "")
 
 
+class _ListingParserTarget:
+    """lxml parser target used by SubredditIterator.parse_streaming
+
+    Mimics BeautifulSoup based parsing: first div with id containing thing_t3
+    is found, then its sibling divs with such ids are taken. Promoted
+    submissions are skipped.
+
+    Attributes:
+        submissions (list): SubmissionRL objects of closed thing divs.
+
+        last_submission_id (str): id of last non-promoted thing div or None.
+
+        is_done (bool): parent element of thing divs is closed,
+        rest of page is of no interest.
+
+        depth (int): current element depth.
+
+        thing_depth (int): depth of thing divs, None until first one is met.
+
+        pending_thing (tuple): (id, classes, data-url) of open thing div.
+    """
+
+    def __init__(self):
+        self.submissions = []
+        self.last_submission_id = None
+        self.is_done = False
+        self.depth = 0
+        self.thing_depth = None
+        self.pending_thing = None
+
+    def start(self, tag, attrib):
+        self.depth += 1
+        if self.is_done or tag != "div":
+            return
+
+        thing_id = attrib.get("id", "")
+        if "thing_t3" not in thing_id:
+            return
+
+        if self.thing_depth is None:
+            self.thing_depth = self.depth
+        if self.depth == self.thing_depth:
+            self.pending_thing = (thing_id,
+                                  attrib.get("class", "").split(),
+                                  attrib.get("data-url"))
+
+    def end(self, tag):
+        if self.is_done:
+            pass
+        elif self.pending_thing is not None and self.depth == self.thing_depth:
+            thing_id, thing_classes, thing_url = self.pending_thing
+            self.pending_thing = None
+            if "promoted" not in thing_classes:
+                self.submissions.append(SubmissionRL(url=thing_url))
+                self.last_submission_id = thing_id
+        elif self.thing_depth is not None and self.depth < self.thing_depth:
+            self.is_done = True
+        self.depth -= 1
+
+    def data(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
 class SubmissionResolver(abc.ABC):
     """Abstract base class of resolvers of submission related URLs
 
        Replaces URLs of external resources with direct URLs of
-       media files.
+       media files. Resolutions may be stored in persistent cache
+       to avoid repeated requests. Permanent failures are cached
+       too, so known-bad URLs are rejected without requests.
+       Cache may be shared by resolvers wanting different media
+       extensions: cached resolutions with other extensions are
+       resolved again, failures to find media are cached with
+       wanted extensions.
 
        Class attributes:
-            class HTTPRequestsFailed (Exception).
+            class HTTPRequestsFailed (Exception): has status_code attribute
+            of last response.
 
             class MediaIsUnavailable (Exception): high-level exception caused by
             other internal exceptions.
 
+            PERMANENT_FAILURE_CODES (tuple of int): HTTP status codes of pages
+            which are assumed to be gone, failures with these codes are cached.
+
+            PARSE_FAILURE_TTL (int): lifetime of cached failures to find media
+            on fetched page, 1 hour. Page may be transient consent, captcha or
+            rate limit interstitial, so such failures expire sooner than
+            failures of gone pages.
+
+            PAGE_END_MARKER (bytes): lowercase tag after which page content is
+            of no interest for parser. If specified page is streamed and
+            connection is closed as soon as the marker is read. None means
+            whole page is fetched.
+
+            PAGE_CHUNK_SIZE (int): size of chunks of streamed page.
+
+            RETRY_POLICY (retry.RetryPolicy): retries failed page requests.
+
+            TRANSFER_COUNTER (transfer_stats.TransferCounter): counts bytes
+            of fetched pages.
+
        Instance attributes:
             session (requests.Session): persistent HTTP session established with
             external resource delivering submitted media.
@@ -286,65 +560,218 @@ class SubmissionResolver(abc.ABC):
             target_media_extensions (list or tuple of str): extensions of
             wanted media files.
 
+            cache (resolve_cache.ResolveCache): cache of resolutions or None.
+
+            rate_limiter (rate_limit.RateLimiter): paces page requests.
+
        Args:
             target_media_extensions (lits | tuple of str): collection
             of file extensions without periods.
 
             http_headers (dict): base HTTP headers.
+
+            cache (resolve_cache.ResolveCache): cache of resolutions, may be
+            shared by resolvers.
+
+            rate_limiter (rate_limit.RateLimiter): shared limiter,
+            rate_limit.DEFAULT_LIMITER if not specified.
     """
 
     class HTTPRequestsFailed(Exception):
-        pass
+        def __init__(self, message, status_code=None):
+            super().__init__(message)
+            self.status_code = status_code
 
     class MediaIsUnavailable(Exception):
         """High-level exception raised in case if no requested media is found"""
 
-    def __init__(self, target_media_extensions, http_headers=None):
+    PERMANENT_FAILURE_CODES = (404, 410)
+    PARSE_FAILURE_TTL = 3600
+    PAGE_END_MARKER = None
+    PAGE_CHUNK_SIZE = 8192
+    RETRY_POLICY = DEFAULT_RETRY_POLICY
+    TRANSFER_COUNTER = DEFAULT_COUNTER
+
+    def __init__(self, target_media_extensions, http_headers=None, cache=None,
+                 rate_limiter=None):
         self.session = requests.Session()
         if http_headers is None:
             http_headers = BROWSER_HEADERS
         self.session.headers.update(http_headers)
         self.target_media_extensions = target_media_extensions
+        self.cache = cache
+        self.rate_limiter = rate_limiter if rate_limiter is not None else DEFAULT_LIMITER
 
     def resolve(self, submission):
         """Main function
         Replace submitted URLs with direct URL of media file.
         Update other URLs accordingly.
+        Cached resolution is used if any, new one is cached.
+        Parsing failures and permanent request failures are cached.
 
         Args:
             submission (SubmissionRL): submission related URLs.
 
         Raises:
-            MediaIsUnavailable: if requests or parsing failed.
+            MediaIsUnavailable: if requests or parsing failed or
+            failure is cached.
         """
+        if not self.prepare(submission) or self.resolve_cached(submission):
+            return
+
         try:
-            response = self.request_page(submission.url, submission.url_referer)
+            page = self.fetch_page(submission.url, submission.url_referer)
         except self.HTTPRequestsFailed as error:
+            self.cache_failure(submission.url, error)
             raise self.MediaIsUnavailable from error
 
-        url_direct, url_extra = self.parse(response)
+        self.apply_page(submission, page)
+
+    def prepare(self, submission):
+        """
+        Check submission before any request, may rewrite submitted URL.
+        Base implementation accepts every submission.
+
+        Args:
+            submission (SubmissionRL): submission related URLs.
+
+        Returns:
+            bool: True if page of submitted URL has to be fetched,
+            False if submission needs no resolution.
+
+        Raises:
+            MediaIsUnavailable: submission can not be resolved.
+        """
+        return True
+
+    def cache_failure(self, url, error):
+        """
+        Cache failure of page request if it is permanent.
+
+        Args:
+            url (str): submitted URL.
+
+            error (HTTPRequestsFailed).
+        """
+        if self.cache is not None and error.status_code in self.PERMANENT_FAILURE_CODES:
+            self.cache.put_failure(url, str(error))
+
+    def apply_page(self, submission, page):
+        """
+        Parse fetched page, update submission and cache resolution.
+        Parsing failure is cached for PARSE_FAILURE_TTL.
+
+        Args:
+            submission (SubmissionRL): submission related URLs.
+
+            page (Page): page of submitted URL.
+
+        Raises:
+            MediaIsUnavailable: no media is found on page.
+        """
+        submitted_url = submission.url
+        url_direct, url_extra = self.parse(page)
         if url_direct is None:
-            raise self.MediaIsUnavailable(f"No media with known extension found"
-                                          f", {response.url}")
+            reason = f"No media with known extension found, {page.url}"
+            if self.cache is not None:
+                self.cache.put_failure(submitted_url, reason, self.target_media_extensions,
+                                       self.PARSE_FAILURE_TTL)
+            raise self.MediaIsUnavailable(reason)
 
         submission.url = url_direct
         submission.url_extra = url_extra
-        submission.url_referer = response.url
+        submission.url_referer = page.url
+        if self.cache is not None:
+            self.cache.put(submitted_url, url_direct, url_extra, page.url)
+
+    def resolve_cached(self, submission):
+        """
+        Resolve submission without requests if cached resolution exists
+        and it's direct URL has wanted extension or none. Failures cached
+        for other extensions are ignored.
+        May be used by callers to skip request pacing.
+
+        Args:
+            submission (SubmissionRL): submission related URLs.
+
+        Returns:
+            bool: True if submission is resolved, False otherwise.
+
+        Raises:
+            MediaIsUnavailable: failure of submitted URL is cached.
+        """
+        if self.cache is None:
+            return False
+
+        reason = self.cache.get_failure(submission.url, self.target_media_extensions)
+        if reason is not None:
+            raise self.MediaIsUnavailable(f"Cached failure: {reason}")
+
+        resolution = self.cache.get(submission.url)
+        if resolution is None:
+            return False
+
+        # extensionless direct URL, e.g. zip of imgur album, is wanted by any resolver
+        extension = os.path.splitext(urlparse(resolution[0]).path)[1].lstrip(".")
+        if extension and extension not in self.target_media_extensions:
+            return False
 
-    def request_page(self, url_page, url_referer=None):
+        submission.url, submission.url_extra, submission.url_referer = resolution
+        return True
+
+    def fetch_page(self, url_page, url_referer=None):
+        """
+        Request page and read it up to PAGE_END_MARKER if specified,
+        read whole page otherwise.
+
+        Args:
+            url_page (str): URL of requested HTTP page.
+
+            url_referer (str): HTTP referer, may be None.
+
+        Returns:
+            Page: fetched page or it's prefix ending with the marker.
+
+        Raises:
+            HTTPRequestsFailed.
+        """
+        if self.PAGE_END_MARKER is None:
+            response = self.request_page(url_page, url_referer)
+            self.TRANSFER_COUNTER.add_response(response, len(response.content))
+            return Page(url=response.url, content=response.content)
+
+        response = self.request_page(url_page, url_referer, stream=True)
+        marker = self.PAGE_END_MARKER
+        content = bytearray()
+        try:
+            for chunk in response.iter_content(self.PAGE_CHUNK_SIZE):
+                search_start = max(0, len(content) - len(marker) + 1)
+                content += chunk
+                if content[search_start:].lower().find(marker) != -1:
+                    break
+            self.TRANSFER_COUNTER.add_response(response, len(content))
+        except requests.exceptions.RequestException as error:
+            raise self.HTTPRequestsFailed(f"Page read failed: {error}, {url_page}")\
+                from error
+        finally:
+            response.close()
+        return Page(url=response.url, content=bytes(content))
+
+    def request_page(self, url_page, url_referer=None, stream=False):
         """
         Make several HTTP requests.
 
         Note:
-            !Function retries request if response code is not 200.
-            !Function blocks between requests by time.sleep(interval).
-            Initially interval=1s.
+            !Function retries request according to RETRY_POLICY.
+            !Function blocks until each request is allowed by rate limiter.
 
         Args:
             url_page (str): URL of requested HTTP page.
 
             url_referer (str): HTTP referer, may be None.
 
+            stream (bool): content of response is not read.
+
         Returns:
             response (requests.Response): response with requested page.
 
@@ -352,19 +779,18 @@ class SubmissionResolver(abc.ABC):
             HTTPRequestsFailed.
         """
         referer_header = {"Referer": url_referer} if url_referer is not None else {}
-        tries = 2
-        interval = 1
-        while True:
-            response = self.session.get(url_page, headers=referer_header)
-            if response.status_code != 200:
-                if tries == 0:
-                    raise self.HTTPRequestsFailed(
-                        f"Code {response.status_code}, {url_page}")
+        try:
+            response = self.RETRY_POLICY.request(
+                self.rate_limiter, url_page,
+                lambda: self.session.get(url_page, headers=referer_header, stream=stream))
+        except requests.exceptions.RequestException as error:
+            raise self.HTTPRequestsFailed(f"Request failed: {error}, {url_page}")\
+                from error
 
-                time.sleep(interval)
-                tries -= 1
-            else:
-                break
+        if response.status_code != 200:
+            response.close()
+            raise self.HTTPRequestsFailed(f"Code {response.status_code}, {url_page}",
+                                          response.status_code)
         return response
 
     @abc.abstractmethod
@@ -374,7 +800,7 @@ class SubmissionResolver(abc.ABC):
         Scrape URLs of media files.
 
         Args:
-            response (requests.Response): HTTP response with HTML page.
+            response (Page): HTML page or it's prefix.
 
         Returns:
             str: direct URL of submitted media file.
@@ -396,18 +822,27 @@ class GfycatResolver(SubmissionResolver):
         SubmissionResolver: abstract class.
 
     Overrides:
-        parse.
+        parse,
+        PAGE_END_MARKER: page is read up to end of first video element.
 
     Args:
         video_extensions (list or tuple of str): known extensions.
 
         http_headers (dict): basic HTTP headers.
+
+        cache (resolve_cache.ResolveCache): cache of resolutions.
+
+        rate_limiter (rate_limit.RateLimiter): shared limiter.
     """
 
+    PAGE_END_MARKER = b"</video>"
+
     def __init__(self,
                  video_extensions=("mp4", "webm"),
-                 http_headers=None):
-        super().__init__(video_extensions, http_headers)
+                 http_headers=None,
+                 cache=None,
+                 rate_limiter=None):
+        super().__init__(video_extensions, http_headers, cache, rate_limiter)
         self.session.headers.update({"Host": "gfycat.com"})
 
     def parse(self, response):
@@ -417,7 +852,7 @@ class GfycatResolver(SubmissionResolver):
         Accept domains thumbs.gfycat.com or zippy.gfycat.com.
 
         Args:
-            response (requests.Response): response containing gfycat page.
+            response (Page): gfycat page up to end of first video element.
 
         Returns:
             str: direct URL of video.
@@ -451,26 +886,35 @@ class ImgurResolver(SubmissionResolver):
         SubmissionResolver: abstract class.
 
     Overrides:
-        resolve,
-        parse.
+        prepare,
+        parse,
+        PAGE_END_MARKER: page is read up to end of head element.
 
     Args:
         media_extensions (list or tuple of str): known media extensions.
 
         http_headers (dict): basic HTTP headers.
 
+        cache (resolve_cache.ResolveCache): cache of resolutions.
+
+        rate_limiter (rate_limit.RateLimiter): shared limiter.
+
     Attributes:
         session (requests.Session).
     """
 
+    PAGE_END_MARKER = b"</head>"
+
     def __init__(self,
                  media_extensions=("mp4", "webm",
                                    "jpg", "jpeg", "png", "gif", "webp"),
-                 http_headers=None):
-        super().__init__(media_extensions, http_headers)
+                 http_headers=None,
+                 cache=None,
+                 rate_limiter=None):
+        super().__init__(media_extensions, http_headers, cache, rate_limiter)
         self.session.headers.update({"Host": "imgur.com"})
 
-    def resolve(self, submission):
+    def prepare(self, submission):
         """
         Do nothing if URL has filename with known media extension.
         Replace /gallery with /a in original indirect URL.
@@ -479,21 +923,24 @@ class ImgurResolver(SubmissionResolver):
         Args:
             submission (SubmissionRL): URLs related to submitted media.
 
+        Returns:
+            bool: True if imgur page has to be fetched.
+
         Raises:
-            MediaIsUnavailable: imgur is unavailable or no media file
-            with target media extension is found.
+            MediaIsUnavailable: media extension is unknown.
         """
         ext = os.path.splitext(submission.url)[1].lstrip(".")
         if ext:
             if ext not in self.target_media_extensions:
                 raise self.MediaIsUnavailable(f"Unknown media extension {ext}"
                                               f", {submission.url}")
-        else:
-            url_parts = urlparse(submission.url)
-            if url_parts.path.startswith("/gallery"):
-                url_parts.path.replace("gallery", "a", count=1)
-                submission.url = urlunparse(url_parts)
-            SubmissionResolver.resolve(self, submission)
+            return False
+
+        url_parts = urlparse(submission.url)
+        if url_parts.path.startswith("/gallery"):
+            url_parts.path.replace("gallery", "a", count=1)
+            submission.url = urlunparse(url_parts)
+        return True
 
     def parse(self, response):
         """
@@ -501,7 +948,7 @@ class ImgurResolver(SubmissionResolver):
         image if any.
 
         Args:
-            response (requests.Response): response containing imgur page.
+            response (Page): imgur page up to end of head element.
 
         Returns:
             str: direct URL of media.
@@ -536,33 +983,318 @@ class ImgurResolver(SubmissionResolver):
         return url_direct, url_extra
 
 
+MEDIA_SIGNATURES = (
+    (0, b"\xff\xd8\xff", "jpg"),
+    (0, b"\x89PNG\r\n\x1a\n", "png"),
+    (0, b"GIF87a", "gif"),
+    (0, b"GIF89a", "gif"),
+    (8, b"WEBP", "webp"),
+    (4, b"ftyp", "mp4"),
+    (0, b"\x1a\x45\xdf\xa3", "webm"),
+)
+"""Magic bytes of media files: offset, signature, extension"""
+
+MP4_BRANDS = (b"isom", b"iso2", b"iso3", b"iso4", b"iso5", b"iso6",
+              b"mp41", b"mp42", b"avc1", b"dash", b"M4V ")
+"""Brands of ISO base media files which are mp4 videos"""
+
+NON_MP4_BRANDS = (b"avif", b"avis", b"heic", b"heix", b"mif1", b"msf1", b"qt  ")
+"""Brands of ISO base media files which are images or QuickTime movies"""
+
+MEDIA_CONTENT_TYPES = {
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+    "image/png": "png",
+    "image/gif": "gif",
+    "image/webp": "webp",
+    "video/mp4": "mp4",
+    "video/webm": "webm",
+}
+"""MIME type to extension of media files"""
+
+
+def sniff_media_extension(head, content_type=None):
+    """
+    Determine type of media file by it's first bytes, Content-Type is
+    used if signature is unknown.
+
+    Args:
+        head (bytes): first bytes of file, 64 are enough.
+
+        content_type (str): Content-Type header value, may be None.
+
+    Returns:
+        str: extension of media file, None if file is not known media.
+    """
+    for offset, signature, extension in MEDIA_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            if extension == "webm" and b"webm" not in head:
+                # other Matroska file
+                return None
+            if extension == "mp4" and not is_mp4_file_type(head):
+                # AVIF or HEIF image, QuickTime movie
+                return None
+            return extension
+
+    return content_type_extension(content_type)
+
+
+def is_mp4_file_type(head):
+    """
+    Check brands of file type box of ISO base media file. Unknown major
+    brand is accepted if mp4 brand is among compatible ones.
+
+    Args:
+        head (bytes): first bytes of file starting with ftyp box.
+
+    Returns:
+        bool: True if file is mp4 video.
+    """
+    major_brand = head[8:12]
+    if major_brand in MP4_BRANDS:
+        return True
+    if major_brand in NON_MP4_BRANDS:
+        return False
+
+    box_size = int.from_bytes(head[:4], "big")
+    compatible_brands = head[16:box_size]
+    return any(compatible_brands[i:i + 4] in MP4_BRANDS
+               for i in range(0, len(compatible_brands) - 3, 4))
+
+
+def content_type_extension(content_type):
+    """
+    Args:
+        content_type (str): Content-Type header value, may be None.
+
+    Returns:
+        str: extension of media file of the type, None if type is not media.
+    """
+    if content_type is None:
+        return None
+    return MEDIA_CONTENT_TYPES.get(content_type.split(";")[0].strip().lower())
+
+
 class DirectURLResolver:
     """File extension checker
 
     Is intended for verification of direct URLs.
+    By default type of file is determined by extension specified in URL.
+    In probe mode first bytes of file are requested by ranged GET instead,
+    type is determined by magic bytes or Content-Type, file size is taken
+    from Content-Range or Content-Length. So extensionless URLs, e.g. of
+    i.redd.it, are accepted, mislabelled files and files exceeding max_size
+    are rejected before download. Probes are cached per URL.
 
     Attributes:
         target_media_extensions (list or tuple of str): known media extensions.
 
+        probe (bool): probe mode.
+
+        max_size (int): maximal size of media file in bytes, None if unlimited.
+
+        cache (resolve_cache.ResolveCache): cache of probes, may be None.
+
+        session (requests.Session): probe mode, HTTP session of probes.
+
+        rate_limiter (rate_limit.RateLimiter): probe mode, paces probes.
+
+        PROBE_SIZE (int): count of requested first bytes, 64.
+
+        PERMANENT_FAILURE_CODES (tuple of int): status codes of files
+        assumed to be gone, probe failures with these codes are cached.
+
+        RETRY_POLICY (retry.RetryPolicy): retries failed probes.
+
     Args:
         media_extensions (lits or tuple of str): file extensions without periods.
+
+        probe (bool): enable probe mode, False by default.
+
+        max_size (int): probe mode, maximal size of accepted file in bytes.
+
+        http_headers (dict): probe mode, basic HTTP headers.
+
+        cache (resolve_cache.ResolveCache): probe mode, cache of probes.
+
+        rate_limiter (rate_limit.RateLimiter): probe mode, shared limiter,
+        rate_limit.DEFAULT_LIMITER if not specified.
     """
 
+    PROBE_SIZE = 64
+    PERMANENT_FAILURE_CODES = SubmissionResolver.PERMANENT_FAILURE_CODES
+    RETRY_POLICY = DEFAULT_RETRY_POLICY
+
     def __init__(self,
                  media_extensions=("mp4", "webm",
-                                   "jpg", "jpeg", "png", "gif", "webp")
+                                   "jpg", "jpeg", "png", "gif", "webp"),
+                 probe=False,
+                 max_size=None,
+                 http_headers=None,
+                 cache=None,
+                 rate_limiter=None
                 ):
         self.target_media_extensions = media_extensions
+        self.probe = probe
+        self.max_size = max_size
+        self.cache = cache
+        self.session = None
+        self.rate_limiter = rate_limiter if rate_limiter is not None else DEFAULT_LIMITER
+        if probe:
+            self.session = requests.Session()
+            self.session.headers.update(http_headers if http_headers is not None
+                                        else BROWSER_HEADERS)
 
     def resolve(self, submission):
         """
         Check file extension specified in submitted URL.
         If extension is known do nothing.
+        In probe mode check type and size of file instead.
+
+        Returns:
+            str: extension of media file, may differ from one specified
+            in URL in probe mode.
+
+        Raises:
+            SubmissionResolver.MediaIsUnavailable: extension is unknown,
+            in probe mode file is not known media, too large or
+            probe failed.
+        """
+        if not self.probe:
+            ext = os.path.splitext(urlparse(submission.url).path)[1].lstrip(".")
+            if ext not in self.target_media_extensions:
+                raise SubmissionResolver.MediaIsUnavailable(
+                    f"Unknown file extension '{ext}' in {submission.url.split('?')[0]}")
+            return ext
+
+        probe = self.probe_cached(submission.url)
+        if probe is None:
+            probe = self.probe_url(submission.url, submission.url_referer)
+        return self.accept(submission.url, *probe)
+
+    def accept(self, url, extension, size):
+        """
+        Check probe of file.
+
+        Args:
+            url (str): direct URL.
+
+            extension (str): extension of probed file, may be None.
+
+            size (int): size of probed file, may be None.
+
+        Returns:
+            str: extension.
+
+        Raises:
+            SubmissionResolver.MediaIsUnavailable: file is not known media
+            or too large.
+        """
+        if extension not in self.target_media_extensions:
+            raise SubmissionResolver.MediaIsUnavailable(
+                f"Not a known media file {url.split('?')[0]}")
+
+        if self.max_size is not None and size is not None and size > self.max_size:
+            raise SubmissionResolver.MediaIsUnavailable(
+                f"File is too large, {size} bytes, {url.split('?')[0]}")
+
+        return extension
+
+    def probe_cached(self, url):
+        """
+        Returns:
+            tuple: (extension, size) of cached probe of URL, None if
+            there is none.
 
         Raises:
-            SubmissionResolver.MediaIsUnavailable: extension is unknown.
+            SubmissionResolver.MediaIsUnavailable: failure is cached.
         """
-        ext = os.path.splitext(urlparse(submission.url).path)[1].lstrip(".")
-        if ext not in self.target_media_extensions:
+        if self.cache is None:
+            return None
+
+        reason = self.cache.get_failure(url)
+        if reason is not None:
+            raise SubmissionResolver.MediaIsUnavailable(f"Cached failure: {reason}")
+
+        return self.cache.get_probe(url)
+
+    def probe_headers(self, url_referer=None):
+        """
+        Returns:
+            dict: headers of probe request.
+        """
+        headers = {"Range": f"bytes=0-{self.PROBE_SIZE - 1}",
+                   # byte range must refer to stored, not transfer-encoded, content
+                   "Accept-Encoding": "identity"}
+        if url_referer is not None:
+            headers["Referer"] = url_referer
+        return headers
+
+    def probe_url(self, url, url_referer=None):
+        """
+        Request first PROBE_SIZE bytes of file.
+
+        Args:
+            url (str): direct URL.
+
+            url_referer (str): HTTP referer, may be None.
+
+        Returns:
+            str: extension of media file, None if file is not known media.
+
+            int: file size, None if unknown.
+
+        Raises:
+            SubmissionResolver.MediaIsUnavailable: request failed.
+        """
+        headers = self.probe_headers(url_referer)
+        try:
+            response = self.RETRY_POLICY.request(
+                self.rate_limiter, url,
+                lambda: self.session.get(url, headers=headers, stream=True))
+            try:
+                head = b""
+                if response.status_code in (200, 206):
+                    for chunk in response.iter_content(self.PROBE_SIZE):
+                        head += chunk
+                        if len(head) >= self.PROBE_SIZE:
+                            break
+            finally:
+                response.close()
+        except requests.exceptions.RequestException as error:
             raise SubmissionResolver.MediaIsUnavailable(
-                f"Unknown file extension '{ext}' in {submission.url.split('?')[0]}")
+                f"Probe failed: {error}, {url}") from error
+
+        return self.apply_probe(url, response.status_code, response.headers, head)
+
+    def apply_probe(self, url, status_code, headers, head):
+        """
+        Determine type and size of file by probe response, cache them.
+        Permanent failure is cached.
+
+        Args:
+            url (str): direct URL.
+
+            status_code (int): status code of probe response.
+
+            headers (Mapping): headers of probe response.
+
+            head (bytes): first bytes of file.
+
+        Returns:
+            tuple: (extension, size), see probe_url.
+
+        Raises:
+            SubmissionResolver.MediaIsUnavailable: probe failed.
+        """
+        if status_code not in (200, 206):
+            reason = f"Code {status_code}, {url}"
+            if self.cache is not None and status_code in self.PERMANENT_FAILURE_CODES:
+                self.cache.put_failure(url, reason)
+            raise SubmissionResolver.MediaIsUnavailable(reason)
+
+        extension = sniff_media_extension(head, headers.get("Content-Type"))
+        size = DownloadFilter.file_size(status_code, headers)
+        if self.cache is not None:
+            self.cache.put_probe(url, extension, size)
+        return extension, size
@@ -0,0 +1,901 @@
+"""asyncio based crawl engine
+
+Async counterparts of requests based adapters: subreddit iterator, resolvers
+and downloader. All of them share one aiohttp session, so connections
+are pooled across crawls, and one per-host rate limiter, which may be
+shared with threaded adapters too, waits are done by async sleeps instead
+of blocking ones. Many subreddits may be crawled concurrently in one thread:
+
+    async with CrawlEngine() as engine:
+        async for submission in engine.resolved_submissions("pics"):
+            await engine.downloader("pics").download(submission)
+
+Parsing, resolve cache updates and writes of chunks are short and are done
+synchronously on the event loop. Media store updates, which move files
+and write it's manifest, are done by default executor.
+
+Requires aiohttp.
+"""
+
+import asyncio
+import collections
+import functools
+import hashlib
+import os
+from urllib.parse import urlparse
+
+import aiohttp
+try:
+    from aiohttp.compression_utils import HAS_BROTLI, HAS_ZSTD
+except ImportError:
+    HAS_BROTLI = HAS_ZSTD = False
+
+from download_filter import DownloadFilter
+from rate_limit import DEFAULT_LIMITER
+from submission import SubmissionRL
+from adapters import (
+    BROWSER_HEADERS,
+    Page,
+    SubredditIterator,
+    SubmissionResolver,
+    GfycatResolver,
+    ImgurResolver,
+    DirectURLResolver,
+    content_type_extension
+)
+
+REQUEST_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+ACCEPT_ENCODING = ", ".join(["gzip", "deflate"]
+                            + (["br"] if HAS_BROTLI else [])
+                            + (["zstd"] if HAS_ZSTD else []))
+"""Content codings aiohttp decodes: br and zstd only if their decoders are
+installed."""
+
+
+class AsyncSubredditIterator:
+    """Async old.reddit.com scraper
+
+    Async counterpart of SubredditIterator. Iterates over submissions of hot
+    section of given subreddit, implements async iterator interface.
+    Pages are parsed by SubredditIterator.parse, exceptions and state
+    format are the same.
+
+    Args:
+        session (aiohttp.ClientSession): shared HTTP session.
+
+        subreddit_name (str): name of subreddit to browse.
+
+        rate_limiter (rate_limit.RateLimiter): paces requests of listing pages.
+
+        state (dict): state saved by get_state or SubredditIterator.get_state
+        to continue iteration from.
+
+    Attributes:
+        session (aiohttp.ClientSession).
+
+        rate_limiter (rate_limit.RateLimiter).
+
+        subreddit_url (str), referer (str), after (str), count (int),
+        submissions (list), submission_idx (int): see SubredditIterator.
+    """
+
+    def __init__(self, session, subreddit_name, rate_limiter, state=None):
+        self.session = session
+        self.rate_limiter = rate_limiter
+        self.subreddit_url = SubredditIterator.REDDIT_URL + "/r/" + subreddit_name
+        self.referer = ""
+        self.after = ""
+        self.count = 0
+        self.submissions = []
+        self.submission_idx = 0
+        if state is not None:
+            self.subreddit_url = state["subreddit_url"]
+            self.referer = state["referer"]
+            self.after = state["after"]
+            self.count = state["count"]
+            self.submissions = [SubmissionRL.from_json(submission)
+                                for submission in state["submissions"]]
+
+    def get_state(self):
+        """
+        Returns:
+            dict: json serializable listing cursor and cached submissions
+            not yet iterated over.
+        """
+        return {
+            "subreddit_url": self.subreddit_url,
+            "referer": self.referer,
+            "after": self.after,
+            "count": self.count,
+            "submissions": [SubmissionRL.to_json(submission) for submission
+                            in self.submissions[self.submission_idx:]]
+        }
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """
+        Get next cached submission related URLs, load next page if needed.
+
+        Returns:
+            SubmissionRL.
+
+        Raises:
+            StopAsyncIteration: if NoSubmissionsAvailable is raised.
+        """
+        if self.submission_idx >= len(self.submissions):
+            try:
+                await self.load_submissions()
+            except SubredditIterator.NoSubmissionsAvailable as error:
+                raise StopAsyncIteration from error
+
+        submission = self.submissions[self.submission_idx]
+        self.submission_idx += 1
+        return submission
+
+    async def load_submissions(self):
+        """
+        Request and parse next page. Update submissions cache and internal
+        state accordingly.
+
+        Raises:
+            SubredditIterator.NoSubmissionsAvailable.
+        """
+        try:
+            page = await self.__request_next_page()
+            parsed_submissions, last_submission_id = SubredditIterator.parse(page)
+            if parsed_submissions is None:
+                raise SubredditIterator.NoSubmissionsOnPage(page.url)
+        except (SubredditIterator.HTTPRequestsFailed,
+                SubredditIterator.NoSubmissionsOnPage) as error:
+            raise SubredditIterator.NoSubmissionsAvailable from error
+
+        for submission in parsed_submissions:
+            submission.url_referer = page.url
+        self.submissions = parsed_submissions
+        self.submission_idx = 0
+        self.referer = page.url
+        self.after = last_submission_id
+        self.count += SubredditIterator.SUBMISSIONS_PER_PAGE
+
+    async def __request_next_page(self):
+        """
+        Do series of requests of next subreddit page, pass age verification
+        if asked.
+
+        Returns:
+            Page: next subreddit page.
+
+        Raises:
+            SubredditIterator.HTTPRequestsFailed.
+        """
+        url = self.subreddit_url
+        if self.count != 0:
+            url += f"/?count={self.count}&after={self.after}"
+        referer_header = {"Referer": self.referer} if self.referer else {}
+        retry_policy = SubredditIterator.RETRY_POLICY
+        try:
+            response = await retry_policy.request_async(
+                self.rate_limiter, url,
+                lambda: self.session.get(url, headers=referer_header), REQUEST_ERRORS)
+            async with response:
+                if response.status != 200:
+                    raise SubredditIterator.HTTPRequestsFailed(f"Code {response.status}"
+                                                               f", {response.url}")
+                page = Page(url=str(response.url), content=await response.read())
+
+            if os.path.basename(urlparse(page.url).path) == "over18":
+                response = await retry_policy.request_async(
+                    self.rate_limiter, page.url,
+                    lambda: self.session.post(
+                        page.url,
+                        headers={
+                            "Origin": SubredditIterator.REDDIT_URL,
+                            "Referer": SubredditIterator.REDDIT_URL
+                        },
+                        params={"dest": url},
+                        data={"over18": "yes"}
+                    ),
+                    REQUEST_ERRORS
+                )
+                async with response:
+                    if response.status != 200:
+                        raise SubredditIterator.HTTPRequestsFailed(
+                            f"Age verification step, code {response.status}"
+                            f", {response.url}")
+                    page = Page(url=str(response.url), content=await response.read())
+        except REQUEST_ERRORS as error:
+            raise SubredditIterator.HTTPRequestsFailed(f"Request failed: {error}, {url}")\
+                from error
+
+        SubredditIterator.TRANSFER_COUNTER.add_async_response(response, len(page.content))
+        return page
+
+
+class AsyncSubmissionResolver:
+    """Async wrapper of SubmissionResolver
+
+    Page of submitted URL is fetched with aiohttp, everything else:
+    preliminary checks, cache, parsing, is delegated to wrapped resolver.
+    Requests are paced by rate limiter of wrapped resolver.
+
+    Args:
+        resolver (SubmissionResolver): e.g. ImgurResolver.
+
+        session (aiohttp.ClientSession): shared HTTP session.
+
+    Attributes:
+        resolver (SubmissionResolver).
+
+        session (aiohttp.ClientSession).
+    """
+
+    def __init__(self, resolver, session):
+        self.resolver = resolver
+        self.session = session
+
+    async def resolve(self, submission):
+        """
+        See SubmissionResolver.resolve. Cached resolutions are taken
+        without waiting.
+
+        Args:
+            submission (SubmissionRL).
+
+        Raises:
+            SubmissionResolver.MediaIsUnavailable.
+        """
+        if not self.resolver.prepare(submission) or self.resolver.resolve_cached(submission):
+            return
+
+        try:
+            page = await self.fetch_page(submission.url, submission.url_referer)
+        except SubmissionResolver.HTTPRequestsFailed as error:
+            self.resolver.cache_failure(submission.url, error)
+            raise SubmissionResolver.MediaIsUnavailable from error
+
+        self.resolver.apply_page(submission, page)
+
+    async def fetch_page(self, url_page, url_referer=None):
+        """
+        Request page and read it up to PAGE_END_MARKER of resolver
+        if specified, read whole page otherwise. Request is retried
+        according to RETRY_POLICY of resolver.
+
+        Args:
+            url_page (str).
+
+            url_referer (str): HTTP referer, may be None.
+
+        Returns:
+            Page: fetched page or it's prefix ending with the marker.
+
+        Raises:
+            SubmissionResolver.HTTPRequestsFailed.
+        """
+        referer_header = {"Referer": url_referer} if url_referer is not None else {}
+        try:
+            response = await self.resolver.RETRY_POLICY.request_async(
+                self.resolver.rate_limiter, url_page,
+                lambda: self.session.get(url_page, headers=referer_header), REQUEST_ERRORS)
+            async with response:
+                if response.status != 200:
+                    raise SubmissionResolver.HTTPRequestsFailed(
+                        f"Code {response.status}, {url_page}", response.status)
+
+                content = await self.__read_page(response)
+                self.resolver.TRANSFER_COUNTER.add_async_response(response, len(content))
+                return Page(url=str(response.url), content=content)
+        except REQUEST_ERRORS as error:
+            raise SubmissionResolver.HTTPRequestsFailed(
+                f"Request failed: {error}, {url_page}") from error
+
+    async def __read_page(self, response):
+        """
+        Returns:
+            bytes: content of response up to PAGE_END_MARKER. Unread rest
+            is dropped with connection on response release.
+        """
+        marker = self.resolver.PAGE_END_MARKER
+        if marker is None:
+            return await response.read()
+
+        content = bytearray()
+        async for chunk in response.content.iter_chunked(self.resolver.PAGE_CHUNK_SIZE):
+            search_start = max(0, len(content) - len(marker) + 1)
+            content += chunk
+            if content[search_start:].lower().find(marker) != -1:
+                break
+        return bytes(content)
+
+
+class AsyncSubmissionIterator:
+    """Async counterpart of dump.SubmissionIterator
+
+    Iterates over resolved submissions of given subreddit. A window
+    of submissions is resolved concurrently as tasks, results are returned
+    in listing order.
+
+    Args:
+        engine (CrawlEngine): provides session, rate limiter and resolvers.
+
+        subreddit_name (str).
+
+        state (dict): state saved by get_state to continue iteration from.
+
+    Attributes:
+        subreddit_iterator (AsyncSubredditIterator).
+
+        resolve_window (collections.deque): pairs of submission as taken
+        from listing and task resolving it.
+
+        restored_submissions (collections.deque): submissions taken from
+        listing but not returned before state was saved.
+
+        submissions_requested (int): total count of observed submissions.
+
+        stop_error (StopAsyncIteration): cause of end of submissions.
+    """
+
+    def __init__(self, engine, subreddit_name, state=None):
+        self.engine = engine
+        self.subreddit_iterator = AsyncSubredditIterator(
+            engine.session, subreddit_name, engine.rate_limiter,
+            state=state["listing"] if state is not None else None)
+        self.resolve_window = collections.deque()
+        self.restored_submissions = collections.deque()
+        self.submissions_requested = 0
+        if state is not None:
+            self.submissions_requested = state["submissions_requested"]
+            self.restored_submissions.extend(SubmissionRL.from_json(submission)
+                                             for submission in state["pending"])
+        self.stop_error = None
+
+    def get_state(self):
+        """
+        Returns:
+            dict: json serializable state, compatible with state of
+            dump.SubmissionIterator.
+        """
+        pending = [SubmissionRL.to_json(submission) for submission, _
+                   in self.resolve_window]
+        pending.extend(SubmissionRL.to_json(submission) for submission
+                       in self.restored_submissions)
+        return {
+            "listing": self.subreddit_iterator.get_state(),
+            "submissions_requested": self.submissions_requested,
+            "pending": pending
+        }
+
+    def close(self):
+        """Cancel scheduled resolve tasks."""
+        for _, task in self.resolve_window:
+            task.cancel()
+        self.resolve_window.clear()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """
+        Fill resolve window and wait for its first submission.
+
+        Returns:
+            SubmissionRL: resolved submission.
+
+        Raises:
+            StopAsyncIteration: no more submissions available.
+
+            SubmissionResolver.MediaIsUnavailable: submission is not resolved,
+            iteration may be continued.
+        """
+        while (self.stop_error is None
+               and len(self.resolve_window) < self.engine.RESOLVE_WINDOW):
+            if self.restored_submissions:
+                submission = self.restored_submissions.popleft()
+            else:
+                try:
+                    submission = await self.subreddit_iterator.__anext__()
+                except StopAsyncIteration as error:
+                    self.stop_error = error
+                    break
+                self.submissions_requested += 1
+            origin = SubmissionRL(url=submission.url, url_referer=submission.url_referer)
+            self.resolve_window.append(
+                (origin, asyncio.ensure_future(self.engine.resolve(submission))))
+
+        if not self.resolve_window:
+            raise StopAsyncIteration from self.stop_error
+
+        return await self.resolve_window.popleft()[1]
+
+
+class AsyncSubmissionDownloader:
+    """Async counterpart of dump.SubmissionDownloader
+
+    Streams media file into partial download file and renames it to
+    the name specified in response URL, _copy is appended on collision.
+    Partial downloads are not resumed. If media store is given files are
+    hashed while streamed, moved into the store and linked instead.
+    Files removed by near-duplicate detector are handled like
+    dump.SubmissionDownloader does.
+    Responses rejected by download filter are closed before content is
+    streamed, see dump.SubmissionDownloader.
+
+    Args:
+        engine (CrawlEngine): provides session and rate limiter.
+
+        outdir_path (str): directory of downloaded files, created if needed.
+
+        media_store (media_store.MediaStore): content-addressed store,
+        None to save files into output directory.
+
+        duplicate_detector (near_duplicates.NearDuplicateDetector):
+        stage receiving saved files, may be None.
+
+        download_filter (download_filter.DownloadFilter): filter of
+        downloaded files, None to save all.
+
+    Attributes:
+        outdir_path (str).
+
+        media_store (media_store.MediaStore).
+
+        duplicate_detector (near_duplicates.NearDuplicateDetector).
+
+        download_filter (download_filter.DownloadFilter).
+
+        CHUNK_SIZE (int): size of chunks of streamed file, 64KiB.
+
+        active_parts (set): paths of partial downloads being written.
+
+        skipped_urls (collections.deque): URLs of files removed by
+        near-duplicate detector, see take_skipped.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, engine, outdir_path, media_store=None, duplicate_detector=None,
+                 download_filter=None):
+        self.engine = engine
+        self.outdir_path = outdir_path
+        self.media_store = media_store
+        self.duplicate_detector = duplicate_detector
+        self.download_filter = download_filter
+        self.active_parts = set()
+        self.skipped_urls = collections.deque()
+        if not os.path.exists(outdir_path):
+            os.makedirs(outdir_path)
+
+    async def download(self, submission):
+        """
+        Download submitted media file or extra one if it's request failed.
+        Count of simultaneous downloads from a domain is limited by engine.
+
+        Args:
+            submission (SubmissionRL).
+
+        Returns:
+            bool: True if file is saved, False otherwise.
+
+        Raises:
+            DownloadFilter.MediaIsFiltered: files are rejected by filter
+            or were skipped as near-duplicates.
+        """
+        referer_header = ({"Referer": submission.url_referer}
+                          if submission.url_referer is not None else {})
+        filtered = None
+        try:
+            saved = await self.__download_url(submission.url, referer_header)
+        except DownloadFilter.MediaIsFiltered as error:
+            saved, filtered = None, error
+        if saved is None and submission.url_extra is not None:
+            if filtered is not None:
+                print(filtered)
+            print(f"Try download extra {submission.url_extra}")
+            saved = await self.__download_url(submission.url_extra, referer_header)
+        elif filtered is not None:
+            raise filtered
+        return bool(saved)
+
+    async def __download_url(self, url, referer_header):
+        """
+        Returns:
+            bool: True if saved successfully, False otherwise.
+
+            None: request failed.
+
+        Raises:
+            DownloadFilter.MediaIsFiltered.
+        """
+        if self.media_store is not None:
+            blob_path, name = self.media_store.lookup(url)
+            if self.media_store.is_skipped(url) or (
+                    blob_path is not None and self.duplicate_detector is not None
+                    and self.duplicate_detector.is_skipped(
+                        os.path.join(self.outdir_path, name))):
+                raise DownloadFilter.MediaIsFiltered(f"Skipped near-duplicate {url}")
+            if blob_path is not None:
+                print(f"Already stored {url}")
+                try:
+                    if self.download_filter is not None:
+                        await asyncio.get_running_loop().run_in_executor(
+                            None, self.download_filter.check_file, url, blob_path)
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self.media_store.link, blob_path,
+                        os.path.join(self.outdir_path, name))
+                except OSError as error:
+                    print(f"Failed to link {name}: {error}")
+                    return False
+                return True
+
+        url_hash = hashlib.sha1(url.encode()).hexdigest()[:10]
+        part_path = os.path.join(self.outdir_path,
+                                 f"{os.path.basename(urlparse(url).path)}.{url_hash}.part")
+        if part_path in self.active_parts:
+            print(f"Already downloading {url}")
+            return False
+
+        self.active_parts.add(part_path)
+        try:
+            async with self.engine.domain_slots(urlparse(url).netloc):
+                await self.engine.rate_limiter.acquire_async(url)
+                async with self.engine.session.get(url, headers=referer_header) as response:
+                    if response.status != 200:
+                        print(f"Fail, code: {response.status}, {response.url}")
+                        return None
+
+                    try:
+                        head = await self.__check(response, url)
+                    except DownloadFilter.MediaIsFiltered:
+                        # connection is dropped with unread content
+                        response.close()
+                        raise
+
+                    return await self.__save_content(response, url, part_path, head)
+        except REQUEST_ERRORS as error:
+            print(f"Fail {url}: {error}")
+            return None
+        finally:
+            self.active_parts.discard(part_path)
+
+    async def __check(self, response, url):
+        """
+        Check response by download filter, read first bytes of content
+        if filter needs them.
+
+        Returns:
+            bytes: read first bytes of content, may be empty.
+
+        Raises:
+            DownloadFilter.MediaIsFiltered.
+        """
+        head = b""
+        if self.download_filter is None:
+            return head
+
+        self.download_filter.check_headers(url, response.status, response.headers)
+        if self.download_filter.needs_head(response.headers):
+            while len(head) < self.download_filter.HEAD_SIZE:
+                chunk = await response.content.read(self.download_filter.HEAD_SIZE
+                                                    - len(head))
+                if not chunk:
+                    break
+                head += chunk
+            self.download_filter.check_head(url, head)
+        return head
+
+    async def __save_content(self, response, url, part_path, head=b""):
+        """
+        Args:
+            head (bytes): first bytes of content already read.
+
+        Returns:
+            bool: True if saved successfully, False otherwise.
+        """
+        outfile_path = os.path.join(self.outdir_path,
+                                    os.path.basename(urlparse(str(response.url)).path))
+        if not os.path.splitext(outfile_path)[1]:
+            # extensionless URL accepted by probe
+            extension = content_type_extension(response.headers.get("Content-Type"))
+            if extension is not None:
+                outfile_path += "." + extension
+        digest = hashlib.sha256() if self.media_store is not None else None
+        try:
+            with open(part_path, "wb") as outf:
+                outf.write(head)
+                if digest is not None:
+                    digest.update(head)
+                async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+                    outf.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+            if digest is not None:
+                outfile_path = await asyncio.get_running_loop().run_in_executor(
+                    None, self.__store, url, part_path, digest.hexdigest(), outfile_path)
+            else:
+                if os.path.exists(outfile_path):
+                    root, ext = os.path.splitext(outfile_path)
+                    outfile_path = root + "_copy" + ext
+                os.replace(part_path, outfile_path)
+            if self.duplicate_detector is not None:
+                self.duplicate_detector.submit(outfile_path,
+                                               functools.partial(self.__on_skipped, url))
+        except REQUEST_ERRORS as error:
+            print(f"Interrupted {url}: {error}")
+            self.__remove_part(part_path)
+            return False
+        except OSError as error:
+            print(f"Failed to save {outfile_path}: {error}")
+            self.__remove_part(part_path)
+            return False
+
+        return True
+
+    def take_skipped(self):
+        """
+        Returns:
+            list of str: URLs of saved files removed by near-duplicate
+            detector since previous call.
+        """
+        skipped = []
+        while self.skipped_urls:
+            skipped.append(self.skipped_urls.popleft())
+        return skipped
+
+    def __on_skipped(self, url, path, original):
+        """
+        Record URL of file removed by near-duplicate detector in media store
+        and for take_skipped. Is called by executor thread of detector.
+        """
+        if self.media_store is not None:
+            self.media_store.mark_skipped(url)
+        self.skipped_urls.append(url)
+
+    def __store(self, url, part_path, digest, outfile_path):
+        """
+        Executed by default executor. Move completed download into media
+        store and link it to output path.
+
+        Returns:
+            str: output path.
+        """
+        blob_path = self.media_store.add(url, part_path, digest,
+                                         os.path.basename(outfile_path))
+        return self.media_store.link(blob_path, outfile_path)
+
+    @staticmethod
+    def __remove_part(part_path):
+        try:
+            os.remove(part_path)
+        except FileNotFoundError:
+            pass
+
+
+class CrawlEngine:
+    """Shared state of concurrent crawls
+
+    Owns aiohttp session with connection pool and resolvers shared by
+    all crawls, requests of all crawls are paced by one rate limiter. Is used as async context manager,
+    session is created on enter and closed on exit.
+
+    Args:
+        image_extensions (tuple or list of str): target extensions of submitted
+        images.
+
+        video_extensions (tuple or list of str): target extensions of submitted
+        video files.
+
+        resolve_cache (resolve_cache.ResolveCache): cache of resolutions shared
+        by resolvers, None to resolve without cache.
+
+        connection_limit (int): total count of pooled connections.
+
+        connection_limit_per_host (int): count of pooled connections per host.
+
+        rate_limiter (rate_limit.RateLimiter): shared limiter,
+        rate_limit.DEFAULT_LIMITER if not specified.
+
+        probe (bool): check direct URLs by probe requests, see
+        DirectURLResolver.
+
+    Attributes:
+        session (aiohttp.ClientSession): None outside of context.
+
+        rate_limiter (rate_limit.RateLimiter).
+
+        resolvers (dict): domain to AsyncSubmissionResolver.
+
+        direct_url_resolver (DirectURLResolver).
+
+        RESOLVE_WINDOW (int): maximal count of submissions resolved ahead
+        by each crawl, 8.
+
+        MAX_DOMAIN_DOWNLOADS (int): maximal count of simultaneous downloads
+        from a domain over all crawls, 2.
+
+        download_semaphores (dict): domain to asyncio.Semaphore.
+    """
+
+    RESOLVE_WINDOW = 8
+    MAX_DOMAIN_DOWNLOADS = 2
+
+    def __init__(self,
+                 image_extensions=("jpg", "jpeg", "png", "webp", "gif"),
+                 video_extensions=("mp4", "webm"),
+                 resolve_cache=None,
+                 connection_limit=100,
+                 connection_limit_per_host=8,
+                 rate_limiter=None,
+                 probe=False):
+        self.image_extensions = tuple(image_extensions)
+        self.video_extensions = tuple(video_extensions)
+        self.resolve_cache = resolve_cache
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.session = None
+        self.rate_limiter = rate_limiter if rate_limiter is not None else DEFAULT_LIMITER
+        self.resolvers = {}
+        self.direct_url_resolver = DirectURLResolver(
+            self.image_extensions + self.video_extensions, probe=probe,
+            cache=resolve_cache, rate_limiter=self.rate_limiter)
+        self.download_semaphores = {}
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connection_limit,
+                                           limit_per_host=self.connection_limit_per_host),
+            headers={**BROWSER_HEADERS, "Accept-Encoding": ACCEPT_ENCODING},
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+        )
+        self.resolvers = {
+            "imgur.com": AsyncSubmissionResolver(
+                ImgurResolver(self.image_extensions + self.video_extensions,
+                              cache=self.resolve_cache, rate_limiter=self.rate_limiter),
+                self.session),
+            "gfycat.com": AsyncSubmissionResolver(
+                GfycatResolver(self.video_extensions, cache=self.resolve_cache,
+                               rate_limiter=self.rate_limiter),
+                self.session)
+        }
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.session.close()
+        self.session = None
+
+    def submissions(self, subreddit_name, state=None):
+        """
+        Args:
+            subreddit_name (str).
+
+            state (dict): state saved by AsyncSubmissionIterator.get_state.
+
+        Returns:
+            AsyncSubmissionIterator: resolved submissions of subreddit.
+        """
+        return AsyncSubmissionIterator(self, subreddit_name, state)
+
+    async def resolved_submissions(self, subreddit_name, count=None):
+        """
+        Async generator of resolved submissions of subreddit,
+        unresolved ones are reported and skipped.
+
+        Args:
+            subreddit_name (str).
+
+            count (int): maximal count of yielded submissions, unlimited
+            if None.
+
+        Yields:
+            SubmissionRL.
+        """
+        submission_iterator = self.submissions(subreddit_name)
+        try:
+            while count is None or count > 0:
+                try:
+                    submission = await submission_iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                except SubmissionResolver.MediaIsUnavailable as error:
+                    print(error)
+                    continue
+
+                yield submission
+                if count is not None:
+                    count -= 1
+        finally:
+            submission_iterator.close()
+
+    def downloader(self, outdir_path, media_store=None, duplicate_detector=None,
+                   download_filter=None):
+        """
+        Args:
+            outdir_path (str).
+
+            media_store (media_store.MediaStore): content-addressed store,
+            may be None.
+
+            duplicate_detector (near_duplicates.NearDuplicateDetector):
+            may be None.
+
+            download_filter (download_filter.DownloadFilter): may be None.
+
+        Returns:
+            AsyncSubmissionDownloader: downloader into given directory.
+        """
+        return AsyncSubmissionDownloader(self, outdir_path, media_store,
+                                         duplicate_detector, download_filter)
+
+    async def resolve(self, submission):
+        """
+        Replace submitted URLs with direct URLs by resolver of submitted
+        URL domain.
+
+        Args:
+            submission (SubmissionRL).
+
+        Returns:
+            SubmissionRL: resolved submission.
+
+        Raises:
+            SubmissionResolver.MediaIsUnavailable.
+        """
+        resolver = self.resolvers.get(urlparse(submission.url).netloc)
+        if resolver is not None:
+            await resolver.resolve(submission)
+        elif self.direct_url_resolver.probe:
+            await self.probe(submission)
+        else:
+            self.direct_url_resolver.resolve(submission)
+        return submission
+
+    async def probe(self, submission):
+        """
+        Async counterpart of DirectURLResolver.resolve in probe mode,
+        cached probe is taken without waiting.
+
+        Args:
+            submission (SubmissionRL).
+
+        Returns:
+            str: extension of media file.
+
+        Raises:
+            SubmissionResolver.MediaIsUnavailable.
+        """
+        resolver = self.direct_url_resolver
+        url = submission.url
+        probe = resolver.probe_cached(url)
+        if probe is None:
+            headers = resolver.probe_headers(submission.url_referer)
+            try:
+                response = await resolver.RETRY_POLICY.request_async(
+                    resolver.rate_limiter, url,
+                    lambda: self.session.get(url, headers=headers), REQUEST_ERRORS)
+                async with response:
+                    head = b""
+                    while response.status in (200, 206) and len(head) < resolver.PROBE_SIZE:
+                        chunk = await response.content.read(resolver.PROBE_SIZE - len(head))
+                        if not chunk:
+                            break
+                        head += chunk
+            except REQUEST_ERRORS as error:
+                raise SubmissionResolver.MediaIsUnavailable(
+                    f"Probe failed: {error}, {url}") from error
+
+            probe = resolver.apply_probe(url, response.status, response.headers, head)
+        return resolver.accept(url, *probe)
+
+    def domain_slots(self, domain):
+        """
+        Returns:
+            asyncio.Semaphore: limits simultaneous downloads from domain.
+        """
+        semaphore = self.download_semaphores.get(domain)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.MAX_DOMAIN_DOWNLOADS)
+            self.download_semaphores[domain] = semaphore
+        return semaphore
@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+
+"""Micro-benchmark of subreddit listing page parsers
+
+Compares SubredditIterator.parse_streaming and SubredditIterator.parse_soup
+on saved old.reddit.com listing pages, e.g. obtained by
+    curl -o pics.html https://old.reddit.com/r/pics/
+"""
+
+import argparse
+import timeit
+
+from adapters import SubredditIterator
+
+
+class SavedPage:
+    """Minimal stand-in for requests.Response used by parsers
+
+    Args:
+        path (str): path to saved listing page.
+
+    Attributes:
+        url (str): file path.
+
+        content (bytes): page content.
+    """
+
+    def __init__(self, path):
+        self.url = path
+        with open(path, "rb") as inf:
+            self.content = inf.read()
+
+
+def bench_page(page, number):
+    """
+    Time both parsers on given page and check they agree.
+
+    Args:
+        page (SavedPage).
+
+        number (int): parse repetitions per parser.
+    """
+    streaming_result = SubredditIterator.parse_streaming(page)
+    soup_result = SubredditIterator.parse_soup(page)
+    streaming_urls = [s.url for s in streaming_result[0] or ()]
+    soup_urls = [s.url for s in soup_result[0] or ()]
+    agree = (streaming_urls == soup_urls
+             and streaming_result[1] == soup_result[1])
+
+    streaming_time = timeit.timeit(lambda: SubredditIterator.parse_streaming(page),
+                                   number=number) / number
+    soup_time = timeit.timeit(lambda: SubredditIterator.parse_soup(page),
+                              number=number) / number
+    print(f"{page.url}: {len(page.content)} bytes, {len(soup_urls)} submissions",
+          f"{'' if agree else ', RESULTS DIFFER'}")
+    print(f"  streaming: {streaming_time * 1000:.2f} ms",
+          f"soup: {soup_time * 1000:.2f} ms",
+          f"speedup: x{soup_time / streaming_time:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark listing page parsers.")
+    parser.add_argument('pages', nargs='+', help="Saved listing pages.")
+    parser.add_argument('-n', dest='number', type=int, default=20,
+                        help="Parse repetitions per parser, 20 by default.")
+    args = parser.parse_args()
+    for path in args.pages:
+        bench_page(SavedPage(path), args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""Filtering of downloaded media files by response headers and first bytes"""
+
+import mimetypes
+import os
+import struct
+
+MP4_CONTAINER_BOXES = (b"moov",)
+MP4_MOVIE_HEADER_BOX = b"mvhd"
+
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+EBML_SEGMENT = 0x18538067
+EBML_INFO = 0x1549A966
+EBML_TIMECODE_SCALE = 0x2AD7B1
+EBML_DURATION = 0x4489
+EBML_CLUSTER = 0x1F43B675
+
+
+def mp4_duration(head):
+    """
+    Read duration from movie header box of MP4 file. The box is reachable
+    only if moov box precedes media data, i.e. file is prepared for streaming.
+
+    Args:
+        head (bytes): first bytes of file.
+
+    Returns:
+        float: duration in seconds, None if it isn't found in head.
+    """
+    offset = 0
+    end = len(head)
+    try:
+        while offset + 8 <= end:
+            size, box_type = struct.unpack_from(">I4s", head, offset)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack_from(">Q", head, offset + 8)[0]
+                header_size = 16
+            elif size == 0:
+                # box extends to end of file
+                size = len(head) - offset
+            if size < header_size:
+                return None
+
+            if box_type in MP4_CONTAINER_BOXES:
+                end = min(end, offset + size)
+                offset += header_size
+                continue
+
+            if box_type == MP4_MOVIE_HEADER_BOX:
+                data_offset = offset + header_size
+                if head[data_offset] == 1:
+                    timescale, duration = struct.unpack_from(">IQ", head, data_offset + 20)
+                else:
+                    timescale, duration = struct.unpack_from(">II", head, data_offset + 12)
+                return duration / timescale if timescale else None
+
+            offset += size
+    except (IndexError, struct.error):
+        pass
+    return None
+
+
+def read_ebml_vint(data, offset, keep_marker=False):
+    """
+    Read EBML variable size integer: element ID or element data size.
+
+    Args:
+        data (bytes).
+
+        offset (int): offset of integer.
+
+        keep_marker (bool): keep length marker bit, as it's done for IDs.
+
+    Returns:
+        int: value, None if it is reserved value of unknown size.
+
+        int: offset after integer.
+
+    Raises:
+        ValueError: invalid integer.
+
+        IndexError: data ends before integer.
+    """
+    first = data[offset]
+    if first == 0:
+        raise ValueError("Invalid EBML integer")
+
+    length = 9 - first.bit_length()
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[offset + 1:offset + length]:
+        value = (value << 8) | byte
+    if offset + length > len(data):
+        raise IndexError("EBML integer is truncated")
+
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        value = None
+    return value, offset + length
+
+
+def webm_duration(head):
+    """
+    Read duration from segment info of WebM (Matroska) file, it precedes
+    clusters of media data.
+
+    Args:
+        head (bytes): first bytes of file.
+
+    Returns:
+        float: duration in seconds, None if it isn't found in head.
+    """
+    offset = 0
+    timecode_scale = 1000000
+    duration = None
+    info_end = None
+    try:
+        while offset < len(head) and (info_end is None or offset < info_end):
+            element_id, offset = read_ebml_vint(head, offset, keep_marker=True)
+            size, offset = read_ebml_vint(head, offset)
+            if element_id == EBML_SEGMENT:
+                continue
+
+            if element_id == EBML_INFO:
+                if size is None:
+                    return None
+                info_end = offset + size
+                continue
+
+            if element_id == EBML_CLUSTER or size is None:
+                break
+
+            data = head[offset:offset + size]
+            if element_id == EBML_TIMECODE_SCALE:
+                timecode_scale = int.from_bytes(data, "big")
+            elif element_id == EBML_DURATION:
+                duration = struct.unpack(">f" if size == 4 else ">d", data)[0]
+            offset += size
+    except (IndexError, ValueError, struct.error):
+        pass
+    if duration is None:
+        return None
+    return duration * timecode_scale / 1e9
+
+
+def media_duration(head):
+    """
+    Args:
+        head (bytes): first bytes of media file.
+
+    Returns:
+        float: duration in seconds of MP4 or WebM file, None if it is unknown.
+    """
+    if head[4:8] == b"ftyp":
+        return mp4_duration(head)
+    if head.startswith(EBML_MAGIC):
+        return webm_duration(head)
+    return None
+
+
+class DownloadFilter:
+    """Filter of downloaded media files
+
+    Response of media request is checked before it's content is streamed:
+    file size by Content-Length or Content-Range, MIME type by Content-Type.
+    Duration of video is read from it's first HEAD_SIZE bytes if container
+    keeps it there, see media_duration. Rejected response is expected to be
+    closed at once, so rest of file is not transferred.
+    Unknown size, type or duration don't reject file.
+    Files which are already saved, e.g. in media store, are checked
+    by check_file.
+
+    Args:
+        min_size (int): minimal file size in bytes, None if unlimited.
+
+        max_size (int): maximal file size in bytes, None if unlimited.
+
+        mime_types (list of str): allowed MIME types, e.g. "image/jpeg",
+        or groups of them, e.g. "video/*". None to allow any.
+
+        max_duration (float): maximal video duration in seconds, None if
+        unlimited.
+
+    Class attributes:
+        class MediaIsFiltered (Exception): raised if file is rejected.
+
+        HEAD_SIZE (int): count of first bytes searched for duration, 64KiB.
+
+    Attributes:
+        min_size (int).
+
+        max_size (int).
+
+        mime_types (set of str).
+
+        max_duration (float).
+    """
+
+    class MediaIsFiltered(Exception):
+        """File is rejected by filter"""
+
+    HEAD_SIZE = 64 * 1024
+
+    def __init__(self, min_size=None, max_size=None, mime_types=None, max_duration=None):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.mime_types = ({mime_type.lower() for mime_type in mime_types}
+                           if mime_types is not None else None)
+        self.max_duration = max_duration
+
+    @staticmethod
+    def file_size(status_code, headers):
+        """
+        Returns:
+            int: size of whole file from Content-Range of partial response
+            or Content-Length of full one, None if unknown.
+        """
+        try:
+            if status_code == 206:
+                total = headers["Content-Range"].rsplit("/", maxsplit=1)[1]
+                return int(total) if total != "*" else None
+            return int(headers["Content-Length"])
+        except (KeyError, IndexError, ValueError):
+            return None
+
+    @staticmethod
+    def mime_type(headers):
+        """
+        Returns:
+            str: lowercase MIME type of Content-Type, None if it is missing.
+        """
+        content_type = headers.get("Content-Type")
+        if not content_type:
+            return None
+        return content_type.split(";")[0].strip().lower()
+
+    def check_headers(self, url, status_code, headers):
+        """
+        Check size and type of file before content is read.
+
+        Args:
+            url (str): requested URL.
+
+            status_code (int): 200 or 206.
+
+            headers (Mapping): response headers.
+
+        Raises:
+            MediaIsFiltered.
+        """
+        size = self.file_size(status_code, headers)
+        if size is not None:
+            if self.max_size is not None and size > self.max_size:
+                raise self.MediaIsFiltered(f"Filtered: {size} bytes > {self.max_size}, {url}")
+            if self.min_size is not None and size < self.min_size:
+                raise self.MediaIsFiltered(f"Filtered: {size} bytes < {self.min_size}, {url}")
+
+        mime_type = self.mime_type(headers)
+        if self.mime_types is not None and mime_type is not None:
+            if (mime_type not in self.mime_types
+                    and mime_type.split("/")[0] + "/*" not in self.mime_types):
+                raise self.MediaIsFiltered(f"Filtered: type {mime_type}, {url}")
+
+    def needs_head(self, headers):
+        """
+        Returns:
+            bool: True if first bytes of content have to be checked
+            by check_head, i.e. duration is limited and file may be video.
+        """
+        if self.max_duration is None:
+            return False
+
+        mime_type = self.mime_type(headers)
+        return mime_type is None or not mime_type.startswith(("image/", "text/"))
+
+    def check_head(self, url, head):
+        """
+        Check duration of video by first bytes of content.
+
+        Args:
+            url (str): requested URL.
+
+            head (bytes): first HEAD_SIZE bytes of file or whole shorter file.
+
+        Raises:
+            MediaIsFiltered.
+        """
+        duration = media_duration(head)
+        if duration is not None and duration > self.max_duration:
+            raise self.MediaIsFiltered(
+                f"Filtered: {duration:.0f}s > {self.max_duration:g}s, {url}")
+
+    def check_file(self, url, path):
+        """
+        Check saved file like response of it's URL: size is taken from
+        file system, MIME type is guessed by file extension, duration is
+        read from first bytes.
+
+        Args:
+            url (str): URL of file.
+
+            path (str): path of saved file.
+
+        Raises:
+            MediaIsFiltered.
+
+            OSError: file can't be read.
+        """
+        headers = {"Content-Length": str(os.path.getsize(path))}
+        mime_type = mimetypes.guess_type(path)[0]
+        if mime_type is not None:
+            headers["Content-Type"] = mime_type
+        self.check_headers(url, 200, headers)
+        if self.needs_head(headers):
+            with open(path, "rb") as inf:
+                self.check_head(url, inf.read(self.HEAD_SIZE))
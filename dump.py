@@ -2,32 +2,53 @@
 
 """Functions for dumping submission related information
 
-dump_urls -- dumps submission related URLs as json,
+dump_urls -- dumps submission related URLs as JSON Lines or json,
 
-download_submissions -- downloads submitted media files.
+download_submissions -- downloads submitted media files,
+
+dump_subreddits -- dumps several subreddits concurrently, requires aiohttp.
 
 Functions rely on non-api access to web resources:
     old.reddit.com, imgur.com. gfycat.com.
 """
 
 import argparse
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import itertools
 import json
 import os
-import time
+import threading
 from urllib.parse import urlparse
 
 import requests
 
 from submission import SubmissionRL
+from transfer_stats import DEFAULT_COUNTER
+from http_cache import DEFAULT_CACHE_PATH as DEFAULT_HTTP_CACHE_PATH, HTTPCache
+from download_filter import DownloadFilter
+from media_store import MediaStore
+from near_duplicates import DEFAULT_INDEX_PATH, NearDuplicateDetector
+from rate_limit import DEFAULT_LIMITER
+from resolve_cache import DEFAULT_CACHE_PATH, ResolveCache
 from adapters import (
     BROWSER_HEADERS,
     SubredditIterator,
     SubmissionResolver,
     GfycatResolver,
     ImgurResolver,
-    DirectURLResolver
+    DirectURLResolver,
+    content_type_extension
 )
 
+try:
+    from async_engine import CrawlEngine
+except ImportError:
+    CrawlEngine = None
+
 
 class SubmissionIterator:
     """Helper class used to iterate over submissions posted in hot section
@@ -38,6 +59,12 @@ class SubmissionIterator:
     Class implements iterator interface. On each iteration URLs related to
     submitted media are returned.
 
+    In concurrent mode a window of submissions is resolved in parallel on
+    a worker pool, results are returned in listing order. Direct URLs
+    are checked immediately without the pool unless they are probed.
+    Requests of listing and resolvers are paced by shared per-host
+    rate limiter.
+
     Args:
         subreddit_name (str).
 
@@ -47,6 +74,24 @@ class SubmissionIterator:
         video_extensions (tuple or list of str): target extensions of submitted
         video files.
 
+        prefetch_watermark (int): count of consumed submissions of listing page
+        after which next page is requested in background, 15 by default.
+        None disables prefetch.
+
+        resolve_workers (int): enables concurrent mode with given count
+        of resolve workers. None by default.
+
+        state (dict): state saved by get_state to continue iteration from.
+
+        resolve_cache (resolve_cache.ResolveCache): cache of resolutions shared
+        by resolvers, None to resolve without cache.
+
+        rate_limiter (rate_limit.RateLimiter): shared by listing and resolvers,
+        rate_limit.DEFAULT_LIMITER if not specified.
+
+        probe (bool): check direct URLs by probe requests instead of
+        extensions, see DirectURLResolver.
+
     Attributes:
         subreddit_iterator (SubredditIterator): used to iterate over submissions
         posted in hot section of given subreddit.
@@ -57,41 +102,74 @@ class SubmissionIterator:
             imgur_resolver (ImgurResolver): for domain imgur.com.
 
             direct_url_resolver (DirectURLResolver): checks whether given URL
-            is direct and target file has known media extension.
+            is direct and target file is known media.
 
-        Request period sets reasonable restriction on requests frequency:
-            REDDIT_ACCESS_PERIOD (int): for old.reddit.com.
+        submissions_requested (int): total count of observed submissions.
 
-            RESOLVE_PERIOD (int): for external media resources.
+        restored_submissions (collections.deque): submissions taken from
+        listing but not returned before state was saved, these are
+        resolved first.
 
-        Last access time value is used to track request time intervals and to
-        comply with chosen request frequency restriction:
-            last_reddit_access_time (int): for old.reddit.com.
+        Concurrent mode:
+            resolve_executor (concurrent.futures.ThreadPoolExecutor): None
+            in serial mode.
 
-            last_gfycat_access_time (int): for gfycat.com.
+            resolve_window (collections.deque): pairs of submission as taken
+            from listing and future of resolved submission in listing order.
 
-            last_imgur_access_time (int): for imgur.com.
+            RESOLVE_WINDOW (int): maximal count of submissions resolved ahead,
+            4 per worker.
 
-        submissions_requested (int): total count of observed submissions.
+            stop_error (StopIteration): cause of end of submissions, None until
+            subreddit is exhausted.
     """
-    def __init__(self, subreddit_name, image_extensions, video_extensions):
-        self.subreddit_iterator = SubredditIterator(subreddit_name)
-        self.gfycat_resolver = GfycatResolver(video_extensions)
-        self.imgur_resolver = ImgurResolver(image_extensions + video_extensions)
-        self.direct_url_resolver = DirectURLResolver(image_extensions + video_extensions)
-        self.last_reddit_access_time = 0
-        self.last_gfycat_access_time = 0
-        self.last_imgur_access_time = 0
-        self.REDDIT_ACCESS_PERIOD = 2
-        self.RESOLVE_PERIOD = 1
+    def __init__(self, subreddit_name, image_extensions, video_extensions,
+                 prefetch_watermark=15, resolve_workers=None, state=None,
+                 resolve_cache=None, rate_limiter=None, probe=False):
+        self.subreddit_iterator = SubredditIterator(
+            subreddit_name, prefetch_watermark=prefetch_watermark,
+            state=state["listing"] if state is not None else None,
+            rate_limiter=rate_limiter)
+        self.gfycat_resolver = GfycatResolver(video_extensions, cache=resolve_cache,
+                                              rate_limiter=rate_limiter)
+        self.imgur_resolver = ImgurResolver(image_extensions + video_extensions,
+                                            cache=resolve_cache,
+                                            rate_limiter=rate_limiter)
+        self.direct_url_resolver = DirectURLResolver(image_extensions + video_extensions,
+                                                     probe=probe, cache=resolve_cache,
+                                                     rate_limiter=rate_limiter)
         self.submissions_requested = 0
+        self.restored_submissions = collections.deque()
+        if state is not None:
+            self.submissions_requested = state["submissions_requested"]
+            self.restored_submissions.extend(SubmissionRL.from_json(submission)
+                                             for submission in state["pending"])
+        self.resolve_executor = None
+        if resolve_workers:
+            self.resolve_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=resolve_workers)
+        self.resolve_window = collections.deque()
+        self.RESOLVE_WINDOW = 4 * resolve_workers if resolve_workers else 1
+        self.stop_error = None
 
     def __iter__(self):
         return self
 
     def __next__(self):
+        """
+        Returns:
+            SubmissionRL: resolved submission.
+
+        Raises:
+            StopIteration: no more submissions available.
+
+            SubmissionResolver.MediaIsUnavailable: submission is not resolved.
+        """
+        if self.resolve_executor is not None:
+            return self.__next_resolved()
+
         try:
-            submission = self.__request_submission_at_time()
+            submission = self.__request_submission()
         except StopIteration as error:
             raise StopIteration from error
 
@@ -100,9 +178,120 @@ class SubmissionIterator:
 
         return submission
 
-    def __request_submission_at_time(self):
+    def get_state(self):
+        """
+        Returns:
+            dict: json serializable state to continue iteration from:
+            listing cursor and submissions taken from listing but not returned.
+        """
+        pending = [SubmissionRL.to_json(submission) for submission, _
+                   in self.resolve_window]
+        pending.extend(SubmissionRL.to_json(submission) for submission
+                       in self.restored_submissions)
+        return {
+            "listing": self.subreddit_iterator.get_state(),
+            "submissions_requested": self.submissions_requested,
+            "pending": pending
+        }
+
+    def close(self):
+        """
+        Cancel submissions scheduled in concurrent mode and prefetch of next
+        page, release workers.
+        """
+        self.subreddit_iterator.close()
+        if self.resolve_executor is None:
+            return
+
+        for _, future in self.resolve_window:
+            future.cancel()
+        self.resolve_window.clear()
+        self.resolve_executor.shutdown(wait=False)
+
+    def __next_resolved(self):
+        """
+        Concurrent mode. Fill resolve window and wait for its first submission.
+
+        Returns:
+            SubmissionRL.
+
+        Raises:
+            see __next__.
+        """
+        while self.stop_error is None and len(self.resolve_window) < self.RESOLVE_WINDOW:
+            try:
+                submission = self.__request_submission()
+            except StopIteration as error:
+                self.stop_error = error
+                break
+
+            if submission is not None:
+                origin = SubmissionRL(url=submission.url,
+                                      url_referer=submission.url_referer)
+                self.resolve_window.append((origin,
+                                            self.__schedule_resolve(submission)))
+
+        if not self.resolve_window:
+            raise StopIteration from self.stop_error
+
+        return self.resolve_window.popleft()[1].result()
+
+    def __schedule_resolve(self, submission):
+        """
+        Submit resolve of submission to worker pool. Direct URL is checked
+        and cached resolution or failure is taken immediately.
+
+        Args:
+            submission (SubmissionRL).
+
+        Returns:
+            concurrent.futures.Future: resolved submission or
+            SubmissionResolver.MediaIsUnavailable exception.
+        """
+        domain = urlparse(submission.url).netloc
+        resolver = None
+        if domain == "imgur.com":
+            resolver = self.imgur_resolver
+        elif domain == "gfycat.com":
+            resolver = self.gfycat_resolver
+        elif self.direct_url_resolver.probe:
+            resolver = self.direct_url_resolver
+        future = concurrent.futures.Future()
+        try:
+            if resolver is None:
+                self.direct_url_resolver.resolve(submission)
+            elif resolver is self.direct_url_resolver:
+                probe = resolver.probe_cached(submission.url)
+                if probe is None:
+                    return self.resolve_executor.submit(
+                        self.__resolve_concurrently, resolver, submission)
+                resolver.accept(submission.url, *probe)
+            elif not resolver.resolve_cached(submission):
+                return self.resolve_executor.submit(
+                    self.__resolve_concurrently, resolver, submission)
+            future.set_result(submission)
+        except SubmissionResolver.MediaIsUnavailable as error:
+            future.set_exception(error)
+        return future
+
+    @staticmethod
+    def __resolve_concurrently(resolver, submission):
+        """Executed by worker
+
+        Args:
+            resolver (GfycatResolver, ImgurResolver or DirectURLResolver).
+
+            submission (SubmissionRL).
+
+        Returns:
+            SubmissionRL: resolved submission.
+        """
+        resolver.resolve(submission)
+        return submission
+
+    def __request_submission(self):
         """
-        Get submission related URLs with respect to old.reddit.com access period.
+        Get submission related URLs. Restored submissions are taken first.
 
         Returns:
             SubmissionRL: submission related URLs.
@@ -110,25 +299,17 @@ class SubmissionIterator:
         Raises:
             StopIteration: if no more submissions available.
         """
-        if (self.submissions_requested
-                % self.subreddit_iterator.SUBMISSIONS_PER_PAGE == 0
-                and self.submissions_requested > 0
-           ):
-            reddit_access_interval = time.monotonic() - self.last_reddit_access_time
-            if reddit_access_interval < self.REDDIT_ACCESS_PERIOD:
-                time.sleep(self.REDDIT_ACCESS_PERIOD - reddit_access_interval)
-            try:
-                submission = next(self.subreddit_iterator)
-            finally:
-                self.last_reddit_access_time = time.monotonic()
-        else:
-            submission = next(self.subreddit_iterator)
+        if self.restored_submissions:
+            return self.restored_submissions.popleft()
+
+        submission = next(self.subreddit_iterator)
         self.submissions_requested += 1
         return submission
 
     def __resolve(self, submission):
         """
         Replace submitted URLs with direct URLs. Update related URLs accordingly.
+        Cached resolutions and failures are taken without waiting.
 
         Args:
             submission (SubmissionRL).
@@ -136,73 +317,134 @@ class SubmissionIterator:
         url_parts = urlparse(submission.url)
         domain = url_parts.netloc
         if domain == "imgur.com":
-            self.last_imgur_access_time =\
-                self.__resolve_at_time(self.imgur_resolver, submission,
-                                       self.last_imgur_access_time)
+            self.imgur_resolver.resolve(submission)
         elif domain == "gfycat.com":
-            self.last_gfycat_access_time =\
-                self.__resolve_at_time(self.gfycat_resolver, submission,
-                                       self.last_gfycat_access_time)
+            self.gfycat_resolver.resolve(submission)
         else:
             self.direct_url_resolver.resolve(submission)
 
-    def __resolve_at_time(self, resolver, submission, last_resolve_time):
-        """Called by __resolve method
-
-        Used to abstract from details of resolver.
-        Complies request frequency restrictions.
 
-        Args:
-            resolver (SubmissionResolver or DirectURLResolver).
+class SubmissionDownloader:
+    """Helper class used to download media files
 
-            submission (SubmissionRL).
+    Requests are paced by shared per-host rate limiter.
+    Keeps separate HTTP session, i.e. connection pool, per host.
+    Media files are streamed by chunks into .part files which are
+    renamed on completion, so partly written files never appear under
+    their final names. Interrupted downloads are resumed with HTTP Range
+    requests validated by If-Range, validator is kept in .part.meta file.
 
-            last_resolve_time (int).
+    If media store is given downloaded files are hashed while streamed and
+    moved into the store, output directory gets links to them. URLs known
+    to the store are not downloaded again.
 
-        Returns:
-            int: time of last request to external media resource.
-        """
-        resolve_interval = time.monotonic() - last_resolve_time
-        if resolve_interval < self.RESOLVE_PERIOD:
-            time.sleep(self.RESOLVE_PERIOD - resolve_interval)
-        resolver.resolve(submission)
-        return time.monotonic()
+    Saved files are passed to near-duplicate detector if any, which hashes
+    them in background. URLs of files it removes are marked as skipped
+    in media store and are reported by take_skipped.
 
+    If HTTP cache is given fresh cached files are saved without requests,
+    stale ones are revalidated by conditional requests. Downloaded files
+    are added to the cache.
 
-class SubmissionDownloader:
-    """Helper class used to download media files
+    If download filter is given response is checked before it's content
+    is streamed, rejected response is closed at once. Submission whose
+    files are all rejected raises DownloadFilter.MediaIsFiltered.
 
-    Sets and complies reasonable restriction on requests frequency.
+    In parallel mode submitted downloads are executed on bounded worker pool.
+    Each domain has its own queue of pending downloads and at most
+    MAX_DOMAIN_DOWNLOADS of them are executed at once, so slow host doesn't
+    hold up downloads from other hosts.
 
     Args:
          outdir_path (str): path to save media files. If directory
          doesn't exist attempt to create one.
 
+         download_workers (int): enables parallel mode with given count of
+         workers. None by default.
+
+         rate_limiter (rate_limit.RateLimiter): shared limiter,
+         rate_limit.DEFAULT_LIMITER if not specified.
+
+         media_store (media_store.MediaStore): content-addressed store,
+         None to save files into output directory.
+
+         duplicate_detector (near_duplicates.NearDuplicateDetector):
+         stage receiving saved files, may be None.
+
+         download_filter (download_filter.DownloadFilter): filter of
+         downloaded files, None to save all.
+
+         http_cache (http_cache.HTTPCache): cache of media files shared
+         with quick_peek, None to download without cache.
+
     Attributes:
         outdir_path (str).
 
-        download_session (requests.Session).
+        media_store (media_store.MediaStore).
+
+        duplicate_detector (near_duplicates.NearDuplicateDetector).
 
-        DOWNLOAD_PERIOD (int): default download time interval 1s.
+        download_filter (download_filter.DownloadFilter).
 
-        last_downloads (dict): key (str) - domain,
-        value (int) - last download time.
+        http_cache (http_cache.HTTPCache).
+
+        download_sessions (dict): key (str) - host,
+        value (requests.Session) - session used to download from the host.
+
+        rate_limiter (rate_limit.RateLimiter): paces media requests.
+
+        CHUNK_SIZE (int): size of chunks of streamed media files, 64KiB.
+
+        lock (threading.Lock): guards sessions, domain queues,
+        partial downloads and choice of output file names.
+
+        active_parts (set): paths of partial downloads in progress.
+
+        skipped_urls (collections.deque): URLs of files removed by
+        near-duplicate detector, see take_skipped.
+
+        Parallel mode:
+            download_executor (concurrent.futures.ThreadPoolExecutor): None
+            in serial mode.
+
+            MAX_DOMAIN_DOWNLOADS (int): per-domain concurrency limit, 2.
+
+            active_downloads (dict): key (str) - domain,
+            value (int) - count of executed downloads.
+
+            pending_downloads (dict): key (str) - domain,
+            value (collections.deque) - pairs of submission and future
+            waiting for free domain slot.
     """
-    def __init__(self, outdir_path):
+    def __init__(self, outdir_path, download_workers=None, rate_limiter=None,
+                 media_store=None, duplicate_detector=None, download_filter=None,
+                 http_cache=None):
         if not os.path.exists(outdir_path):
             os.makedirs(outdir_path)
         self.outdir_path = outdir_path
-        self.download_session = requests.Session()
-        self.download_session.headers.update(BROWSER_HEADERS)
-        self.DOWNLOAD_PERIOD = 1
-        self.last_downloads = dict()
+        self.media_store = media_store
+        self.duplicate_detector = duplicate_detector
+        self.download_filter = download_filter
+        self.http_cache = http_cache
+        self.download_sessions = dict()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else DEFAULT_LIMITER
+        self.CHUNK_SIZE = 64 * 1024
+        self.lock = threading.Lock()
+        self.active_parts = set()
+        self.skipped_urls = collections.deque()
+        self.download_executor = None
+        if download_workers:
+            self.download_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=download_workers)
+        self.MAX_DOMAIN_DOWNLOADS = 2
+        self.active_downloads = collections.defaultdict(int)
+        self.pending_downloads = collections.defaultdict(collections.deque)
 
     def download(self, submission):
         """
         Download submitted media file with use of given HTTP referer.
         If main media file is not available try to download additional
         media file, e.g. preview image, if URL is presented.
-        Complies chosen download frequency restrictions.
 
         Args:
             submission (SubmissionRL).
@@ -210,207 +452,1522 @@ class SubmissionDownloader:
         Returns:
             bool: True if successfully downloaded and saved at least one file,
             False otherwise.
+
+        Raises:
+            DownloadFilter.MediaIsFiltered: files are rejected by filter
+            or were skipped as near-duplicates.
         """
-        url_parts = urlparse(submission.url)
-        domain = url_parts.netloc
-        download_interval = (time.monotonic()
-                             - self.last_downloads.get(domain, 0))
-        if download_interval < self.DOWNLOAD_PERIOD:
-            time.sleep(self.DOWNLOAD_PERIOD - download_interval)
+        return self.__download(submission)
+
+    def submit(self, submission):
+        """
+        Parallel mode. Schedule download of submitted media file.
 
+        Args:
+            submission (SubmissionRL).
+
+        Returns:
+            concurrent.futures.Future: result of download, see download.
+        """
+        domain = urlparse(submission.url).netloc
+        future = concurrent.futures.Future()
+        with self.lock:
+            if self.active_downloads[domain] < self.MAX_DOMAIN_DOWNLOADS:
+                self.active_downloads[domain] += 1
+                self.download_executor.submit(self.__run_download,
+                                              domain, submission, future)
+            else:
+                self.pending_downloads[domain].append((submission, future))
+        return future
+
+    def take_skipped(self):
+        """
+        Returns:
+            list of str: URLs of saved files removed by near-duplicate
+            detector since previous call.
+        """
+        skipped = []
+        while self.skipped_urls:
+            skipped.append(self.skipped_urls.popleft())
+        return skipped
+
+    def close(self):
+        """Parallel mode. Cancel pending downloads, release workers."""
+        if self.download_executor is None:
+            return
+
+        with self.lock:
+            for domain_downloads in self.pending_downloads.values():
+                for _, future in domain_downloads:
+                    future.cancel()
+                domain_downloads.clear()
+        self.download_executor.shutdown(wait=False)
+
+    def __on_skipped(self, url, path, original):
+        """
+        Record URL of file removed by near-duplicate detector in media store
+        and for take_skipped. Is called by executor thread of detector.
+        """
+        if self.media_store is not None:
+            self.media_store.mark_skipped(url)
+        self.skipped_urls.append(url)
+
+    def __run_download(self, domain, submission, future):
+        """Executed by worker
+
+        Download, then pass domain slot to next pending download
+        of the domain if any.
+
+        Args:
+            domain (str).
+
+            submission (SubmissionRL).
+
+            future (concurrent.futures.Future): receives result of download.
+        """
+        while True:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(self.__download(submission))
+                except Exception as error:
+                    future.set_exception(error)
+
+            with self.lock:
+                if not self.pending_downloads[domain]:
+                    self.active_downloads[domain] -= 1
+                    return
+                submission, future = self.pending_downloads[domain].popleft()
+
+    def __session(self, url):
+        """
+        Returns:
+            requests.Session: session of URL host, created on first use.
+        """
+        host = urlparse(url).netloc
+        with self.lock:
+            session = self.download_sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                session.headers.update(BROWSER_HEADERS)
+                # byte ranges must refer to stored, not transfer-encoded, content
+                session.headers.update({"Accept-Encoding": "identity"})
+                self.download_sessions[host] = session
+        return session
+
+    def __download(self, submission):
+        """
+        Request submitted media file or extra one and save it.
+
+        Args:
+            submission (SubmissionRL).
+
+        Returns:
+            bool: see download.
+
+        Raises:
+            DownloadFilter.MediaIsFiltered: see download.
+        """
         referer_header = ({"Referer": submission.url_referer}
                           if submission.url_referer is not None else {})
+        filtered = None
         try:
-            response = self.download_session.get(submission.url,
-                                                 headers=referer_header)
+            try:
+                saved = self.__download_url(submission.url, referer_header)
+            except DownloadFilter.MediaIsFiltered as error:
+                saved, filtered = None, error
+            if saved is None and submission.url_extra is not None:
+                if filtered is not None:
+                    print(filtered)
+                print(f"Try download extra {submission.url_extra}")
+                saved = self.__download_url(submission.url_extra, referer_header)
+            elif filtered is not None:
+                raise filtered
         except requests.exceptions.TooManyRedirects as error:
             print(error)
             return False
+
+        return bool(saved)
+
+    def __download_url(self, url, referer_header):
+        """
+        Download file resuming partial download if any.
+        File of URL known to media store is linked without request unless
+        it was skipped as near-duplicate or is rejected by filter, fresh file of HTTP cache is copied
+        without request.
+
+        Args:
+            url (str).
+
+            referer_header (dict).
+
+        Returns:
+            bool: True if saved successfully, False otherwise.
+
+            None: request failed.
+
+        Raises:
+            DownloadFilter.MediaIsFiltered: file is rejected by filter or
+            was skipped as near-duplicate.
+        """
+        if self.media_store is not None:
+            blob_path, name = self.media_store.lookup(url)
+            if self.media_store.is_skipped(url) or (
+                    blob_path is not None and self.duplicate_detector is not None
+                    and self.duplicate_detector.is_skipped(
+                        os.path.join(self.outdir_path, name))):
+                raise DownloadFilter.MediaIsFiltered(f"Skipped near-duplicate {url}")
+            if blob_path is not None:
+                print(f"Already stored {url}")
+                try:
+                    if self.download_filter is not None:
+                        self.download_filter.check_file(url, blob_path)
+                    self.media_store.link(blob_path, os.path.join(self.outdir_path, name))
+                except OSError as error:
+                    print(f"Failed to link {name}: {error}")
+                    return False
+                return True
+
+        part_path = self.__part_path(url)
+        with self.lock:
+            if part_path in self.active_parts:
+                print(f"Already downloading {url}")
+                return False
+            self.active_parts.add(part_path)
+        try:
+            entry = self.http_cache.lookup(url) if self.http_cache is not None else None
+            if entry is not None and self.http_cache.is_fresh(entry):
+                saved = self.__save_cached(url, entry, part_path)
+                if saved is not None:
+                    return saved
+                entry = None
+
+            response, offset = self.__request_media(url, referer_header, part_path, entry)
+            if response.status_code == 304 and entry is not None:
+                response.close()
+                saved = self.__save_cached(url, self.http_cache.refresh(entry, response.headers),
+                                           part_path)
+                if saved is not None:
+                    return saved
+                response, offset = self.__request_media(url, referer_header, part_path)
+
+            if response.status_code not in (200, 206):
+                print(f"Fail, code: {response.status_code}, {response.url}")
+                response.close()
+                return None
+
+            if self.download_filter is not None:
+                try:
+                    self.download_filter.check_headers(url, response.status_code,
+                                                       response.headers)
+                except DownloadFilter.MediaIsFiltered:
+                    # connection is dropped with unread content
+                    response.close()
+                    raise
+
+            return self.__save_content(response, url, part_path, offset)
         finally:
-            self.last_downloads[domain] = time.monotonic()
+            with self.lock:
+                self.active_parts.discard(part_path)
 
-        request_succeed = False
-        if response.status_code != 200:
-            print(f"Fail, code: {response.status_code}, {response.url}")
-            if submission.url_extra is not None:
-                print(f"Try download extra {submission.url_extra}")
-                response = self.download_session.get(submission.url_extra,
-                                                     headers=referer_header)
-                if response.status_code != 200:
-                    print(f"Extra fail, code: {response.status_code}, {response.url}")
-                else:
-                    request_succeed = True
-        else:
-            request_succeed = True
-        self.last_downloads[domain] = time.monotonic()
+    def __request_media(self, url, referer_header, part_path, entry=None):
+        """
+        Request media file. If there is resumable partial download request
+        only missing bytes with Range and If-Range headers. If server ignores
+        range or file was changed full file is received. Otherwise stale
+        entry of HTTP cache is revalidated, response has status 304 if
+        it is still valid.
+
+        Args:
+            url (str).
+
+            referer_header (dict).
+
+            part_path (str): path of partial download.
+
+            entry (http_cache.CacheEntry): stale cached file, may be None.
+
+        Returns:
+            requests.Response: streamed response.
+
+            int: offset of response content in file.
+        """
+        offset, validator = self.__read_part(url, part_path)
+        if offset == 0:
+            return self.__get(url, {**referer_header,
+                                    **HTTPCache.conditional_headers(entry)}), 0
+
+        print(f"Resume from byte {offset}")
+        response = self.__get(url, {**referer_header,
+                                    "Range": f"bytes={offset}-",
+                                    "If-Range": validator})
+        if response.status_code == 206:
+            if self.__content_range_start(response) == offset:
+                return response, offset
+        elif response.status_code != 416:
+            return response, 0
+
+        response.close()
+        self.__remove_part(part_path)
+        return self.__get(url, referer_header), 0
+
+    def __get(self, url, headers):
+        """
+        Request URL by session of it's host once rate limiter allows.
+
+        Returns:
+            requests.Response: streamed response.
+        """
+        self.rate_limiter.acquire(url)
+        return self.__session(url).get(url, headers=headers, stream=True)
+
+    def __part_path(self, url):
+        """
+        Returns:
+            str: path of partial download of URL.
+        """
+        url_hash = hashlib.sha1(url.encode()).hexdigest()[:10]
+        return os.path.join(self.outdir_path,
+                            f"{os.path.basename(urlparse(url).path)}.{url_hash}.part")
+
+    @staticmethod
+    def __read_part(url, part_path):
+        """
+        Returns:
+            int: size of resumable partial download of URL, 0 if there is none.
 
-        if request_succeed:
-            return self.__save_content(response)
+            str: validator of partial download used as If-Range value.
+        """
+        try:
+            with open(part_path + ".meta") as metaf:
+                meta = json.load(metaf)
+            if meta.get("url") == url and meta.get("validator"):
+                return os.path.getsize(part_path), meta["validator"]
+        except (OSError, ValueError):
+            pass
+        return 0, None
+
+    def __hash_file(self, path, digest):
+        """Update digest with content of file, is used for resumed parts."""
+        with open(path, "rb") as inf:
+            for chunk in iter(lambda: inf.read(self.CHUNK_SIZE), b""):
+                digest.update(chunk)
+
+    @staticmethod
+    def __remove_part(part_path):
+        """Remove partial download and it's metadata if any."""
+        for path in (part_path, part_path + ".meta"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
 
-        return False
+    @staticmethod
+    def __validator(response):
+        """
+        Returns:
+            str: strong ETag or Last-Modified of response, None if there is none.
+        """
+        etag = response.headers.get("ETag")
+        if etag is not None and not etag.startswith("W/"):
+            return etag
+        return response.headers.get("Last-Modified")
 
-    def __save_content(self, response):
+    @staticmethod
+    def __content_range_start(response):
+        """
+        Returns:
+            int: first byte position of Content-Range, None if invalid.
+        """
+        try:
+            unit, byte_range = response.headers["Content-Range"].split()
+            if unit != "bytes":
+                return None
+            return int(byte_range.split("-", maxsplit=1)[0])
+        except (KeyError, ValueError):
+            return None
+
+    def __save_content(self, response, url, part_path, offset):
         """
-        Save content of downloaded media file under name specified in response URL.
+        Stream content of downloaded media file into partial download file and
+        rename it to name specified in response URL.
         If file with same name exists append _copy to the name.
+        With media store content is hashed on the fly, file is moved into
+        the store and linked under the name instead.
+        Partial download is kept on interruption if it may be resumed.
+        If download filter needs first bytes of content they are checked
+        before anything is written.
 
         Args:
-            response (requests.Response): response with media file content.
+            response (requests.Response): streamed response with media file content.
+            Response is closed.
+
+            url (str): requested URL.
+
+            part_path (str): path of partial download.
+
+            offset (int): offset of response content in file.
 
         Returns:
             bool: True if saved successfully, False otherwise.
+
+        Raises:
+            DownloadFilter.MediaIsFiltered: first bytes of file are rejected.
         """
-        outfile_path = os.path.join(self.outdir_path,
-                                    os.path.basename(urlparse(response.url).path))
-        if os.path.exists(outfile_path):
-            root, ext = os.path.splitext(outfile_path) 
-            outfile_path = root + "_copy" + ext
+        outfile_path = self.__outfile_path(response.url, response.headers.get("Content-Type"))
+        validator = self.__validator(response)
+        digest = None
         try:
-            with open(outfile_path, "wb") as outf:
-                outf.write(response.content)
-        except FileNotFoundError:
-            print(f"Failed to save {outfile_path}")
+            chunks = response.iter_content(self.CHUNK_SIZE)
+            if (not offset and self.download_filter is not None
+                    and self.download_filter.needs_head(response.headers)):
+                head = b""
+                for chunk in chunks:
+                    head += chunk
+                    if len(head) >= self.download_filter.HEAD_SIZE:
+                        break
+                self.download_filter.check_head(url, head)
+                chunks = itertools.chain((head,), chunks)
+            if validator is not None:
+                with open(part_path + ".meta", "w") as metaf:
+                    json.dump({"url": url, "validator": validator}, metaf)
+            if self.media_store is not None:
+                digest = hashlib.sha256()
+                if offset:
+                    self.__hash_file(part_path, digest)
+            with open(part_path, "ab" if offset else "wb") as outf:
+                for chunk in chunks:
+                    outf.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+            outfile_path = self.__complete(url, part_path, outfile_path,
+                                           digest.hexdigest() if digest is not None else None,
+                                           response.headers)
+        except requests.exceptions.RequestException as error:
+            print(f"Interrupted {url}: {error}")
+            if validator is None:
+                self.__remove_part(part_path)
             return False
+        except OSError as error:
+            print(f"Failed to save {outfile_path}: {error}")
+            return False
+        finally:
+            response.close()
 
         return True
 
+    def __save_cached(self, url, entry, part_path):
+        """
+        Save file of HTTP cache like downloaded one. Content is written and
+        hashed directly from memory mapping of cached file.
 
-def print_causes(error):
-    """Naive helper function used to traceback exception cause"""
-    print("Error", type(error).__name__, "caused by:")
-    error = error.__cause__
-    while error is not None:
-        print("^", type(error).__name__, error)
-        error = error.__cause__
+        Args:
+            url (str): requested URL.
 
+            entry (http_cache.CacheEntry): cached file.
 
-def dump_urls(subreddit_name, count, outfile_path=None):
-    """
-    Save URLs related to submitted media files into json file.
+            part_path (str): path of partial download.
 
-    Note: failed attempts to obtain direct URLs of media files
-    from submitted URLs count separately in total as number of
-    unresolved submissions. If the number exceeds a threshold,
-    initially 2 * <given count of submissions>, traverse stops
-    and given subreddit may be assumed to have to many text
-    submissions or submitted indirect URLs mostly point to
-    resources different from known: imgur.com, gfycat.com.
-    Full list of known resources is defined by resolvers used.
+        Returns:
+            bool: True if saved successfully, False otherwise.
 
-    Args:
-        subreddit_name (str): subreddit to scrape.
+            None: cached file is missing.
 
-        count (int): count of submissions to dump, failures
-        don't count.
+        Raises:
+            DownloadFilter.MediaIsFiltered: file is rejected by filter.
+        """
+        headers = {"Content-Length": str(entry.size)}
+        if entry.content_type is not None:
+            headers["Content-Type"] = entry.content_type
+        if self.download_filter is not None:
+            self.download_filter.check_headers(url, 200, headers)
+
+        mapping = self.http_cache.open(entry)
+        if mapping is None:
+            return None
+
+        print(f"Cached {url}")
+        outfile_path = self.__outfile_path(url, entry.content_type)
+        try:
+            with mapping:
+                if (self.download_filter is not None
+                        and self.download_filter.needs_head(headers)):
+                    self.download_filter.check_head(
+                        url, mapping[:self.download_filter.HEAD_SIZE])
+                self.__remove_part(part_path)
+                with open(part_path, "wb") as outf:
+                    outf.write(mapping)
+                digest = (hashlib.sha256(mapping).hexdigest()
+                          if self.media_store is not None else None)
+            self.__complete(url, part_path, outfile_path, digest)
+        except OSError as error:
+            print(f"Failed to save {outfile_path}: {error}")
+            self.__remove_part(part_path)
+            return False
 
-        outfile_path (str): json extension is not required.
-        If not specified everything is saved into <subreddit_name>.json.
-    """
-    if count <= 0:
-        print(f"Submissions count must be > 0, given {count}")
-        return
+        return True
 
-    image_extensions = ("jpg", "jpeg", "png", "webp", "gif")
-    video_extensions = ("mp4", "webm")
-    submission_iterator = SubmissionIterator(subreddit_name,
-                                             image_extensions,
-                                             video_extensions)
-    submissions_left = count
-    submissions_unresolved = 0
-    MAX_UNRESOLVED = 2 * count
-    submissions = list()
-    with open(subreddit_name + ".json" if outfile_path is None else outfile_path, "w")\
-            as outfile:
-        while submissions_left > 0:
-            print(f"To go: {submissions_left}",
-                  f"Unresolved: {submissions_unresolved}")
-            try:
-                submitted_media_rl = next(submission_iterator)
-                if submitted_media_rl is None:
-                    print("Unexpected None submission")
-                    continue
-            except StopIteration as error:
-                print_causes(error)
-                break
-            except SubmissionResolver.MediaIsUnavailable as error:
-                print(error)
-                submissions_unresolved += 1
-                if submissions_unresolved < MAX_UNRESOLVED:
-                    continue
-                print("Break: too many unresolved submissions")
-                break
+    def __outfile_path(self, url, content_type):
+        """
+        Returns:
+            str: output path named as file of URL, extension is taken from
+            content type if URL lacks one.
+        """
+        outfile_path = os.path.join(self.outdir_path, os.path.basename(urlparse(url).path))
+        if not os.path.splitext(outfile_path)[1]:
+            # extensionless URL accepted by probe
+            extension = content_type_extension(content_type)
+            if extension is not None:
+                outfile_path += "." + extension
+        return outfile_path
+
+    def __complete(self, url, part_path, outfile_path, digest, headers=None):
+        """
+        Rename completed partial download to output path, append _copy to
+        the name if it is taken. With media store file is moved into the store
+        and linked instead. Downloaded file is added to HTTP cache.
+        File is passed to near-duplicate detector, see take_skipped.
 
-            submissions.append(submitted_media_rl)
-            submissions_left -= 1
-        json.dump(submissions, outfile, default=SubmissionRL.to_json, indent=2)
+        Args:
+            url (str): requested URL.
 
+            part_path (str): path of completed download.
 
-def download_submissions(subreddit_name, count, outdir_path=None):
-    """
-    Download media files submitted in hot section of given subreddit.
+            outfile_path (str): wanted output path.
 
-    Note: fails count separately. Threshold of total number of failed
-    attempts to obtain direct URLs of media files from submitted indirect
-    URLs is initially equal to 2 * <given count of submissions>.
-    Threshold of total number of download fails is initially equal to
-    <given count of submissions> // 2.
+            digest (str): hex SHA-256 digest of file, None without media store.
+
+            headers (Mapping): headers of response, None if file is taken
+            from HTTP cache.
+
+        Returns:
+            str: output path.
+        """
+        if digest is not None:
+            blob_path = self.media_store.add(url, part_path, digest,
+                                             os.path.basename(outfile_path))
+            outfile_path = self.media_store.link(blob_path, outfile_path)
+        else:
+            with self.lock:
+                if os.path.exists(outfile_path):
+                    root, ext = os.path.splitext(outfile_path)
+                    outfile_path = root + "_copy" + ext
+                os.replace(part_path, outfile_path)
+        self.__remove_part(part_path)
+        if self.http_cache is not None and headers is not None:
+            self.http_cache.store_file(url, headers, outfile_path)
+        if self.duplicate_detector is not None:
+            self.duplicate_detector.submit(outfile_path,
+                                           functools.partial(self.__on_skipped, url))
+        return outfile_path
+
+
+class Checkpoint:
+    """Crawl progress saved into json file
+
+    File is replaced atomically on each save, so it holds complete state
+    of last save even if process is killed while saving. Finished items,
+    e.g. URLs of downloaded files, are appended to log <path>.log as soon
+    as they are finished instead of being rewritten on each save, so size
+    of saved state doesn't grow with count of finished items. Log is
+    synced on save.
 
     Args:
-        subreddit (str).
+        path (str): checkpoint file path.
 
-        count (int): count of submitted media files to download.
+    Attributes:
+        path (str).
 
-        outdir_path (str): target directory. If None try to create
-        directory with subreddit name.
-    """
-    if count <= 0:
-        print(f"Submissions count must be > 0, given {count}")
-        return
+        log_path (str).
 
-    if outdir_path is None:
+        log_file (file): log opened for appending, None before first record.
+
+        is_log_synced (bool): nothing was recorded since log was synced.
+
+        lock (threading.Lock): guards log, items may be recorded by
+        download workers.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.log_path = path + ".log"
+        self.log_file = None
+        self.is_log_synced = True
+        self.lock = threading.Lock()
+
+    def load(self, dump_type, subreddit_name):
+        """
+        Args:
+            dump_type (str): "url" or "media".
+
+            subreddit_name (str).
+
+        Returns:
+            dict: saved state if it belongs to the same dump, None otherwise.
+        """
+        try:
+            with open(self.path) as checkpoint_file:
+                state = json.load(checkpoint_file)
+        except FileNotFoundError:
+            print(f"No checkpoint {self.path}, start from the beginning")
+            return None
+        except (OSError, ValueError) as error:
+            print(f"Failed to load checkpoint {self.path}: {error}")
+            return None
+
+        if state.get("type") != dump_type or state.get("subreddit") != subreddit_name:
+            print(f"Checkpoint {self.path} belongs to other dump")
+            return None
+
+        return state
+
+    def restore_records(self):
+        """
+        Read log of loaded checkpoint, following records are appended to it.
+        Line cut by interruption is dropped.
+
+        Returns:
+            list: recorded items.
+        """
+        records = []
+        offset = 0
+        try:
+            with open(self.log_path, "rb") as log_file:
+                for line in log_file:
+                    if not line.endswith(b"\n"):
+                        break
+                    records.append(json.loads(line))
+                    offset += len(line)
+        except FileNotFoundError:
+            return records
+
+        with self.lock:
+            self.log_file = open(self.log_path, "r+b")
+            self.log_file.truncate(offset)
+            self.log_file.seek(offset)
+        return records
+
+    def record(self, item):
+        """
+        Append item to log at once. Thread safe.
+
+        Args:
+            item: json serializable item.
+        """
+        with self.lock:
+            if self.log_file is None:
+                self.log_file = open(self.log_path, "wb")
+            self.log_file.write(json.dumps(item).encode() + b"\n")
+            self.log_file.flush()
+            self.is_log_synced = False
+
+    def save(self, state):
+        """
+        Args:
+            state (dict): json serializable state.
+        """
+        with self.lock:
+            if not self.is_log_synced:
+                os.fsync(self.log_file.fileno())
+                self.is_log_synced = True
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as checkpoint_file:
+            json.dump(state, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        """Remove checkpoint and log of finished dump."""
+        with self.lock:
+            if self.log_file is not None:
+                self.log_file.close()
+                self.log_file = None
+            self.is_log_synced = True
+        for path in (self.path, self.log_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class DumpProgress:
+    """Counters of subreddit dump and their checkpoint
+
+    Shared by dump_urls, download_submissions and their async counterparts,
+    which differ only by the way submissions are resolved and downloaded.
+    Checkpoint is saved only if progress changed since last save.
+
+    Args:
+        checkpoint (Checkpoint).
+
+        dump_type (str): "url" or "media".
+
+        subreddit_name (str).
+
+        count (int): count of submissions to dump.
+
+        state (dict): state loaded from checkpoint, None to start from
+        the beginning, stale checkpoint is removed then.
+
+        prefix (str): prefix of printed messages, empty by default.
+
+    Attributes:
+        checkpoint (Checkpoint).
+
+        dump_type (str).
+
+        subreddit_name (str).
+
+        prefix (str).
+
+        submissions_left (int).
+
+        submissions_unresolved (int): count of failed resolves and downloads
+        rejected by download filter.
+
+        max_unresolved (int): 2 * count.
+
+        download_fails (int).
+
+        max_download_fails (int): count // 2.
+
+        resolved (collections.deque): media dump, resolved submissions
+        waiting for download.
+
+        downloaded (set of str): media dump, recorded URLs of downloaded
+        submissions.
+
+        is_changed (bool): progress was changed since last save.
+    """
+
+    def __init__(self, checkpoint, dump_type, subreddit_name, count, state=None, prefix=""):
+        self.checkpoint = checkpoint
+        self.dump_type = dump_type
+        self.subreddit_name = subreddit_name
+        self.prefix = prefix
+        self.submissions_left = count
+        self.submissions_unresolved = 0
+        self.max_unresolved = 2 * count
+        self.download_fails = 0
+        self.max_download_fails = count // 2
+        self.resolved = collections.deque()
+        self.downloaded = set()
+        self.is_changed = True
+        if state is None:
+            checkpoint.remove()
+            return
+
+        self.submissions_left = state["submissions_left"]
+        self.submissions_unresolved = state["submissions_unresolved"]
+        if dump_type != "media":
+            return
+
+        self.download_fails = state["download_fails"]
+        self.downloaded.update(checkpoint.restore_records())
+        for submission in state["resolved"]:
+            submission = SubmissionRL.from_json(submission)
+            if submission.url in self.downloaded:
+                # download finished after checkpoint was saved
+                print(f"{self.prefix}Downloaded before interruption {submission.url}")
+                self.submissions_left -= 1
+            else:
+                self.resolved.append(submission)
+
+    def report(self):
+        """Print counters."""
+        if self.dump_type == "media":
+            print(f"{self.prefix}To go: {self.submissions_left}",
+                  f"Unresolved: {self.submissions_unresolved}",
+                  f"Download fails: {self.download_fails}")
+        else:
+            print(f"{self.prefix}To go: {self.submissions_left}",
+                  f"Unresolved: {self.submissions_unresolved}")
+
+    def add_unresolved(self, error):
+        """
+        Count submission which failed to resolve or was rejected by
+        download filter.
+
+        Args:
+            error (Exception): reported reason.
+
+        Returns:
+            bool: True if there are too many unresolved submissions,
+            dump must stop.
+        """
+        print(f"{self.prefix}{error}")
+        self.submissions_unresolved += 1
+        self.is_changed = True
+        if self.submissions_unresolved < self.max_unresolved:
+            return False
+        print(f"{self.prefix}Break: too many unresolved submissions")
+        return True
+
+    def add_dumped(self):
+        """URLs dump. Count written submission."""
+        self.submissions_left -= 1
+        self.is_changed = True
+
+    def add_resolved(self, submission):
+        """Media dump. Queue resolved submission for download."""
+        self.resolved.append(submission)
+        self.is_changed = True
+
+    def record_download(self, submission, download):
+        """
+        Done callback of download future or task. URL of downloaded
+        submission is recorded at once, so it isn't downloaded again
+        on resume even if it's result wasn't counted before interruption.
+
+        Args:
+            submission (SubmissionRL).
+
+            download (concurrent.futures.Future or asyncio.Task).
+        """
+        if not download.cancelled() and download.exception() is None and download.result():
+            self.record(submission.url)
+
+    def record(self, url):
+        """Record URL of downloaded submission in checkpoint log."""
+        if url not in self.downloaded:
+            self.downloaded.add(url)
+            self.checkpoint.record(url)
+
+    def add_download(self, submission, is_downloaded):
+        """
+        Count result of download.
+
+        Args:
+            submission (SubmissionRL).
+
+            is_downloaded (bool).
+
+        Returns:
+            bool: True if too many downloads failed, dump must stop.
+        """
+        self.is_changed = True
+        if is_downloaded:
+            print(f"{self.prefix}->Downloaded {submission.url}")
+            self.record(submission.url)
+            self.submissions_left -= 1
+            return False
+
+        print(f"{self.prefix}->Failed to download {submission.url}")
+        self.download_fails += 1
+        if self.download_fails < self.max_download_fails:
+            return False
+        print(f"{self.prefix}Too many failed downloads")
+        return True
+
+    def add_skipped(self, urls):
+        """
+        Media dump. Uncount downloaded files removed by near-duplicate
+        detector, they are replaced by next submissions.
+
+        Args:
+            urls (list of str): URLs of removed files.
+
+        Returns:
+            bool: True if any file was uncounted.
+        """
+        for url in urls:
+            print(f"{self.prefix}->Skipped near-duplicate {url}")
+            self.submissions_left += 1
+            self.is_changed = True
+        return bool(urls)
+
+    def add_results(self, downloads, done):
+        """
+        Count results of finished downloads.
+
+        Args:
+            downloads (dict): key (concurrent.futures.Future or asyncio.Task) -
+            download result, value (SubmissionRL) - submission. Finished
+            downloads are removed.
+
+            done (iterable): finished futures or tasks.
+
+        Returns:
+            bool: True if dump must stop.
+        """
+        is_stopped = False
+        for download in done:
+            submission = downloads.pop(download)
+            try:
+                is_downloaded = download.result()
+            except DownloadFilter.MediaIsFiltered as error:
+                is_stopped = self.add_unresolved(f"->{error}") or is_stopped
+                continue
+
+            is_stopped = self.add_download(submission, is_downloaded) or is_stopped
+        return is_stopped
+
+    def save(self, iterator_state, pending=(), output=None):
+        """
+        Save checkpoint if progress changed since last save.
+
+        Args:
+            iterator_state (dict): state of submission iterator.
+
+            pending (iterable of SubmissionRL): media dump, submissions being
+            downloaded, they are saved as resolved ones.
+
+            output (URLOutput): URLs dump output, it is synced first.
+        """
+        if not self.is_changed:
+            return
+
+        state = {
+            "type": self.dump_type,
+            "subreddit": self.subreddit_name,
+            "iterator": iterator_state,
+            "submissions_left": self.submissions_left,
+            "submissions_unresolved": self.submissions_unresolved
+        }
+        if output is not None:
+            state["format"] = output.output_format
+            state["output_offset"] = output.sync()
+        if self.dump_type == "media":
+            state["download_fails"] = self.download_fails
+            state["resolved"] = [SubmissionRL.to_json(submission) for submission
+                                 in itertools.chain(pending, self.resolved)]
+        self.checkpoint.save(state)
+        self.is_changed = False
+
+    async def save_async(self, iterator_state, pending=(), output=None):
+        """Async counterpart of save, file syncs are done by default executor
+        instead of event loop."""
+        if self.is_changed:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.save, iterator_state, list(pending), output)
+
+
+class URLOutput:
+    """Output of URLs dump
+
+    Records are written as JSON Lines as soon as submissions are resolved:
+    into output file in jsonl format, into <output path>.part in json
+    format, which is turned into json array when dump is finished.
+    Records written after offset saved in checkpoint are dropped on resume.
+
+    Args:
+        outfile_path (str).
+
+        output_format (str): "jsonl" or "json".
+
+        offset (int): offset of records to continue from, None to start
+        new output.
+
+    Attributes:
+        outfile_path (str).
+
+        output_format (str).
+
+        records_path (str): path of JSON Lines records.
+
+        records_file (file).
+    """
+
+    def __init__(self, outfile_path, output_format, offset=None):
+        self.outfile_path = outfile_path
+        self.output_format = output_format
+        self.records_path = (outfile_path if output_format == "jsonl"
+                             else outfile_path + ".part")
+        if offset is None:
+            self.records_file = open(self.records_path, "w")
+            return
+
+        self.records_file = open(self.records_path, "r+")
+        if offset > os.path.getsize(self.records_path):
+            # file lost it's unsynced tail, keep complete records only
+            offset = self.records_file.read().rfind("\n") + 1
+        # drop records written after checkpoint was saved
+        self.records_file.seek(offset)
+        self.records_file.truncate()
+
+    def write(self, submission):
+        self.records_file.write(json.dumps(SubmissionRL.to_json(submission)) + "\n")
+        self.records_file.flush()
+
+    def sync(self):
+        """
+        Returns:
+            int: offset of records end, records before it are durable.
+        """
+        self.records_file.flush()
+        os.fsync(self.records_file.fileno())
+        return self.records_file.tell()
+
+    def finish(self):
+        """Close records, write json array in json format."""
+        self.records_file.close()
+        if self.output_format != "json":
+            return
+
+        with open(self.records_path) as records_file:
+            submissions = [json.loads(line) for line in records_file]
+        with open(self.outfile_path, "w") as outfile:
+            json.dump(submissions, outfile, indent=2)
+        os.remove(self.records_path)
+
+    def close(self):
+        self.records_file.close()
+
+
+def print_causes(error):
+    """Naive helper function used to traceback exception cause"""
+    print("Error", type(error).__name__, "caused by:")
+    error = error.__cause__
+    while error is not None:
+        print("^", type(error).__name__, error)
+        error = error.__cause__
+
+
+def load_url_state(checkpoint, subreddit_name, outfile_path, output_format):
+    """
+    Load state of interrupted URLs dump.
+
+    Returns:
+        dict: saved state if it may be resumed, None otherwise.
+    """
+    state = checkpoint.load("url", subreddit_name)
+    if state is not None and state.get("format") != output_format:
+        print(f"Checkpoint {checkpoint.path} belongs to {state.get('format')} dump")
+        return None
+
+    records_path = outfile_path if output_format == "jsonl" else outfile_path + ".part"
+    if state is not None and not os.path.exists(records_path):
+        print(f"No output file {records_path} to resume")
+        return None
+
+    return state
+
+
+def dump_urls(subreddit_name, count, outfile_path=None, resolve_workers=None,
+              resume=False, output_format="jsonl", resolve_cache=None, probe=False):
+    """
+    Save URLs related to submitted media files into JSON Lines or json file.
+    JSON Lines file gets record per submission as soon as it is resolved,
+    so partial output of interrupted dump is valid. In json format records
+    are collected in <outfile_path>.part and json array is written when
+    dump is finished.
+
+    Note: failed attempts to obtain direct URLs of media files
+    from submitted URLs count separately in total as number of
+    unresolved submissions. If the number exceeds a threshold,
+    initially 2 * <given count of submissions>, traverse stops
+    and given subreddit may be assumed to have to many text
+    submissions or submitted indirect URLs mostly point to
+    resources different from known: imgur.com, gfycat.com.
+    Full list of known resources is defined by resolvers used.
+
+    Progress is saved into checkpoint file <outfile_path>.checkpoint
+    before each submission, the file is removed when dump is finished.
+
+    Args:
+        subreddit_name (str): subreddit to scrape.
+
+        count (int): count of submissions to dump, failures
+        don't count.
+
+        outfile_path (str): extension is not required. If not specified
+        everything is saved into <subreddit_name>.<output_format>.
+
+        resolve_workers (int): count of concurrent resolve workers,
+        None to resolve serially.
+
+        resume (bool): continue interrupted dump from checkpoint if any.
+
+        output_format (str): "jsonl" (default) or "json".
+
+        resolve_cache (resolve_cache.ResolveCache): cache of resolutions.
+
+        probe (bool): check direct URLs by probe requests.
+    """
+    if count <= 0:
+        print(f"Submissions count must be > 0, given {count}")
+        return
+
+    if outfile_path is None:
+        outfile_path = subreddit_name + "." + output_format
+
+    checkpoint = Checkpoint(outfile_path + ".checkpoint")
+    state = load_url_state(checkpoint, subreddit_name, outfile_path,
+                           output_format) if resume else None
+    image_extensions = ("jpg", "jpeg", "png", "webp", "gif")
+    video_extensions = ("mp4", "webm")
+    submission_iterator = SubmissionIterator(
+        subreddit_name,
+        image_extensions,
+        video_extensions,
+        resolve_workers=resolve_workers,
+        state=state["iterator"] if state is not None else None,
+        resolve_cache=resolve_cache,
+        probe=probe
+    )
+    progress = DumpProgress(checkpoint, "url", subreddit_name, count, state)
+    output = URLOutput(outfile_path, output_format,
+                       state["output_offset"] if state is not None else None)
+    try:
+        while progress.submissions_left > 0:
+            progress.save(submission_iterator.get_state(), output=output)
+            progress.report()
+            try:
+                submitted_media_rl = next(submission_iterator)
+                if submitted_media_rl is None:
+                    print("Unexpected None submission")
+                    continue
+            except StopIteration as error:
+                print_causes(error)
+                break
+            except SubmissionResolver.MediaIsUnavailable as error:
+                if progress.add_unresolved(error):
+                    break
+                continue
+
+            output.write(submitted_media_rl)
+            progress.add_dumped()
+        submission_iterator.close()
+        output.finish()
+    finally:
+        output.close()
+    checkpoint.remove()
+
+
+def collect_downloads(downloads, progress, return_when, timeout=None):
+    """
+    Wait for downloads submitted to SubmissionDownloader in parallel mode
+    and count their results.
+
+    Args:
+        downloads (dict): key (concurrent.futures.Future) - download result,
+        value (SubmissionRL) - submission. Completed downloads are removed.
+
+        progress (DumpProgress): counters of results.
+
+        return_when (str): concurrent.futures.FIRST_COMPLETED or ALL_COMPLETED.
+
+        timeout (float): maximal waiting time, None to wait without limit.
+
+    Returns:
+        bool: True if dump must stop.
+    """
+    done, _ = concurrent.futures.wait(downloads, timeout=timeout,
+                                      return_when=return_when)
+    return progress.add_results(downloads, done)
+
+
+def download_submissions(subreddit_name, count, outdir_path=None, resolve_workers=None,
+                         download_workers=None, resume=False, resolve_cache=None,
+                         media_store=None, duplicate_detector=None, probe=False,
+                         download_filter=None, http_cache=None):
+    """
+    Download media files submitted in hot section of given subreddit.
+
+    Note: fails count separately. Threshold of total number of failed
+    attempts to obtain direct URLs of media files from submitted indirect
+    URLs is initially equal to 2 * <given count of submissions>.
+    Threshold of total number of download fails is initially equal to
+    <given count of submissions> // 2. Submissions rejected by download
+    filter count as unresolved ones.
+
+    Progress is saved into checkpoint file <outdir_path>/.checkpoint
+    after each resolve and download, the file is removed when dump is finished.
+    Resolved submissions which weren't downloaded are downloaded first
+    on resume. URLs of finished downloads are recorded in
+    <outdir_path>/.checkpoint.log at once, so downloads finished right
+    before interruption aren't requested again.
+
+    Args:
+        subreddit (str).
+
+        count (int): count of submitted media files to download.
+
+        outdir_path (str): target directory. If None try to create
+        directory with subreddit name.
+
+        resolve_workers (int): count of concurrent resolve workers,
+        None to resolve serially.
+
+        download_workers (int): count of parallel download workers, None
+        to download serially. Resolved submissions are fed to downloader
+        while previous downloads are running.
+
+        resume (bool): continue interrupted dump from checkpoint if any.
+
+        resolve_cache (resolve_cache.ResolveCache): cache of resolutions.
+
+        media_store (media_store.MediaStore): content-addressed store of
+        downloaded files, None to save files into target directory.
+
+        duplicate_detector (near_duplicates.NearDuplicateDetector): detector
+        of near-duplicate images, None to keep all images.
+
+        probe (bool): check direct URLs by probe requests, so extensionless
+        URLs are downloaded and mislabelled files are skipped.
+
+        download_filter (download_filter.DownloadFilter): limits size, type
+        and duration of downloaded files, None to download all.
+
+        http_cache (http_cache.HTTPCache): cache of media files shared with
+        quick_peek, None to download without cache.
+    """
+    if count <= 0:
+        print(f"Submissions count must be > 0, given {count}")
+        return
+
+    if outdir_path is None:
         outdir_path = subreddit_name
 
+    submission_downloader = SubmissionDownloader(outdir_path, download_workers,
+                                                 media_store=media_store,
+                                                 duplicate_detector=duplicate_detector,
+                                                 download_filter=download_filter,
+                                                 http_cache=http_cache)
+    checkpoint = Checkpoint(os.path.join(outdir_path, ".checkpoint"))
+    state = checkpoint.load("media", subreddit_name) if resume else None
     image_extensions = ("jpg", "jpeg", "png", "gif", "webp")
     video_extensions = ("mp4", "webm")
-    submission_iterator = SubmissionIterator(subreddit_name,
-                                             image_extensions,
-                                             video_extensions)
-    submission_downloader = SubmissionDownloader(outdir_path)
-    submissions_left = count
-    submissions_unresolved = 0
-    MAX_UNRESOLVED = 2 * count
-    download_fails = 0
-    MAX_DOWNLOAD_FAILS = count // 2
-    while submissions_left > 0:
-        print(f"To go: {submissions_left}",
-              f"Unresolved: {submissions_unresolved}",
-              f"Download fails: {download_fails}")
-        try:
-            submitted_media_rl = next(submission_iterator)
-            if submitted_media_rl is None:
-                print("Unexpected None submission")
-                continue
-        except StopIteration as error:
-            print_causes(error)
+    submission_iterator = SubmissionIterator(
+        subreddit_name,
+        image_extensions,
+        video_extensions,
+        resolve_workers=resolve_workers,
+        state=state["iterator"] if state is not None else None,
+        resolve_cache=resolve_cache,
+        probe=probe
+    )
+    progress = DumpProgress(checkpoint, "media", subreddit_name, count, state)
+    downloads = dict()
+    while progress.submissions_left > 0:
+        # wait only if enough downloads are running
+        if downloads and collect_downloads(
+                downloads, progress, concurrent.futures.FIRST_COMPLETED,
+                timeout=None if len(downloads) >= progress.submissions_left else 0):
             break
-        except SubmissionResolver.MediaIsUnavailable as error:
-            print(error)
-            submissions_unresolved += 1
-            if submissions_unresolved < MAX_UNRESOLVED:
+        progress.add_skipped(submission_downloader.take_skipped())
+        progress.save(submission_iterator.get_state(), downloads.values())
+        if len(downloads) >= progress.submissions_left:
+            continue
+
+        if not progress.resolved:
+            progress.report()
+            try:
+                submitted_media_rl = next(submission_iterator)
+                if submitted_media_rl is None:
+                    print("Unexpected None submission")
+                    continue
+            except StopIteration as error:
+                print_causes(error)
+                break
+            except SubmissionResolver.MediaIsUnavailable as error:
+                if progress.add_unresolved(error):
+                    break
                 continue
-            print("Break: too many unresolved submissions")
-            break
 
+            progress.add_resolved(submitted_media_rl)
+            continue
+
+        submitted_media_rl = progress.resolved.popleft()
         print(f"Try download {submitted_media_rl.url}")
-        if submission_downloader.download(submitted_media_rl):
-            print("->Downloaded")
-            submissions_left -= 1
-        else:
-            print("->Failed to download")
-            download_fails += 1
-            if download_fails >= MAX_DOWNLOAD_FAILS:
-                print("Too many failed downloads")
+        if download_workers:
+            download = submission_downloader.submit(submitted_media_rl)
+            download.add_done_callback(
+                functools.partial(progress.record_download, submitted_media_rl))
+            downloads[download] = submitted_media_rl
+            continue
+
+        try:
+            is_downloaded = submission_downloader.download(submitted_media_rl)
+        except DownloadFilter.MediaIsFiltered as error:
+            if progress.add_unresolved(f"->{error}"):
+                break
+            continue
+
+        if progress.add_download(submitted_media_rl, is_downloaded):
+            break
+    submission_iterator.close()
+    if downloads and progress.download_fails < progress.max_download_fails:
+        collect_downloads(downloads, progress, concurrent.futures.ALL_COMPLETED)
+    submission_downloader.close()
+    checkpoint.remove()
+
+
+def parse_size(size):
+    """
+    Args:
+        size (str): count of bytes with optional K, M or G suffix,
+        e.g. 200M.
+
+    Returns:
+        int: count of bytes.
+
+    Raises:
+        ValueError: invalid size.
+    """
+    multipliers = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    size = size.strip().upper().rstrip("B")
+    multiplier = multipliers.get(size[-1:], 1)
+    if multiplier != 1:
+        size = size[:-1]
+    return int(float(size) * multiplier)
+
+
+def read_subreddit_names(path):
+    """
+    Read subreddit names from file, one per line. Blank lines and lines
+    starting with # are skipped, r/ prefix is stripped.
+
+    Args:
+        path (str).
+
+    Returns:
+        list of str.
+    """
+    names = []
+    with open(path) as names_file:
+        for line in names_file:
+            name = line.strip()
+            if not name or name.startswith("#"):
+                continue
+            if name.startswith(("r/", "/r/")):
+                name = name.split("r/", maxsplit=1)[1]
+            names.append(name.strip("/"))
+    return names
+
+
+async def dump_urls_async(engine, subreddit_name, count, outfile_path, resume=False,
+                          output_format="jsonl"):
+    """
+    Async counterpart of dump_urls, submissions are resolved by engine.
+    Checkpoint is compatible with the one of dump_urls.
+
+    Args:
+        engine (async_engine.CrawlEngine): entered engine.
+
+        subreddit_name (str).
+
+        count (int): see dump_urls.
+
+        outfile_path (str): output file.
+
+        resume (bool): continue interrupted dump from checkpoint if any.
+
+        output_format (str): "jsonl" or "json".
+    """
+    checkpoint = Checkpoint(outfile_path + ".checkpoint")
+    state = load_url_state(checkpoint, subreddit_name, outfile_path,
+                           output_format) if resume else None
+    submission_iterator = engine.submissions(
+        subreddit_name, state["iterator"] if state is not None else None)
+    progress = DumpProgress(checkpoint, "url", subreddit_name, count, state,
+                            prefix=f"r/{subreddit_name}: ")
+    output = URLOutput(outfile_path, output_format,
+                       state["output_offset"] if state is not None else None)
+    try:
+        while progress.submissions_left > 0:
+            await progress.save_async(submission_iterator.get_state(), output=output)
+            try:
+                submitted_media_rl = await submission_iterator.__anext__()
+            except StopAsyncIteration as error:
+                print(f"r/{subreddit_name}:", end=" ")
+                print_causes(error)
                 break
+            except SubmissionResolver.MediaIsUnavailable as error:
+                if progress.add_unresolved(error):
+                    break
+                continue
+
+            output.write(submitted_media_rl)
+            progress.add_dumped()
+        submission_iterator.close()
+        output.finish()
+    finally:
+        output.close()
+    checkpoint.remove()
+    print(f"r/{subreddit_name}: dumped {count - progress.submissions_left} submissions"
+          f" into {outfile_path}")
+
+
+async def download_submissions_async(engine, subreddit_name, count, outdir_path,
+                                     resume=False, download_workers=None,
+                                     media_store=None, duplicate_detector=None,
+                                     download_filter=None):
+    """
+    Async counterpart of download_submissions, submissions are resolved
+    and downloaded by engine. Checkpoint is compatible with the one of
+    download_submissions. Partial downloads are not resumed.
+
+    Args:
+        engine (async_engine.CrawlEngine): entered engine.
+
+        subreddit_name (str).
+
+        count (int): count of submitted media files to download.
+
+        outdir_path (str): target directory.
+
+        resume (bool): continue interrupted dump from checkpoint if any.
+
+        download_workers (int): maximal count of simultaneous downloads
+        of the subreddit, 1 if None.
+
+        media_store (media_store.MediaStore): content-addressed store.
+
+        duplicate_detector (near_duplicates.NearDuplicateDetector): detector
+        of near-duplicate images.
+
+        download_filter (download_filter.DownloadFilter): filter of
+        downloaded files.
+    """
+    submission_downloader = engine.downloader(outdir_path, media_store,
+                                              duplicate_detector, download_filter)
+    checkpoint = Checkpoint(os.path.join(outdir_path, ".checkpoint"))
+    state = checkpoint.load("media", subreddit_name) if resume else None
+    submission_iterator = engine.submissions(
+        subreddit_name, state["iterator"] if state is not None else None)
+    max_downloads = download_workers or 1
+    progress = DumpProgress(checkpoint, "media", subreddit_name, count, state,
+                            prefix=f"r/{subreddit_name}: ")
+    downloads = dict()
+    while progress.submissions_left > 0:
+        is_window_full = len(downloads) >= min(progress.submissions_left, max_downloads)
+        if downloads:
+            done, _ = await asyncio.wait(downloads, timeout=None if is_window_full else 0,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if progress.add_results(downloads, done):
+                break
+            is_window_full = len(downloads) >= min(progress.submissions_left, max_downloads)
+        if progress.add_skipped(submission_downloader.take_skipped()):
+            is_window_full = len(downloads) >= min(progress.submissions_left, max_downloads)
+        await progress.save_async(submission_iterator.get_state(), downloads.values())
+        if is_window_full:
+            continue
+
+        if not progress.resolved:
+            try:
+                progress.add_resolved(await submission_iterator.__anext__())
+            except StopAsyncIteration as error:
+                print(f"r/{subreddit_name}:", end=" ")
+                print_causes(error)
+                break
+            except SubmissionResolver.MediaIsUnavailable as error:
+                if progress.add_unresolved(error):
+                    break
+            continue
+
+        submitted_media_rl = progress.resolved.popleft()
+        download = asyncio.ensure_future(submission_downloader.download(submitted_media_rl))
+        download.add_done_callback(
+            functools.partial(progress.record_download, submitted_media_rl))
+        downloads[download] = submitted_media_rl
+    submission_iterator.close()
+    if downloads and progress.download_fails < progress.max_download_fails:
+        await asyncio.wait(downloads)
+    for task in downloads:
+        task.cancel()
+    checkpoint.remove()
+    print(f"r/{subreddit_name}: downloaded {count - progress.submissions_left} files"
+          f" into {outdir_path}")
+
+
+async def dump_subreddits_async(subreddit_names, dump_type, count, outdir_path,
+                                resume, output_format, resolve_cache,
+                                resolve_workers, download_workers, max_crawls,
+                                media_store, duplicate_detector, probe,
+                                download_filter):
+    """Crawl subreddits by one engine. See dump_subreddits."""
+    async with CrawlEngine(resolve_cache=resolve_cache, probe=probe) as engine:
+        if resolve_workers:
+            engine.RESOLVE_WINDOW = 4 * resolve_workers
+        crawl_slots = asyncio.Semaphore(max_crawls or len(subreddit_names))
+
+        async def crawl(subreddit_name):
+            async with crawl_slots:
+                if dump_type == "url":
+                    await dump_urls_async(
+                        engine, subreddit_name, count,
+                        os.path.join(outdir_path, subreddit_name + "." + output_format),
+                        resume, output_format)
+                else:
+                    await download_submissions_async(
+                        engine, subreddit_name, count,
+                        os.path.join(outdir_path, subreddit_name),
+                        resume, download_workers, media_store, duplicate_detector,
+                        download_filter)
+
+        results = await asyncio.gather(*(crawl(name) for name in subreddit_names),
+                                       return_exceptions=True)
+    for subreddit_name, result in zip(subreddit_names, results):
+        if isinstance(result, Exception):
+            print(f"r/{subreddit_name}: dump failed, {type(result).__name__} {result}")
+
+
+def dump_subreddits(subreddit_names, dump_type, count, outdir_path=None, resume=False,
+                    output_format="jsonl", resolve_cache=None, resolve_workers=None,
+                    download_workers=None, max_crawls=None, media_store=None,
+                    duplicate_detector=None, probe=False, download_filter=None):
+    """
+    Dump several subreddits concurrently in one thread by asyncio crawl
+    engine. Crawls share HTTP connection pool, per-host rate limiter
+    and resolve cache, so throughput grows with count of subreddits up to
+    request budget of old.reddit.com. Failure of a crawl doesn't stop others.
+
+    Args:
+        subreddit_names (list of str).
+
+        dump_type (str): "url" or "media".
+
+        count (int): count of submissions per subreddit, see dump_urls
+        and download_submissions.
+
+        outdir_path (str): directory of outputs: <subreddit name>.<format>
+        files for URLs, <subreddit name> directories for media. Current
+        directory if None.
+
+        resume (bool): continue interrupted dumps from their checkpoints.
+
+        output_format (str): format of URLs dump, "jsonl" or "json".
+
+        resolve_cache (resolve_cache.ResolveCache): cache of resolutions.
+
+        resolve_workers (int): resolve window of each crawl is 4 times as
+        large, 8 submissions if None.
+
+        download_workers (int): simultaneous downloads of each crawl, 1 if None.
+
+        max_crawls (int): maximal count of simultaneous crawls, all if None.
+
+        media_store (media_store.MediaStore): content-addressed store shared
+        by media dumps, so media reposted in several subreddits is kept once.
+
+        duplicate_detector (near_duplicates.NearDuplicateDetector): detector
+        of near-duplicate images shared by media dumps.
+
+        probe (bool): check direct URLs by probe requests.
+
+        download_filter (download_filter.DownloadFilter): filter of files
+        downloaded by media dumps.
+    """
+    if CrawlEngine is None:
+        print("Concurrent dump of several subreddits requires aiohttp")
+        return
+
+    if count <= 0:
+        print(f"Submissions count must be > 0, given {count}")
+        return
+
+    if outdir_path is None:
+        outdir_path = os.curdir
+    if not os.path.exists(outdir_path):
+        os.makedirs(outdir_path)
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(dump_subreddits_async(
+            subreddit_names, dump_type, count, outdir_path, resume, output_format,
+            resolve_cache, resolve_workers, download_workers, max_crawls,
+            media_store, duplicate_detector, probe, download_filter))
+    finally:
+        loop.close()
 
 
 def main():
@@ -420,31 +1977,235 @@ def main():
         choices=['media', 'url'],
         help="""Type of submission related information to dump.
              media -- submitted media files.
-             url -- submission related URLs (as json): direct URL of submitted media,
-                    extra direct URL of preview if any, HTTP referer to submitted media.
+             url -- submission related URLs (as JSON Lines or json): direct URL of
+                    submitted media, extra direct URL of preview if any, HTTP referer
+                    to submitted media.
              """
     )
-    parser.add_argument('subreddit', help="Name of target subreddit.")
-    parser.add_argument('count', type=int, help="Count of submissions.")
+    parser.add_argument(
+        'subreddits',
+        nargs='*',
+        help="Names of target subreddits. Several subreddits are dumped"
+             " concurrently, this requires aiohttp."
+    )
+    parser.add_argument('count', type=int, help="Count of submissions per subreddit.")
+    parser.add_argument(
+        '-f',
+        dest='subreddits_file',
+        help="File with names of target subreddits, one per line."
+    )
     parser.add_argument(
         '-o',
         dest='path',
         help="""Dump destination.
              For URLs -- output file, if not specified data is saved into
-             ./<subreddit name>.json.
+             ./<subreddit name>.<format>.
              For media -- output directory, if not specified media files
              are saved into ./<subreddit name>/.
+             For several subreddits -- directory of outputs named as above,
+             current directory if not specified.
           """
     )
+    parser.add_argument(
+        '-j',
+        dest='resolve_workers',
+        type=int,
+        help="Count of workers resolving imgur.com, gfycat.com submissions"
+             " concurrently. If not specified submissions are resolved serially."
+    )
+    parser.add_argument(
+        '-d',
+        dest='download_workers',
+        type=int,
+        help="Count of parallel download workers for media."
+             " If not specified media files are downloaded serially."
+    )
+    parser.add_argument(
+        '--format',
+        dest='output_format',
+        choices=['jsonl', 'json'],
+        default='jsonl',
+        help="Format of URLs dump: jsonl -- record per line written as soon as"
+             " submission is resolved (default), json -- array written at the end."
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help="Continue interrupted dump from it's checkpoint: <output file>.checkpoint"
+             " for URLs, <output directory>/.checkpoint for media."
+    )
+    parser.add_argument(
+        '--resolve-cache',
+        dest='resolve_cache_path',
+        help=f"Resolve cache file shared with quick_peek, {DEFAULT_CACHE_PATH}"
+             " by default."
+    )
+    parser.add_argument(
+        '--no-resolve-cache',
+        action='store_true',
+        help="Resolve every submission without resolve cache."
+    )
+    parser.add_argument(
+        '--probe',
+        action='store_true',
+        help="Check direct URLs by requesting first bytes of files instead of"
+             " trusting their extensions: extensionless URLs are accepted,"
+             " mislabelled files are skipped."
+    )
+    parser.add_argument(
+        '--store',
+        dest='store_path',
+        help="Keep downloaded media in content-addressed store at given directory,"
+             " each distinct file is stored once. Output directories get hard links"
+             " (symbolic links if hard ones are impossible). URLs downloaded before"
+             " are not requested again."
+    )
+    parser.add_argument(
+        '--http-cache',
+        dest='http_cache_path',
+        help=f"HTTP cache of media files shared with quick_peek, {DEFAULT_HTTP_CACHE_PATH}"
+             " by default. Is used only by media dump of single subreddit."
+    )
+    parser.add_argument(
+        '--http-cache-size',
+        help="Size limit of HTTP cache, e.g. 2G. 1G by default."
+    )
+    parser.add_argument(
+        '--no-http-cache',
+        action='store_true',
+        help="Download every media file without HTTP cache."
+    )
+    parser.add_argument(
+        '--near-duplicates',
+        choices=['record', 'skip'],
+        help="Find near-duplicate images by perceptual hash, requires Pillow."
+             " Near-duplicates are recorded in index or also removed (skip)."
+    )
+    parser.add_argument(
+        '--near-duplicates-index',
+        dest='near_duplicates_index_path',
+        help=f"Index of image hashes, {DEFAULT_INDEX_PATH} by default."
+    )
+    parser.add_argument(
+        '--min-size',
+        help="Skip media files smaller than given size, e.g. 20K."
+    )
+    parser.add_argument(
+        '--max-size',
+        help="Skip media files larger than given size, e.g. 200M."
+    )
+    parser.add_argument(
+        '--mime',
+        dest='mime_types',
+        action='append',
+        metavar='TYPE',
+        help="Allowed MIME type of media files, e.g. image/jpeg or video/*,"
+             " may be repeated. Any type by default."
+    )
+    parser.add_argument(
+        '--max-duration',
+        type=float,
+        help="Skip videos longer than given count of seconds, if duration"
+             " is stored in front of file."
+    )
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help="Print bytes of fetched pages per host when dump is finished:"
+             " received over the wire and decoded."
+    )
+    parser.add_argument(
+        '--max-crawls',
+        type=int,
+        help="Maximal count of subreddits dumped at once, all by default."
+    )
+    parser.add_argument(
+        '--rate',
+        dest='rates',
+        action='append',
+        default=[],
+        metavar='HOST=RATE[:BURST]',
+        help="Requests per second and burst allowed for host, may be repeated."
+             " By default 0.5 for old.reddit.com and 1 for other hosts, burst 1."
+    )
     args = parser.parse_args()
-    if args.type == "url":
-        dump_urls(args.subreddit, args.count, args.path)
-    elif args.type == "media":
-        download_submissions(args.subreddit, args.count, args.path)
-    else:
-        print(f"Unexpected type: {args.type}")
-        parser.print_help()
-        return
+    for host_rate in args.rates:
+        try:
+            host, rate = host_rate.split("=")
+            rate, _, burst = rate.partition(":")
+            rate = float(rate)
+            burst = int(burst) if burst else None
+        except ValueError:
+            parser.error(f"Invalid rate: {host_rate}")
+        if not rate > 0:
+            parser.error(f"Rate must be > 0: {host_rate}")
+        if burst is not None and burst < 1:
+            parser.error(f"Burst must be >= 1: {host_rate}")
+        DEFAULT_LIMITER.set_rate(host, rate, burst)
+    subreddit_names = list(args.subreddits)
+    if args.subreddits_file is not None:
+        try:
+            subreddit_names.extend(read_subreddit_names(args.subreddits_file))
+        except OSError as error:
+            parser.error(f"Failed to read {args.subreddits_file}: {error}")
+    try:
+        min_size = parse_size(args.min_size) if args.min_size is not None else None
+        max_size = parse_size(args.max_size) if args.max_size is not None else None
+        http_cache_size = (parse_size(args.http_cache_size)
+                           if args.http_cache_size is not None else None)
+    except ValueError:
+        parser.error(f"Invalid size: {args.min_size}, {args.max_size}, {args.http_cache_size}")
+    download_filter = None
+    if (min_size, max_size, args.mime_types, args.max_duration) != (None,) * 4:
+        download_filter = DownloadFilter(min_size, max_size, args.mime_types,
+                                         args.max_duration)
+    # keep order, drop repeated names
+    subreddit_names = list(dict.fromkeys(subreddit_names))
+    if not subreddit_names:
+        parser.error("No subreddits given")
+    if len(subreddit_names) > 1 and (args.http_cache_path is not None
+                                     or args.http_cache_size is not None):
+        parser.error("--http-cache and --http-cache-size are used only by media dump"
+                     " of single subreddit")
+    resolve_cache = (None if args.no_resolve_cache
+                     else ResolveCache(args.resolve_cache_path))
+    media_store = (MediaStore(args.store_path)
+                   if args.store_path is not None and args.type == "media" else None)
+    http_cache = (HTTPCache(args.http_cache_path, http_cache_size)
+                  if not args.no_http_cache and args.type == "media"
+                  and len(subreddit_names) == 1 else None)
+    duplicate_detector = None
+    if args.near_duplicates is not None and args.type == "media":
+        try:
+            duplicate_detector = NearDuplicateDetector(
+                args.near_duplicates_index_path, skip=args.near_duplicates == "skip")
+        except RuntimeError as error:
+            parser.error(str(error))
+    try:
+        if len(subreddit_names) > 1:
+            dump_subreddits(subreddit_names, args.type, args.count, args.path, args.resume,
+                            args.output_format, resolve_cache, args.resolve_workers,
+                            args.download_workers, args.max_crawls, media_store,
+                            duplicate_detector, args.probe, download_filter)
+        elif args.type == "url":
+            dump_urls(subreddit_names[0], args.count, args.path, args.resolve_workers,
+                      args.resume, args.output_format, resolve_cache, args.probe)
+        elif args.type == "media":
+            download_submissions(subreddit_names[0], args.count, args.path,
+                                 args.resolve_workers, args.download_workers,
+                                 args.resume, resolve_cache, media_store,
+                                 duplicate_detector, args.probe, download_filter,
+                                 http_cache)
+        else:
+            print(f"Unexpected type: {args.type}")
+            parser.print_help()
+            return
+    finally:
+        if duplicate_detector is not None:
+            # wait for images being hashed
+            duplicate_detector.close()
+        if args.stats:
+            print(DEFAULT_COUNTER.report())
 
 
 if __name__ == "__main__":
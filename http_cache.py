@@ -0,0 +1,419 @@
+"""Persistent HTTP cache of media files shared by viewer and dump script"""
+
+import collections
+import email.utils
+import hashlib
+import mmap
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "quick-peek", "http")
+
+CacheEntry = collections.namedtuple(
+    "CacheEntry", ("url", "path", "size", "expires", "etag", "last_modified", "content_type"))
+""" Cached response
+
+Attributes:
+    url (str): requested URL.
+
+    path (str): path of file with response content.
+
+    size (int): size of content.
+
+    expires (float): time since epoch until which entry is fresh.
+
+    etag (str): ETag of response, may be None.
+
+    last_modified (str): Last-Modified of response, may be None.
+
+    content_type (str): Content-Type of response, may be None.
+"""
+
+
+def parse_cache_control(value):
+    """
+    Args:
+        value (str): Cache-Control header, may be None.
+
+    Returns:
+        dict: lowercase directive to it's argument, None if it has no argument.
+    """
+    directives = {}
+    if not value:
+        return directives
+
+    for directive in value.split(","):
+        name, _, argument = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') if argument else None
+    return directives
+
+
+def parse_http_date(value):
+    """
+    Returns:
+        float: time since epoch of HTTP date, None if it is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+class HTTPCache:
+    """Disk cache of media responses keyed by URL
+
+    Content of each response is kept in file <path>/<first 2 hex digits>/<sha256 of URL>,
+    index <path>/index.sqlite3 keeps freshness and validators of responses.
+    Freshness follows Cache-Control: responses with no-store are not kept,
+    max-age (less Age) or Expires give lifetime, no-cache makes entry stale
+    at once. Without them lifetime is HEURISTIC_FRACTION of time since
+    Last-Modified, at most MAX_HEURISTIC_LIFETIME. Fresh entries are served
+    without requests, stale ones are revalidated by conditional requests
+    with If-None-Match and If-Modified-Since, see conditional_headers.
+    Responses which may be neither fresh nor revalidated are not kept.
+    If total size of files exceeds max_size least recently used entries
+    are evicted.
+    Cached files are read by memory mapping, so content is not copied
+    through intermediate buffers.
+    Cache directory may be shared by several processes, instance may be
+    shared by several threads.
+
+    Args:
+        path (str): cache directory, created if needed. If not specified
+        DEFAULT_CACHE_PATH is used.
+
+        max_size (int): maximal total size of cached files in bytes,
+        MAX_SIZE if None.
+
+    Class attributes:
+        MAX_SIZE (int): default size limit, 1GiB.
+
+        HEURISTIC_FRACTION (float): fraction of age of response used as
+        it's lifetime if it has no explicit one.
+
+        MAX_HEURISTIC_LIFETIME (int): 7 days.
+
+    Attributes:
+        path (str).
+
+        max_size (int).
+
+        connection (sqlite3.Connection): autocommit connection to index.
+
+        lock (threading.Lock): guards connection.
+    """
+
+    MAX_SIZE = 1024 ** 3
+    HEURISTIC_FRACTION = 0.1
+    MAX_HEURISTIC_LIFETIME = 7 * 24 * 3600
+
+    def __init__(self, path=None, max_size=None):
+        if path is None:
+            path = DEFAULT_CACHE_PATH
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.max_size = max_size if max_size is not None else self.MAX_SIZE
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(path, "index.sqlite3"),
+                                          timeout=10, isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " url TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " expires REAL NOT NULL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " content_type TEXT,"
+            " accessed REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def file_path(self, url):
+        """
+        Returns:
+            str: path of file with cached content of URL.
+        """
+        url_hash = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.path, url_hash[:2], url_hash)
+
+    def lookup(self, url):
+        """
+        Args:
+            url (str): requested URL.
+
+        Returns:
+            CacheEntry: fresh or stale entry of URL, None if URL is not cached.
+        """
+        try:
+            with self.lock:
+                row = self.connection.execute(
+                    "SELECT size, expires, etag, last_modified, content_type"
+                    " FROM entries WHERE url = ?", (url,)).fetchone()
+                if row is not None:
+                    self.connection.execute(
+                        "UPDATE entries SET accessed = ? WHERE url = ?", (time.time(), url))
+        except sqlite3.Error as error:
+            print(f"HTTP cache error: {error}")
+            return None
+
+        if row is None:
+            return None
+
+        entry = CacheEntry(url, self.file_path(url), *row)
+        if not os.path.exists(entry.path):
+            self.remove(url)
+            return None
+        return entry
+
+    @staticmethod
+    def is_fresh(entry):
+        return entry.expires > time.time()
+
+    @staticmethod
+    def conditional_headers(entry):
+        """
+        Returns:
+            dict: headers revalidating stale entry, empty if it has no validators.
+        """
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.etag is not None:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified is not None:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def expiry(self, headers):
+        """
+        Args:
+            headers (Mapping): response headers.
+
+        Returns:
+            float: time since epoch until which response is fresh, None if
+            it must not be stored.
+        """
+        cache_control = parse_cache_control(headers.get("Cache-Control"))
+        if "no-store" in cache_control or headers.get("Vary", "").strip() == "*":
+            return None
+
+        now = time.time()
+        if "no-cache" in cache_control:
+            return now
+
+        try:
+            age = max(0, int(headers.get("Age", 0)))
+        except ValueError:
+            age = 0
+        date = parse_http_date(headers.get("Date")) or now
+        try:
+            if "max-age" in cache_control:
+                return now + int(cache_control["max-age"]) - age
+        except (TypeError, ValueError):
+            return now
+
+        if "Expires" in headers:
+            expires = parse_http_date(headers["Expires"])
+            # invalid date means already expired
+            return now + expires - date - age if expires is not None else now
+
+        last_modified = parse_http_date(headers.get("Last-Modified"))
+        if last_modified is not None and last_modified < date:
+            lifetime = min(self.HEURISTIC_FRACTION * (date - last_modified),
+                           self.MAX_HEURISTIC_LIFETIME)
+            return now + lifetime - age
+        return now
+
+    def store_content(self, url, headers, content):
+        """
+        Store content of response if it may be reused.
+
+        Args:
+            url (str): requested URL.
+
+            headers (Mapping): headers of response with status 200.
+
+            content (bytes).
+
+        Returns:
+            CacheEntry: stored entry, None if response is not stored.
+        """
+        return self.__store(url, headers, len(content),
+                            lambda temp_path: self.__write(temp_path, content))
+
+    def store_file(self, url, headers, file_path):
+        """
+        Store downloaded file if response may be reused. Cache keeps it's own
+        copy of the file, so later changes of downloaded file don't alter
+        entry which may be served without revalidation.
+
+        Args:
+            url (str): requested URL.
+
+            headers (Mapping): headers of response with status 200 or 206 if
+            file is completed.
+
+            file_path (str): path of downloaded file.
+
+        Returns:
+            CacheEntry: stored entry, None if response is not stored.
+        """
+        return self.__store(url, headers, os.path.getsize(file_path),
+                            lambda temp_path: shutil.copyfile(file_path, temp_path))
+
+    def refresh(self, entry, headers):
+        """
+        Update freshness and validators of revalidated entry.
+
+        Args:
+            entry (CacheEntry).
+
+            headers (Mapping): headers of response with status 304.
+
+        Returns:
+            CacheEntry: updated entry.
+        """
+        expires = self.expiry(headers)
+        entry = entry._replace(expires=expires if expires is not None else time.time(),
+                               etag=headers.get("ETag", entry.etag),
+                               last_modified=headers.get("Last-Modified",
+                                                         entry.last_modified))
+        try:
+            with self.lock:
+                self.connection.execute(
+                    "UPDATE entries SET expires = ?, etag = ?, last_modified = ?,"
+                    " accessed = ? WHERE url = ?",
+                    (entry.expires, entry.etag, entry.last_modified, time.time(), entry.url))
+        except sqlite3.Error as error:
+            print(f"HTTP cache error: {error}")
+        return entry
+
+    def open(self, entry):
+        """
+        Map cached file into memory.
+
+        Args:
+            entry (CacheEntry).
+
+        Returns:
+            mmap.mmap: read-only mapping, None if file is missing.
+        """
+        try:
+            with open(entry.path, "rb") as cached_file:
+                return mmap.mmap(cached_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as error:
+            print(f"Failed to read cached {entry.url}: {error}")
+            self.remove(entry.url)
+            return None
+
+    def read(self, entry):
+        """
+        Returns:
+            bytes: content of cached file copied once from mapping, None if
+            file is missing.
+        """
+        mapping = self.open(entry)
+        if mapping is None:
+            return None
+        with mapping:
+            return mapping[:]
+
+    def remove(self, url):
+        try:
+            with self.lock:
+                self.connection.execute("DELETE FROM entries WHERE url = ?", (url,))
+        except sqlite3.Error as error:
+            print(f"HTTP cache error: {error}")
+        self.__remove_file(self.file_path(url))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def __store(self, url, headers, size, write):
+        """
+        Write file by write(temp_path), rename it to file of URL and record
+        entry. Evict least recently used entries if size limit is exceeded.
+        """
+        expires = self.expiry(headers)
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if (expires is None or size == 0 or size > self.max_size
+                or (expires <= time.time() and etag is None and last_modified is None)):
+            return None
+
+        entry = CacheEntry(url, self.file_path(url), size, expires, etag, last_modified,
+                           headers.get("Content-Type"))
+        temp_path = f"{entry.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(entry.path), exist_ok=True)
+            write(temp_path)
+            os.replace(temp_path, entry.path)
+        except OSError as error:
+            print(f"Failed to cache {url}: {error}")
+            self.__remove_file(temp_path)
+            return None
+
+        try:
+            with self.lock:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, size, expires, etag, last_modified, entry.content_type,
+                     time.time())
+                )
+                evicted = self.__evict()
+        except sqlite3.Error as error:
+            print(f"HTTP cache error: {error}")
+            return None
+
+        for evicted_url in evicted:
+            self.__remove_file(self.file_path(evicted_url))
+        return entry
+
+    def __evict(self):
+        """
+        Remove least recently used entries exceeding size limit from index.
+        Called with lock acquired.
+
+        Returns:
+            list of str: URLs of removed entries.
+        """
+        excess = (self.connection.execute("SELECT TOTAL(size) FROM entries").fetchone()[0]
+                  - self.max_size)
+        evicted = []
+        if excess <= 0:
+            return evicted
+
+        for url, size in self.connection.execute(
+                "SELECT url, size FROM entries ORDER BY accessed").fetchall():
+            evicted.append(url)
+            excess -= size
+            if excess <= 0:
+                break
+        self.connection.executemany("DELETE FROM entries WHERE url = ?",
+                                    ((url,) for url in evicted))
+        return evicted
+
+    @staticmethod
+    def __write(path, content):
+        with open(path, "wb") as outf:
+            outf.write(content)
+
+    @staticmethod
+    def __remove_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            print(f"Failed to remove cached file {path}: {error}")
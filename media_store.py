@@ -0,0 +1,208 @@
+"""Content-addressed store of downloaded media files"""
+
+import errno
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+
+class MediaStore:
+    """Deduplicating store of media files
+
+    Each file is kept once under it's SHA-256 digest:
+    <path>/<first 2 hex digits>/<digest><extension>. Manifest maps URL of
+    downloaded file to digest and friendly file name, so known URLs
+    are not downloaded again. Files are presented in output directories
+    under friendly names by hard links, symbolic links are used if hard
+    links are impossible, e.g. store is on other file system.
+    URLs whose files were removed as near-duplicates are recorded as
+    skipped, so they are neither linked nor downloaded again.
+    Instance may be shared by several threads.
+
+    Args:
+        path (str): store directory, created if needed.
+
+    Attributes:
+        path (str).
+
+        connection (sqlite3.Connection): autocommit connection to manifest
+        <path>/manifest.sqlite3.
+
+        lock (threading.Lock): guards connection.
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(path, "manifest.sqlite3"),
+                                          timeout=10, isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " url TEXT PRIMARY KEY,"
+            " digest TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS files_digest ON files (digest)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS skipped ("
+            " url TEXT PRIMARY KEY,"
+            " created REAL NOT NULL)"
+        )
+
+    def blob_path(self, digest, name):
+        """
+        Returns:
+            str: path of stored file with given digest, extension
+            is taken from name.
+        """
+        return os.path.join(self.path, digest[:2],
+                            digest + os.path.splitext(name)[1].lower())
+
+    def lookup(self, url):
+        """
+        Args:
+            url (str): URL of media file.
+
+        Returns:
+            str: path of stored file downloaded from URL.
+
+            str: friendly name of the file.
+
+            Pair of None if URL is unknown or file is missing.
+        """
+        try:
+            with self.lock:
+                row = self.connection.execute(
+                    "SELECT digest, name FROM files WHERE url = ?", (url,)).fetchone()
+        except sqlite3.Error as error:
+            print(f"Media store error: {error}")
+            return None, None
+
+        if row is None:
+            return None, None
+
+        blob_path = self.blob_path(*row)
+        if not os.path.exists(blob_path):
+            return None, None
+
+        return blob_path, row[1]
+
+    def add(self, url, file_path, digest, name):
+        """
+        Move downloaded file into store unless file with the same content
+        is already stored, in which case downloaded one is removed.
+        Record URL in manifest.
+
+        Args:
+            url (str): URL of media file.
+
+            file_path (str): path of downloaded file.
+
+            digest (str): hex SHA-256 digest of file content.
+
+            name (str): friendly file name.
+
+        Returns:
+            str: path of stored file.
+        """
+        blob_path = self.blob_path(digest, name)
+        size = os.path.getsize(file_path)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        if os.path.exists(blob_path):
+            os.remove(file_path)
+        else:
+            try:
+                os.replace(file_path, blob_path)
+            except OSError as error:
+                if error.errno != errno.EXDEV:
+                    raise
+                # store is on other file system, copy file to complete name
+                shutil.copyfile(file_path, blob_path + ".tmp")
+                os.replace(blob_path + ".tmp", blob_path)
+                os.remove(file_path)
+        try:
+            with self.lock:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                    (url, digest, name, size, time.time())
+                )
+        except sqlite3.Error as error:
+            print(f"Media store error: {error}")
+        return blob_path
+
+    def mark_skipped(self, url):
+        """
+        Record that file of URL was removed from output as near-duplicate.
+
+        Args:
+            url (str): URL of media file.
+        """
+        try:
+            with self.lock:
+                self.connection.execute("INSERT OR REPLACE INTO skipped VALUES (?, ?)",
+                                        (url, time.time()))
+        except sqlite3.Error as error:
+            print(f"Media store error: {error}")
+
+    def is_skipped(self, url):
+        """
+        Returns:
+            bool: True if file of URL was removed from output as near-duplicate.
+        """
+        try:
+            with self.lock:
+                row = self.connection.execute(
+                    "SELECT 1 FROM skipped WHERE url = ?", (url,)).fetchone()
+        except sqlite3.Error as error:
+            print(f"Media store error: {error}")
+            return False
+        return row is not None
+
+    @staticmethod
+    def link(blob_path, link_path):
+        """
+        Make stored file available under friendly name. If other file
+        has the name _copy is appended to it.
+
+        Args:
+            blob_path (str): path of stored file.
+
+            link_path (str): wanted path of link.
+
+        Returns:
+            str: path of link.
+        """
+        while True:
+            if os.path.lexists(link_path):
+                if os.path.exists(link_path) and os.path.samefile(link_path, blob_path):
+                    return link_path
+
+                root, ext = os.path.splitext(link_path)
+                link_path = root + "_copy" + ext
+                continue
+
+            try:
+                try:
+                    os.link(blob_path, link_path)
+                except OSError as error:
+                    if error.errno == errno.EEXIST:
+                        raise
+                    os.symlink(os.path.relpath(blob_path, os.path.dirname(link_path)),
+                               link_path)
+                return link_path
+            except FileExistsError:
+                # name is taken concurrently, choose again
+                continue
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,291 @@
+"""Perceptual-hash detection of near-duplicate images
+
+Requires Pillow, is disabled if it's not installed.
+"""
+
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import os
+import sqlite3
+import threading
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".cache", "quick-peek",
+                                  "near_duplicates.sqlite3")
+
+
+def difference_hash(path, hash_size=8):
+    """
+    Compute dHash of image: image is converted to grayscale, shrunk to
+    (hash_size + 1) x hash_size pixels, each bit tells whether pixel is
+    brighter than it's right neighbour. Hash survives rescaling and
+    recompression, small crops change few bits.
+    Is executed in worker processes.
+
+    Args:
+        path (str): image file path, first frame of animation is hashed.
+
+        hash_size (int): hash has hash_size**2 bits.
+
+    Returns:
+        int: hash, None if file is not a readable image.
+    """
+    try:
+        with Image.open(path) as image:
+            image.draft("L", (hash_size * 4, hash_size * 4))
+            pixels = list(image.convert("L")
+                          .resize((hash_size + 1, hash_size), Image.LANCZOS)
+                          .getdata())
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+    value = 0
+    for row in range(hash_size):
+        for column in range(hash_size):
+            offset = row * (hash_size + 1) + column
+            value = (value << 1) | (pixels[offset] > pixels[offset + 1])
+    return value
+
+
+def hamming_distance(first, second):
+    return bin(first ^ second).count("1")
+
+
+class BKTree:
+    """Burkhard-Keller tree of hashes with Hamming distance metric
+
+    Children of node are keyed by their distance to it, so by triangle
+    inequality search within radius r of a node at distance d visits only
+    children keyed d - r .. d + r. Lookup of close hashes visits small part
+    of the tree.
+
+    Attributes:
+        root (list): node [hash, items, children], None if tree is empty.
+        Items (list) are values added with equal hash, children (dict)
+        maps distance to child node.
+
+        size (int): count of added items.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, value, item):
+        """
+        Args:
+            value (int): hash.
+
+            item: value returned by search, e.g. file path.
+        """
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """
+        Args:
+            value (int): hash.
+
+            max_distance (int): search radius.
+
+        Returns:
+            list: pairs of distance and item within radius, closest first.
+        """
+        found = []
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node = nodes.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                found.extend((distance, item) for item in node[1])
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    nodes.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+class NearDuplicateDetector:
+    """Pipeline stage finding near-duplicates among downloaded images
+
+    Saved images are hashed by difference_hash in process pool, so
+    downloads are not slowed by decoding. Hashes are looked up in BK-tree
+    of hashes of previously saved images. Found near-duplicates are
+    recorded in index, in skip mode their files are also removed.
+    Index of hashes is kept in sqlite database and loaded into tree on
+    start, so images of previous dumps are detected too.
+    Instance may be shared by several threads and downloaders.
+
+    Args:
+        index_path (str): path of sqlite index, DEFAULT_INDEX_PATH if None.
+
+        max_distance (int): maximal count of differing hash bits of
+        near-duplicates, MAX_DISTANCE if None.
+
+        skip (bool): remove files of near-duplicates, only record them if False.
+
+        workers (int): count of hashing processes, count of CPUs if None.
+
+    Class attributes:
+        IMAGE_EXTENSIONS (tuple of str): extensions of hashed files.
+
+        MAX_DISTANCE (int): default search radius, 8 of 64 bits.
+
+    Attributes:
+        max_distance (int).
+
+        skip (bool).
+
+        tree (BKTree): hashes of saved images, items are file paths.
+
+        connection (sqlite3.Connection): autocommit connection to index.
+
+        lock (threading.Lock): guards tree and connection.
+
+        hash_executor (concurrent.futures.ProcessPoolExecutor).
+    """
+
+    IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+    MAX_DISTANCE = 8
+
+    def __init__(self, index_path=None, max_distance=None, skip=False, workers=None):
+        if Image is None:
+            raise RuntimeError("Near-duplicate detection requires Pillow")
+
+        if index_path is None:
+            index_path = DEFAULT_INDEX_PATH
+
+        self.max_distance = max_distance if max_distance is not None else self.MAX_DISTANCE
+        self.skip = skip
+        self.tree = BKTree()
+        self.lock = threading.Lock()
+        index_dir = os.path.dirname(index_path)
+        if index_dir and not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+        self.connection = sqlite3.connect(index_path, timeout=10, isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            " path TEXT PRIMARY KEY,"
+            " hash TEXT NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS near_duplicates ("
+            " path TEXT PRIMARY KEY,"
+            " original TEXT NOT NULL,"
+            " distance INTEGER NOT NULL,"
+            " skipped INTEGER NOT NULL)"
+        )
+        for path, value in self.connection.execute("SELECT path, hash FROM hashes"):
+            self.tree.add(int(value, 16), path)
+        self.hash_executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+
+    def submit(self, path, on_skipped=None):
+        """
+        Schedule hashing and lookup of saved file, files which are
+        not images are ignored.
+
+        Args:
+            path (str): path of saved file.
+
+            on_skipped (callable): called with path of file and path of it's
+            original by executor thread after file is removed in skip mode,
+            may be None.
+        """
+        if not path.lower().endswith(self.IMAGE_EXTENSIONS):
+            return
+
+        future = self.hash_executor.submit(difference_hash, path)
+        future.add_done_callback(lambda done: self.__on_hashed(path, done, on_skipped))
+
+    def is_skipped(self, path):
+        """
+        Returns:
+            bool: True if file saved at path was removed as near-duplicate.
+        """
+        try:
+            with self.lock:
+                row = self.connection.execute(
+                    "SELECT skipped FROM near_duplicates WHERE path = ?",
+                    (os.path.abspath(path),)).fetchone()
+        except sqlite3.Error as error:
+            print(f"Near-duplicate index error: {error}")
+            return False
+        return row is not None and bool(row[0])
+
+    def close(self):
+        """Wait for submitted hashings, release processes and index."""
+        self.hash_executor.shutdown(wait=True)
+        with self.lock:
+            self.connection.close()
+
+    def __on_hashed(self, path, future, on_skipped):
+        """
+        Look up near-duplicates of hashed file, add it's hash to tree
+        unless it is skipped. Is called by executor thread.
+        """
+        if future.cancelled():
+            return
+        try:
+            value = future.result()
+        except BrokenProcessPool as error:
+            print(f"Failed to hash {path}: {error}")
+            return
+        if value is None:
+            return
+
+        path = os.path.abspath(path)
+        with self.lock:
+            found = [pair for pair in self.tree.search(value, self.max_distance)
+                     if pair[1] != path]
+            skipped = bool(found) and self.skip
+            try:
+                if found:
+                    distance, original = found[0]
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO near_duplicates VALUES (?, ?, ?, ?)",
+                        (path, original, distance, skipped))
+                if not skipped:
+                    self.connection.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?)",
+                                            (path, f"{value:x}"))
+            except sqlite3.Error as error:
+                print(f"Near-duplicate index error: {error}")
+            if not skipped:
+                self.tree.add(value, path)
+
+        if not found:
+            return
+
+        distance, original = found[0]
+        print(f"Near-duplicate of {original} (distance {distance}): {path}")
+        if skipped:
+            try:
+                os.remove(path)
+            except OSError as error:
+                print(f"Failed to remove {path}: {error}")
+                return
+            if on_skipped is not None:
+                on_skipped(path, original)
@@ -11,15 +11,19 @@ through libvlc-based player.
 
 Note:
     Not all submitted media files are shown like those of type gif or gifv.
-    Direct URLs are expected to specify following file extensions:
+    With --probe option direct URLs are probed, i.e. first bytes of files
+    are requested, so following file types are recognized regardless of
+    URL extensions:
         jpeg, jpg, png (images),
         mp4, webm (videos).
 """
 
-import queue
 import collections
-import time
+import concurrent.futures
+import os
 import pathlib
+import shutil
+import tempfile
 from urllib.parse import urlparse
 
 import requests
@@ -28,6 +32,10 @@ from PyQt5 import QtWidgets, QtCore, QtGui, uic
 
 from viewer import Viewer
 from player import Player
+from rate_limit import DEFAULT_LIMITER
+from resolve_cache import ResolveCache
+from http_cache import HTTPCache
+from retry import DEFAULT_RETRY_POLICY
 
 from adapters import (
     BROWSER_HEADERS,
@@ -39,7 +47,7 @@ from adapters import (
 )
 
 
-Media = collections.namedtuple("Media", ("type", "content", "preview"))
+Media = collections.namedtuple("Media", ("type", "content", "preview", "image", "thumbnail"))
 """ Submitted media
 
 Attributes:
@@ -49,6 +57,12 @@ Attributes:
     bytes of original image for image type.
 
     preview (bytes or None): for video type bytes of preview image if any.
+
+    image (QtGui.QImage or None): decoded original image for image type,
+    decoded preview image for video type if any.
+
+    thumbnail (QtGui.QImage or None): image scaled to height of thumbnail
+    shown in main window.
 """
 
 
@@ -65,14 +79,20 @@ class QuickPeek(QtWidgets.QWidget):
     Args:
         parent (QtWidgets.QWidget): parent widget.
 
+        probe (bool): probe direct URLs, see MediaIterator. False by default.
+
     Attributes:
         Window elements:
             button_start (QtWidgets.QPushButton): read given
             subreddit name, reset MediaIterator and load first
             submitted media file if any.
 
-            button_next (QtWidgets.QPushButton): load and show
-            next submitted media file if any.
+            button_next (QtWidgets.QPushButton): show next media of
+            history or load and show next submitted media file if any.
+            Tooltip shows fill of media cache.
+
+            button_back (QtWidgets.QPushButton): show previous media
+            of history.
 
             button_enlarge (QtWidgets.QPushButton): open new
             window with large image or video player.
@@ -82,9 +102,12 @@ class QuickPeek(QtWidgets.QWidget):
             thumbnail_play (QtGui.QPixmap): icon showed for videos
             lacking of preview image.
 
-        media (Media): submitted media.
+        media (Media): shown media.
 
-        media_image (QtGui.QPixmap): original image to show --
+        history (MediaHistory): shown media, allows to revisit them
+        without requests.
+
+        media_thumbnail (QtGui.QPixmap): shown thumbnail -- scaled
         source image or preview for video.
 
         media_provider (MediaProvider): asynchronously delivers next submitted media.
@@ -96,7 +119,7 @@ class QuickPeek(QtWidgets.QWidget):
         player (player.Player): window with video player, opened on demand.
     """
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, probe=False):
         super(QtWidgets.QWidget, self).__init__(parent)
         uic.loadUi(str(pathlib.Path(__file__).parent.absolute()) + "/quick_peek.ui", self)
         self.thumbnail_play = QtGui.QPixmap(":play80")
@@ -105,17 +128,21 @@ class QuickPeek(QtWidgets.QWidget):
                   self.frameGeometry().center())
 
         self.button_next.setDisabled(True)
+        self.button_back.setDisabled(True)
         self.button_enlarge.setDisabled(True)
 
         self.button_start.clicked.connect(self.browse_subreddit)
         self.button_next.clicked.connect(self.request_next)
+        self.button_back.clicked.connect(self.request_previous)
         self.button_enlarge.clicked.connect(self.show_media)
 
-        self.media_provider = MediaProvider()
+        self.media_provider = MediaProvider(self.label_image.size().height(), probe=probe)
         self.media_provider.sig_provided.connect(self.update)
+        self.media_provider.sig_cache_changed.connect(self.button_next.setToolTip)
 
         self.media = None
-        self.media_image = QtGui.QPixmap()
+        self.history = MediaHistory()
+        self.media_thumbnail = QtGui.QPixmap()
         self.viewer = None
         self.player = None
 
@@ -123,59 +150,93 @@ class QuickPeek(QtWidgets.QWidget):
     def browse_subreddit(self):
         """
         Read given subreddit name and use it to update internal state of
-        MediaProvider.
+        MediaProvider. Media after shown one are dropped from history.
         """
         self.button_next.setDisabled(True)
+        self.button_back.setDisabled(True)
+        self.history.truncate()
         subreddit_name = self.line_subreddit.text()
         self.media_provider.sig_reset.emit(subreddit_name)
 
     @QtCore.pyqtSlot()
     def request_next(self):
+        """
+        Show next media of history if any, request next submitted media otherwise.
+        """
+        if self.history.can_go_forward():
+            self.show_thumbnail(self.history.forward())
+            return
+
         self.button_next.setDisabled(True)
+        self.button_back.setDisabled(True)
         self.media_provider.sig_request_next.emit()
 
+    @QtCore.pyqtSlot()
+    def request_previous(self):
+        """Show previous media of history."""
+        if self.history.can_go_back():
+            self.show_thumbnail(self.history.back())
+
     @QtCore.pyqtSlot(Media)
     def update(self, media):
         """
         Called on next submitted media delivery.
-        Informs user if nothing to show next. Loads preview and unblocks
-        UI buttons otherwise.
+        Informs user if nothing to show next. Adds media to history and
+        shows it otherwise.
 
         Args:
             media (Media): submitted media.
         """
-        self.media = media
-
         if media.type is None:
+            self.media = media
+            self.history.end()
             self.label_image.setText("No media available")
             self.button_enlarge.setDisabled(True)
+            self.button_back.setDisabled(not self.history.can_go_back())
             return
 
+        self.history.append(media)
+        self.show_thumbnail(media)
+
+    def show_thumbnail(self, media):
+        """
+        Show thumbnail of media, unblock UI buttons. Images are decoded and
+        scaled by MediaProvider, so only conversion of thumbnail to pixmap is left.
+
+        Args:
+            media (Media): submitted media.
+        """
+        self.media = media
         if media.type == "image":
-            self.media_image.loadFromData(self.media.content)
             self.button_enlarge.setText("Enlarge")
         elif media.type == "video":
             self.button_enlarge.setText("Play")
-            if media.preview is None:
-                self.media_image = self.thumbnail_play
-            else:
-                self.media_image.loadFromData(media.preview)
 
-        self.label_image.setPixmap(
-            self.media_image.scaledToHeight(self.label_image.size().height())
-        )
+        if media.thumbnail is not None:
+            self.media_thumbnail = QtGui.QPixmap.fromImage(media.thumbnail)
+        else:
+            self.media_thumbnail = self.thumbnail_play.scaledToHeight(
+                self.label_image.size().height())
+        self.label_image.setPixmap(self.media_thumbnail)
         self.button_next.setDisabled(False)
+        self.button_back.setDisabled(not self.history.can_go_back())
         self.button_enlarge.setDisabled(False)
 
     @QtCore.pyqtSlot()
     def show_media(self):
         """
         Prepare and open window with large image or video player.
+        Spilled image of history is read back.
         """
         if self.media.type == "image":
+            image = self.history.image()
+            if image is None:
+                self.button_enlarge.setDisabled(True)
+                return
+
             if self.viewer is None:
                 self.viewer = Viewer()
-            self.viewer.set_viewer(self.media_image,
+            self.viewer.set_viewer(QtGui.QPixmap.fromImage(image),
                                    self.frameGeometry().center())
             self.viewer.show()
         elif self.media.type == "video":
@@ -204,44 +265,417 @@ class QuickPeek(QtWidgets.QWidget):
         self.hide()
         self.media_provider.sig_stop.emit()
         self.media_provider.main_thread.wait()
+        self.history.close()
         event.accept()
 
 
+class MediaCache:
+    """First-in first-out cache of fetched media bounded by total size
+
+    Size of media is the size of it's raw bytes and decoded images, see
+    media_size. Bounds are soft: media are put regardless of them, full
+    tells producer to pause. Average size of cached media is tracked to
+    estimate size of media being fetched, so prefetch depth adapts to
+    media sizes: many small media or few large ones fit the budget.
+    Is used by single thread.
+
+    Args:
+        max_bytes (int): memory budget, MAX_BYTES if None.
+
+        max_items (int): maximal count of media, MAX_ITEMS if None.
+
+    Class attributes:
+        MAX_BYTES (int): default budget, 256MiB.
+
+        MAX_ITEMS (int): default count of media.
+
+    Attributes:
+        max_bytes (int).
+
+        max_items (int).
+
+        items (collections.deque): pairs of media and it's size.
+
+        size (int): total size of cached media.
+
+        average_size (float): moving average of sizes of put media,
+        max_bytes / max_items until first media is put.
+
+        is_average_known (bool): some media were put.
+    """
+
+    MAX_BYTES = 256 * 1024 * 1024
+    MAX_ITEMS = 50
+
+    def __init__(self, max_bytes=None, max_items=None):
+        self.max_bytes = max_bytes if max_bytes is not None else self.MAX_BYTES
+        self.max_items = max_items if max_items is not None else self.MAX_ITEMS
+        self.items = collections.deque()
+        self.size = 0
+        self.average_size = self.max_bytes / self.max_items
+        self.is_average_known = False
+
+    def __len__(self):
+        return len(self.items)
+
+    @staticmethod
+    def media_size(media):
+        """
+        Returns:
+            int: count of bytes held by media.
+        """
+        size = 0
+        for data in (media.content, media.preview):
+            if isinstance(data, bytes):
+                size += len(data)
+        for image in (media.image, media.thumbnail):
+            if image is not None:
+                size += image.sizeInBytes()
+        return size
+
+    def put(self, media):
+        size = self.media_size(media)
+        self.items.append((media, size))
+        self.size += size
+        self.average_size = (0.8 * self.average_size + 0.2 * size
+                             if self.is_average_known else size)
+        self.is_average_known = True
+
+    def get(self):
+        """
+        Returns:
+            Media: oldest media.
+
+        Raises:
+            IndexError: cache is empty.
+        """
+        media, size = self.items.popleft()
+        self.size -= size
+        return media
+
+    def empty(self):
+        return not self.items
+
+    def clear(self):
+        """Discard media, average size is kept."""
+        self.items.clear()
+        self.size = 0
+
+    def full(self, pending=0):
+        """
+        Args:
+            pending (int): count of media being fetched, they are expected
+            to be of average size.
+
+        Returns:
+            bool: True if cached and pending media reach a bound.
+        """
+        return (len(self.items) + pending >= self.max_items
+                or self.size + pending * self.average_size >= self.max_bytes)
+
+    def report(self):
+        """
+        Returns:
+            str: current fill of cache.
+        """
+        return (f"{len(self.items)} of {self.max_items} media ready,"
+                f" {self.size / 2**20:.1f} of {self.max_bytes / 2**20:.0f} MiB")
+
+
+class MediaHistory:
+    """History of shown media with LRU cache of their originals
+
+    Entries are kept in order of showing, current entry is at position.
+    Thumbnails of all entries stay in memory, so revisiting is instant and
+    makes no requests. Originals of images, i.e. raw bytes and decoded
+    images, of recently shown entries are kept in memory within budget.
+    Least recently shown ones are spilled: raw bytes are written to spill
+    directory and originals are dropped from memory, they are read back
+    when image is enlarged. Previews of videos are dropped as their
+    thumbnails are enough, videos are streamed again on play.
+    Is used by GUI thread.
+
+    Args:
+        max_bytes (int): memory budget of originals, MAX_BYTES if None.
+
+        max_entries (int): maximal count of entries, oldest ones are
+        dropped, MAX_ENTRIES if None.
+
+        spill_path (str): directory of spilled originals, temporary
+        directory removed on close if None.
+
+    Class attributes:
+        MAX_BYTES (int): default budget, 128MiB.
+
+        MAX_ENTRIES (int): default count of entries.
+
+    Attributes:
+        max_bytes (int).
+
+        max_entries (int).
+
+        entries (list of Media): shown media. Spilled images have content
+        and image set to None, spilled videos have preview and image set to None.
+
+        position (int): index of current entry, len(entries) after end of
+        subreddit is shown.
+
+        dropped (int): count of entries dropped from start of history,
+        entry number is dropped + index.
+
+        in_memory (collections.OrderedDict): entry numbers of media kept with
+        originals to their sizes, least recently shown first.
+
+        size (int): total size of media kept with originals.
+
+        spill_path (str).
+
+        is_spill_temporary (bool): spill directory is removed on close.
+    """
+
+    MAX_BYTES = 128 * 1024 * 1024
+    MAX_ENTRIES = 1000
+
+    def __init__(self, max_bytes=None, max_entries=None, spill_path=None):
+        self.max_bytes = max_bytes if max_bytes is not None else self.MAX_BYTES
+        self.max_entries = max_entries if max_entries is not None else self.MAX_ENTRIES
+        self.entries = []
+        self.position = 0
+        self.dropped = 0
+        self.in_memory = collections.OrderedDict()
+        self.size = 0
+        self.is_spill_temporary = spill_path is None
+        if spill_path is None:
+            spill_path = tempfile.mkdtemp(prefix="quick-peek-")
+        elif not os.path.exists(spill_path):
+            os.makedirs(spill_path)
+        self.spill_path = spill_path
+
+    def __len__(self):
+        return len(self.entries)
+
+    def current(self):
+        """
+        Returns:
+            Media: current entry, None after end of subreddit.
+        """
+        if self.position < len(self.entries):
+            return self.entries[self.position]
+        return None
+
+    def can_go_back(self):
+        return self.position > 0
+
+    def can_go_forward(self):
+        return self.position < len(self.entries) - 1
+
+    def append(self, media):
+        """
+        Add newly shown media after last entry, make it current.
+
+        Args:
+            media (Media): media with originals.
+        """
+        self.entries.append(media)
+        self.position = len(self.entries) - 1
+        self.__touch(self.position)
+        if len(self.entries) > self.max_entries:
+            self.__drop_first()
+
+    def end(self):
+        """End of subreddit is shown, move past last entry."""
+        self.position = len(self.entries)
+
+    def back(self):
+        """
+        Returns:
+            Media: previous entry, it becomes current.
+        """
+        self.position -= 1
+        self.__touch(self.position)
+        return self.entries[self.position]
+
+    def forward(self):
+        """
+        Returns:
+            Media: next entry, it becomes current.
+        """
+        self.position += 1
+        self.__touch(self.position)
+        return self.entries[self.position]
+
+    def truncate(self):
+        """Drop entries after current one, e.g. on change of subreddit."""
+        for index in range(self.position + 1, len(self.entries)):
+            self.__forget(index)
+        del self.entries[self.position + 1:]
+
+    def image(self):
+        """
+        Get decoded original image of current entry, spilled image is read
+        back into memory.
+
+        Returns:
+            QtGui.QImage: original image, None if it is unavailable.
+        """
+        media = self.current()
+        if media is None or media.type != "image":
+            return None
+
+        if media.image is None:
+            try:
+                with open(self.__spill_file(self.position), "rb") as spill_file:
+                    content = spill_file.read()
+            except OSError as error:
+                print(f"Failed to read spilled image: {error}")
+                return None
+
+            image = QtGui.QImage.fromData(content)
+            if image.isNull():
+                return None
+
+            media = media._replace(content=content, image=image)
+            self.entries[self.position] = media
+            self.__touch(self.position)
+        return media.image
+
+    def close(self):
+        """Remove temporary spill directory."""
+        if self.is_spill_temporary:
+            shutil.rmtree(self.spill_path, ignore_errors=True)
+
+    def __spill_file(self, index):
+        return os.path.join(self.spill_path, str(self.dropped + index))
+
+    def __touch(self, index):
+        """
+        Mark entry as most recently shown, spill least recently shown
+        ones while budget is exceeded. Entry itself is never spilled.
+        """
+        number = self.dropped + index
+        media = self.entries[index]
+        if number in self.in_memory:
+            self.in_memory.move_to_end(number)
+        elif media.image is not None or media.preview is not None:
+            size = MediaCache.media_size(media)
+            self.in_memory[number] = size
+            self.size += size
+
+        while self.size > self.max_bytes and len(self.in_memory) > 1:
+            spilled_number = next(iter(self.in_memory))
+            if spilled_number == number:
+                break
+            self.__spill(spilled_number - self.dropped)
+
+    def __spill(self, index):
+        """Write raw bytes of image to spill directory, drop originals."""
+        media = self.entries[index]
+        self.size -= self.in_memory.pop(self.dropped + index)
+        if media.type == "image":
+            spill_file_path = self.__spill_file(index)
+            if not os.path.exists(spill_file_path):
+                try:
+                    with open(spill_file_path, "wb") as spill_file:
+                        spill_file.write(media.content)
+                except OSError as error:
+                    print(f"Failed to spill image: {error}")
+            self.entries[index] = media._replace(content=None, image=None)
+        else:
+            self.entries[index] = media._replace(preview=None, image=None)
+
+    def __forget(self, index):
+        """Release memory and spill file of entry."""
+        size = self.in_memory.pop(self.dropped + index, None)
+        if size is not None:
+            self.size -= size
+        try:
+            os.remove(self.__spill_file(index))
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            print(f"Failed to remove spilled image: {error}")
+
+    def __drop_first(self):
+        self.__forget(0)
+        del self.entries[0]
+        self.dropped += 1
+        self.position -= 1
+
+
 class MediaProvider(QtCore.QObject):
     """Asynchronous adapter to MediaIterator
 
         Asynchronously delivers submitted media.
-        Creates and is executed in separate thread.
-        Encapsulates blocking access to web resources.
-        In background caches more media for better UI responsiveness.
+        Creates and is executed in separate thread. The thread only schedules
+        requests and keeps cache, so it's event loop is never blocked.
+        Media are prefetched by pipeline of worker pools: listing stage takes
+        submissions from MediaIterator one at a time in single worker,
+        fetch stage resolves submissions and downloads their media in
+        FETCH_WORKERS workers concurrently. Fetch workers also decode images
+        and scale thumbnails, so main window only converts them to pixmaps
+        and it's latency doesn't depend on image resolution.
+        Fetched media wait for user in cache bounded by memory budget and count
+        of media. Listing is paused while cached media together with media being
+        fetched reach a bound, so more small media or less large ones are
+        prefetched. Results of stages are passed to the thread by queued signals,
+        finished media are delivered in order of completion.
+        Each change of subreddit starts new generation of pipeline, results of
+        previous generations are discarded.
 
         Args:
+            thumbnail_height (int): height of thumbnail shown by main window.
+
+            max_cache_bytes (int): memory budget of cache, MediaCache.MAX_BYTES
+            if None.
+
+            max_cache_items (int): maximal count of cached media,
+            MediaCache.MAX_ITEMS if None.
+
+            probe (bool): probe direct URLs, see MediaIterator.
+
             parent (QtCore.QObject).
 
+        Class attributes:
+            FETCH_WORKERS (int): count of concurrent fetches.
+
+            MAX_FETCHES (int): maximal count of scheduled fetches, bounds
+            overshoot of cache budget by fetched media.
+
         Attributes:
             media_iterator (MediaIterator): iterates over subreddit submissions.
+            Is created and reset by listing worker.
+
+            thumbnail_height (int).
 
-            max_cache_size (int).
+            probe (bool).
 
-            cache (queue.Queue).
+            cache (MediaCache): fetched media waiting for user request.
 
             main_thread (QtCore.QThread): separate thread with QEventLoop.
 
-            Flags:
-                is_stopped (bool): stop to perform requests to current subreddit.
-                Depends on state of MediaIterator.
+            listing_executor (concurrent.futures.ThreadPoolExecutor): single
+            worker of listing stage, also resets media_iterator.
 
-                is_reseted (bool): subreddit was changed, cache was emptied.
+            fetch_executor (concurrent.futures.ThreadPoolExecutor): workers
+            of fetch stage.
 
-                is_filling_cache (bool): in process of filling cache. Is used to
-                prevent recursive calls of cache filling function.
+            listing_future (concurrent.futures.Future): running listing of next
+            submission, None if listing is paused.
 
-                is_request_pending (bool): cache was empty, user is waiting for media.
+            fetch_futures (set of concurrent.futures.Future): running fetches.
 
-                to_discard_download_on_reset (bool): if user performed subreddit reset
-                after next media has been downloaded the media must be discarded.
-                The flag is used in pair with reset flag to distinguish initial reset
-                and keep downloaded media.
+            generation (int): incremented on subreddit change.
+
+            unresolved_left (int): count of submissions which may be unresolved
+            before next media is found, MediaIterator.MAX_UNRESOLVED initially.
+
+            Flags:
+                is_stopped (bool): user closed app.
+
+                is_exhausted (bool): no more submissions in current subreddit
+                or too many unresolved ones.
+
+                is_request_pending (bool): cache was empty, user is waiting for media.
 
             Signals:
                 sig_stop (QtCore.pyqtSignal): user closed app.
@@ -252,35 +686,53 @@ class MediaProvider(QtCore.QObject):
 
                 sig_provided (QtCore.pyqtSignal): signal main window media delivery.
 
-                sig_fill_cache (QtCore.pyqtSignal): internal signal. Not enough media
-                in cache, the cache is needed to be filled.
+                sig_cache_changed (QtCore.pyqtSignal): carries report of cache fill.
+
+                sig_listed (QtCore.pyqtSignal): internal signal. Listing worker
+                finished, carries generation and future of submission.
+
+                sig_fetched (QtCore.pyqtSignal): internal signal. Fetch worker
+                finished, carries generation and future of media.
     """
+    FETCH_WORKERS = 4
+    MAX_FETCHES = FETCH_WORKERS
+
     sig_request_next = QtCore.pyqtSignal()
     sig_reset = QtCore.pyqtSignal(str)
     sig_stop = QtCore.pyqtSignal()
     sig_provided = QtCore.pyqtSignal(Media)
-    sig_fill_cache = QtCore.pyqtSignal()
+    sig_cache_changed = QtCore.pyqtSignal(str)
+    sig_listed = QtCore.pyqtSignal(int, object)
+    sig_fetched = QtCore.pyqtSignal(int, object)
 
-    def __init__(self, parent=None):
+    def __init__(self, thumbnail_height, max_cache_bytes=None, max_cache_items=None,
+                 probe=False, parent=None):
         super().__init__(parent)
         self.main_thread = QtCore.QThread()
         self.main_thread.start()
         self.moveToThread(self.main_thread)
 
         self.media_iterator = None
-        self.max_cache_size = 10
-        self.cache = queue.Queue(maxsize=self.max_cache_size)
+        self.probe = probe
+        self.thumbnail_height = thumbnail_height
+        self.cache = MediaCache(max_cache_bytes, max_cache_items)
+        self.listing_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.fetch_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.FETCH_WORKERS)
+        self.listing_future = None
+        self.fetch_futures = set()
+        self.generation = 0
+        self.unresolved_left = 0
 
-        self.to_discard_download_on_reset = False
-        self.is_reseted = False
         self.is_stopped = False
-        self.is_filling_cache = False
+        self.is_exhausted = True
         self.is_request_pending = False
 
         self.sig_stop.connect(self.stop, QtCore.Qt.QueuedConnection)
-        self.sig_fill_cache.connect(self.fill_cache, QtCore.Qt.QueuedConnection)
         self.sig_request_next.connect(self.next, QtCore.Qt.QueuedConnection)
         self.sig_reset.connect(self.reset, QtCore.Qt.QueuedConnection)
+        self.sig_listed.connect(self.on_listed, QtCore.Qt.QueuedConnection)
+        self.sig_fetched.connect(self.on_fetched, QtCore.Qt.QueuedConnection)
 
     @QtCore.pyqtSlot()
     def run(self):
@@ -290,77 +742,209 @@ class MediaProvider(QtCore.QObject):
     @QtCore.pyqtSlot()
     def stop(self):
         """
-        User closed app -- set stop flag True to stop filling cache if running,
-        stop event loop.
+        User closed app -- cancel scheduled requests, release workers,
+        stop event loop. Running requests are completed and discarded.
         """
         self.is_stopped = True
+        self.cancel()
+        # iterator is used by listing worker only
+        self.listing_executor.submit(self.close_iterator)
+        self.listing_executor.shutdown(wait=False)
+        self.fetch_executor.shutdown(wait=False)
         self.main_thread.exit()
 
     @QtCore.pyqtSlot(str)
     def reset(self, subreddit_name):
         """
-        User changed subreddit -- clear cache, request first media submitted in chosen
-        subreddit.
+        User changed subreddit -- discard cached and fetched media, restart pipeline
+        and deliver first media submitted in chosen subreddit.
 
         Args:
             subreddit_name (str): chosen subreddit.
         """
+        self.cancel()
+        self.generation += 1
+        # executed by the listing worker before listing of new generation
+        self.listing_executor.submit(self.reset_iterator, subreddit_name)
+        self.cache.clear()
+        self.sig_cache_changed.emit(self.cache.report())
+        self.unresolved_left = MediaIterator.MAX_UNRESOLVED
+        self.is_exhausted = False
+        self.is_request_pending = True
+        self.schedule()
+
+    def reset_iterator(self, subreddit_name):
+        """Executed by listing worker"""
         if self.media_iterator is not None:
             self.media_iterator.reset(subreddit_name)
         else:
-            self.media_iterator = MediaIterator(subreddit_name)
-        self.cache = queue.Queue(maxsize=self.max_cache_size)
-        self.is_stopped = False
-        self.is_reseted = True
-        self.next()
+            self.media_iterator = MediaIterator(subreddit_name, self.probe)
+
+    def close_iterator(self):
+        """Executed by listing worker"""
+        if self.media_iterator is not None:
+            self.media_iterator.close()
+
+    def list_submission(self):
+        """Executed by listing worker"""
+        return self.media_iterator.next_submission()
+
+    def fetch_media(self, submission):
+        """
+        Executed by fetch worker. Fetch submission, decode it's image or
+        preview and scale it to thumbnail.
+
+        Args:
+            submission (SubmissionRL).
+
+        Raises:
+            MediaIterator.HTTPRequestsFailed.
+
+        Returns:
+            Media: media with decoded images, None if submission is not
+            resolved or submitted image is not decodable.
+        """
+        media = self.media_iterator.fetch(submission)
+        if media is None:
+            return None
+
+        data = media.content if media.type == "image" else media.preview
+        if data is None:
+            return media
+
+        image = QtGui.QImage.fromData(data)
+        if image.isNull():
+            if media.type == "image":
+                print(f"Failed to decode image {submission.url}")
+                return None
+            return media
+
+        thumbnail = image.scaledToHeight(self.thumbnail_height,
+                                         QtCore.Qt.SmoothTransformation)
+        return media._replace(image=image, thumbnail=thumbnail)
 
     @QtCore.pyqtSlot()
     def next(self):
         """
-        User requested next media. Get it from cache or in case if empty request
-        process of cache filling and wait for next download.
+        User requested next media. Get it from cache or, if it is empty, wait
+        for next fetched media.
         """
         if not self.cache.empty():
             self.sig_provided.emit(self.cache.get())
+            self.sig_cache_changed.emit(self.cache.report())
         else:
             self.is_request_pending = True
-            if not self.is_filling_cache:
-                self.sig_fill_cache.emit()
+            self.deliver_end_if_exhausted()
+        self.schedule()
 
-    @QtCore.pyqtSlot()
-    def fill_cache(self):
-        """
-        Start filling cache.
-        May be interrupted on events processing before and after time consuming
-        media requests.
-        On request failure deliver special media object.
-        On success if user is waiting deliver downloaded media immediately, otherwise
-        put in cache.
-        """
-        self.is_filling_cache = True
-        while not self.is_stopped and not self.cache.full():
-            QtWidgets.qApp.processEvents()
-            try:
-                media = next(self.media_iterator)
-            except StopIteration:
-                self.is_stopped = True
-                media = Media(type=None,
-                              content=None,
-                              preview=None
-                             )
-            QtWidgets.qApp.processEvents()
-            if self.is_reseted:
-                self.is_reseted = False
-                if self.to_discard_download_on_reset:
-                    continue
-                self.to_discard_download_on_reset = True
+    def schedule(self):
+        """
+        Start listing of next submission unless listing is running, subreddit
+        is exhausted, MAX_FETCHES are scheduled or cached and fetched media reach
+        bounds of cache.
+        """
+        if (self.is_stopped or self.is_exhausted or self.listing_future is not None
+                or len(self.fetch_futures) >= self.MAX_FETCHES
+                or self.cache.full(len(self.fetch_futures))):
+            return
+
+        generation = self.generation
+        self.listing_future = self.listing_executor.submit(self.list_submission)
+        self.listing_future.add_done_callback(
+            lambda future: self.sig_listed.emit(generation, future))
+
+    def cancel(self):
+        """Cancel listing and fetches of current generation which are not started."""
+        if self.listing_future is not None:
+            self.listing_future.cancel()
+            self.listing_future = None
+        for future in self.fetch_futures:
+            future.cancel()
+        self.fetch_futures.clear()
+
+    @QtCore.pyqtSlot(int, object)
+    def on_listed(self, generation, future):
+        """
+        Submission is listed -- schedule it's fetch and listing of next one.
+        End of subreddit marks it exhausted.
+
+        Args:
+            generation (int): generation of listing.
+
+            future (concurrent.futures.Future): future of SubmissionRL.
+        """
+        if generation != self.generation or self.is_stopped:
+            return
+
+        self.listing_future = None
+        if self.is_exhausted:
+            return
+
+        try:
+            submission = future.result()
+        except StopIteration:
+            self.is_exhausted = True
+            self.deliver_end_if_exhausted()
+            return
+
+        fetch_future = self.fetch_executor.submit(self.fetch_media, submission)
+        self.fetch_futures.add(fetch_future)
+        fetch_future.add_done_callback(
+            lambda future: self.sig_fetched.emit(generation, future))
+        self.schedule()
 
+    @QtCore.pyqtSlot(int, object)
+    def on_fetched(self, generation, future):
+        """
+        Submission is fetched. If user is waiting deliver media immediately,
+        otherwise put it in cache. Unresolved submissions and failed downloads
+        are counted, subreddit is exhausted if the count exceeds the maximum.
+
+        Args:
+            generation (int): generation of fetch.
+
+            future (concurrent.futures.Future): future of Media or None.
+        """
+        if generation != self.generation or self.is_stopped:
+            return
+
+        self.fetch_futures.discard(future)
+        try:
+            media = future.result()
+        except MediaIterator.HTTPRequestsFailed as error:
+            print(error)
+            media = None
+
+        if media is None:
+            self.unresolved_left -= 1
+            if self.unresolved_left <= 0 and not self.is_exhausted:
+                print("Too many unresolved submissions, probably non-media subreddit")
+                self.is_exhausted = True
+        else:
+            self.unresolved_left = MediaIterator.MAX_UNRESOLVED
             if self.is_request_pending:
-                self.sig_provided.emit(media)
                 self.is_request_pending = False
+                self.sig_provided.emit(media)
             else:
                 self.cache.put(media)
-        self.is_filling_cache = False
+                self.sig_cache_changed.emit(self.cache.report())
+        self.deliver_end_if_exhausted()
+        self.schedule()
+
+    def deliver_end_if_exhausted(self):
+        """
+        Deliver special media object to waiting user if subreddit is exhausted
+        and there are no cached or fetched media.
+        """
+        if (self.is_request_pending and self.is_exhausted and self.cache.empty()
+                and not self.fetch_futures):
+            self.is_request_pending = False
+            self.sig_provided.emit(Media(type=None,
+                                         content=None,
+                                         preview=None,
+                                         image=None,
+                                         thumbnail=None
+                                        ))
 
 
 class MediaIterator:
@@ -369,7 +953,8 @@ class MediaIterator:
     resolves URLs to gfycat.com, imgur.com and downloads submission
     related image.
     Performs timed requests for media to resources other than reddit.
-    Implements iterator interface.
+    Implements iterator interface, listing and fetch stages are also
+    available separately to be run by different threads, see MediaProvider.
     In case of album submission downloads it's first image.
     In case of video submission downloads preview. URL of submitted video
     is returned to be used for streaming.
@@ -377,6 +962,9 @@ class MediaIterator:
     Class attributes:
         class HTTPRequestsFailed (Exception).
 
+        MAX_UNRESOLVED (int): maximal count of consecutive unresolved
+        submissions, roughly 3 * SubredditIterator.SUBMISSIONS_PER_PAGE.
+
     Instance attributes:
         video_extensions (tuple of str): known extensions.
 
@@ -394,47 +982,67 @@ class MediaIterator:
         URLs accordingly.
 
         direct_url_resolver (DirectURLResolver): checks whether given
-        URL is direct.
+        URL is direct, probes media files if probe is enabled.
+
+        resolve_cache (resolve_cache.ResolveCache): persistent cache of
+        resolutions shared with dump script.
+
+        http_cache (http_cache.HTTPCache): persistent cache of downloaded
+        images and previews shared with dump script.
 
         download_session (requests.Session): HTTP session solely used
         to download submitted media files.
 
-        media_request_interval (int): reasonable request time internal for
-        web resources other than reddit.
+        rate_limiter (rate_limit.RateLimiter): per-host limiter shared by
+        all requests of the iterator and it's adapters.
 
-        last_request_time (dict): key (str) -- domain,
-        value (int) -- approximate last request time.
+        retry_policy (retry.RetryPolicy): retries failed media requests.
 
     Args:
         subreddit_name (str): used by SubredditIterator.
 
+        probe (bool): determine type of media file by probe request
+        instead of URL extension, False by default. It costs paced request
+        per uncached direct URL. Probes are cached.
+
     Note:
         Resolvers act according to the choice of known video and image
         file extensions.
     """
 
     class HTTPRequestsFailed(Exception):
-        """Internal exception causes StopIteration"""
+        """Media file downloading failed, causes StopIteration"""
 
-    def __init__(self, subreddit_name):
+    MAX_UNRESOLVED = 3 * SubredditIterator.SUBMISSIONS_PER_PAGE
+
+    def __init__(self, subreddit_name, probe=False):
         self.video_extensions = ("mp4", "webm")
         self.image_extensions = ("jpg", "jpeg", "png")
-        self.subreddit = SubredditIterator(subreddit_name)
+        self.subreddit = SubredditIterator(subreddit_name, prefetch_watermark=15)
+        self.resolve_cache = ResolveCache()
+        self.http_cache = HTTPCache()
         self.imgur_resolver = ImgurResolver(self.video_extensions
-                                            + self.image_extensions)
-        self.gfycat_resolver = GfycatResolver(self.video_extensions)
+                                            + self.image_extensions,
+                                            cache=self.resolve_cache)
+        self.gfycat_resolver = GfycatResolver(self.video_extensions,
+                                              cache=self.resolve_cache)
         self.direct_url_resolver = DirectURLResolver(self.video_extensions
-                                                     + self.image_extensions)
+                                                     + self.image_extensions,
+                                                     probe=probe,
+                                                     cache=self.resolve_cache)
         self.download_session = requests.Session()
         self.download_session.headers.update(BROWSER_HEADERS)
-
-        self.last_request_time = dict()
-        self.media_request_interval = 1
+        self.rate_limiter = DEFAULT_LIMITER
+        self.retry_policy = DEFAULT_RETRY_POLICY
 
     def reset(self, subreddit_name):
         """Change subreddit"""
         self.subreddit.reset(subreddit_name)
 
+    def close(self):
+        """Release worker of page prefetch."""
+        self.subreddit.close()
+
     def __iter__(self):
         return self
 
@@ -442,15 +1050,10 @@ class MediaIterator:
         """
         Get next submission related URLs from SubredditIterator.
         Resolve URLs and download submitted file on success.
-        Each failure counts until the count exceeds the maximum and
+        Each failure counts until the count exceeds MAX_UNRESOLVED and
         StopIteration is raised. This is done to limit requests count
         and user response waiting time for subreddits lacking of
-        media submissions of known type. Initially maximum count of unresolved
-        submissions is set roughly to 3 * SubredditIterator.SUBMISSIONS_PER_PAGE.
-
-        Note: occasionally next(SubredditIterator) returns None.
-        This behaviour is unexpected so additional checking for None
-        is added.
+        media submissions of known type.
 
         Raises:
             StopIteration: is caused by NoSubmissionsAvailable exception
@@ -458,56 +1061,90 @@ class MediaIterator:
             file downloading failure (HTTPRequestsFailed exception).
 
         Returns:
-            Media: submitted media or special Media object in case of request failure.
+            Media: submitted media.
         """
-        media_type = None
-        media_content = None
-        media_preview = None
-        unresolved_left = 3 * SubredditIterator.SUBMISSIONS_PER_PAGE
-        while media_type is None and unresolved_left > 0:
+        for _ in range(self.MAX_UNRESOLVED):
+            submission = self.next_submission()
             try:
-                submission = next(self.subreddit)
-            except SubredditIterator.NoSubmissionsAvailable as error:
+                media = self.fetch(submission)
+            except self.HTTPRequestsFailed as error:
                 raise StopIteration from error
 
-            if submission is None:
-                continue
+            if media is not None:
+                return media
 
-            media_type = self.resolve_submission(submission)
-            if media_type is None:
-                unresolved_left -= 1
-                continue
+        raise StopIteration("Too many unresolved submissions, "
+                            "probably non-media subreddit")
+
+    def next_submission(self):
+        """
+        Listing stage: get next submission related URLs from SubredditIterator.
 
+        Note: occasionally next(SubredditIterator) returns None.
+        This behaviour is unexpected so such submissions are skipped.
+
+        Returns:
+            SubmissionRL: submission related URLs.
+
+        Raises:
+            StopIteration: no more submissions available.
+        """
+        while True:
             try:
-                if media_type == "image":
-                    response = self.request_media_file(submission.url,
-                                                       submission.url_referer)
-                    media_content = response.content
-                elif media_type == "video" and submission.url_extra is not None:
-                    response = self.request_media_file(submission.url_extra,
-                                                       submission.url_referer)
-                    media_content = submission.url
-                    media_preview = response.content
-                else:
-                    media_type = None
-                    unresolved_left -= 1
-            except self.HTTPRequestsFailed as error:
+                submission = next(self.subreddit)
+            except SubredditIterator.NoSubmissionsAvailable as error:
                 raise StopIteration from error
 
-        if unresolved_left == 0:
-            raise StopIteration("Too many unresolved submissions, "
-                                "probably non-media subreddit")
+            if submission is not None:
+                return submission
 
-        return Media(type=media_type,
-                     content=media_content,
-                     preview=media_preview
-                    )
+    def fetch(self, submission):
+        """
+        Fetch stage: resolve submission and download submitted image or
+        preview of submitted video. May be executed by several threads
+        at once, each request waits for rate limiter.
+
+        Args:
+            submission (SubmissionRL): submission related URLs.
+
+        Raises:
+            HTTPRequestsFailed: file downloading failure.
+
+        Returns:
+            Media: submitted media, images are not decoded. None if
+            submission is not resolved to media of known type.
+        """
+        media_type = self.resolve_submission(submission)
+        if media_type == "image":
+            content = self.request_media_file(submission.url,
+                                              submission.url_referer)
+            return Media(type=media_type,
+                         content=content,
+                         preview=None,
+                         image=None,
+                         thumbnail=None
+                        )
+
+        if media_type == "video" and submission.url_extra is not None:
+            preview = self.request_media_file(submission.url_extra,
+                                              submission.url_referer)
+            return Media(type=media_type,
+                         content=submission.url,
+                         preview=preview,
+                         image=None,
+                         thumbnail=None
+                        )
+
+        return None
 
     def request_media_file(self, url, url_referer):
         """Series of requests
 
-        Note: Uses time.sleep between requests initially with
-        interval of 1s. Retries request if response code is not 200.
+        Fresh file of HTTP cache is read without requests, stale one is
+        revalidated by conditional request. Downloaded file is cached.
+
+        Note: Blocks until each request is allowed by rate limiter.
+        Retries request according to retry policy.
 
         Args:
             url (str): target URL.
@@ -517,23 +1154,43 @@ class MediaIterator:
             HTTPRequestsFailed.
 
         Returns:
-            requests.Response: response containing media file.
+            bytes: content of media file.
         """
+        entry = self.http_cache.lookup(url)
+        if entry is not None and self.http_cache.is_fresh(entry):
+            content = self.http_cache.read(entry)
+            if content is not None:
+                return content
+
         referer_header = {"Referer": url_referer} if url_referer is not None else {}
-        tries = 2
-        domain = urlparse(url).netloc
-        while True:
-            self.wait_before_request(domain)
-            response = self.download_session.get(url, headers=referer_header)
-            self.last_request_time[domain] = time.monotonic()
-            if response.status_code != 200:
-                if tries == 0:
-                    raise self.HTTPRequestsFailed(
-                        f"Code {response.status_code}, {url}")
-                tries -= 1
-            else:
-                break
-        return response
+        response = self.__get(url, {**referer_header,
+                                    **self.http_cache.conditional_headers(entry)})
+        if response.status_code == 304 and entry is not None:
+            content = self.http_cache.read(self.http_cache.refresh(entry, response.headers))
+            if content is not None:
+                return content
+            # cached file is gone, request it unconditionally
+            response = self.__get(url, referer_header)
+
+        if response.status_code != 200:
+            raise self.HTTPRequestsFailed(f"Code {response.status_code}, {url}")
+        self.http_cache.store_content(url, response.headers, response.content)
+        return response.content
+
+    def __get(self, url, headers):
+        """
+        Raises:
+            HTTPRequestsFailed: request failed after retries.
+
+        Returns:
+            requests.Response.
+        """
+        try:
+            return self.retry_policy.request(
+                self.rate_limiter, url,
+                lambda: self.download_session.get(url, headers=headers))
+        except requests.exceptions.RequestException as error:
+            raise self.HTTPRequestsFailed(f"Request failed: {error}, {url}") from error
 
     def resolve_submission(self, submission):
         """
@@ -541,7 +1198,7 @@ class MediaIterator:
         for imgur.com use imgur resolver. In the third case URL is
         either direct and checked with direct URL resolver or not,
         which means ignored and None is returned.
-        Perform timed requests.
+        Requests are paced by resolvers unless resolution is cached.
 
         Note: ignore imgur albums. /zip ended URLs
         are replaced with URLs of preview images.
@@ -551,21 +1208,17 @@ class MediaIterator:
 
         Returns:
             str or None: strings "video", "image" are returned
-            if direct URL of file with known extension is found,
+            if direct URL of file of known type is found,
             None otherwise.
         """
         url_parts = urlparse(submission.url)
         try:
             if url_parts.netloc == "gfycat.com":
-                self.wait_before_request("gfycat.com")
                 self.gfycat_resolver.resolve(submission)
-                self.last_request_time["gfycat.com"] = time.monotonic()
                 return "video"
 
             if url_parts.netloc == "imgur.com":
-                self.wait_before_request("imgur.com")
                 self.imgur_resolver.resolve(submission)
-                self.last_request_time["imgur.com"] = time.monotonic()
                 if (url_parts.path.rsplit(".", maxsplit=1)[-1]
                         in self.video_extensions):
                     return "video"
@@ -576,28 +1229,17 @@ class MediaIterator:
 
                 return None
 
-            self.direct_url_resolver.resolve(submission)
-            if (url_parts.path.rsplit(".", maxsplit=1)[-1]
-                    in self.video_extensions):
+            if self.direct_url_resolver.resolve(submission) in self.video_extensions:
                 return "video"
 
             return "image"
         except SubmissionResolver.MediaIsUnavailable:
             return None
 
-    def wait_before_request(self, domain):
-        """
-        Sleep if request time interval to given domain is less than
-        chosen request period.
-        """
-        interval = time.monotonic() - self.last_request_time.get(domain, 0)
-        if interval < self.media_request_interval:
-            time.sleep(self.media_request_interval - interval)
-
 
 if __name__ == "__main__":
     import sys
     app = QtWidgets.QApplication(sys.argv)
-    window = QuickPeek()
+    window = QuickPeek(probe="--probe" in sys.argv[1:])
     window.show()
     sys.exit(app.exec_())
@@ -0,0 +1,238 @@
+"""Per-host request rate limiting shared by adapters and their consumers"""
+
+import asyncio
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """Token bucket of single host
+
+    Holds up to burst tokens refilled at rate tokens per second, each request
+    takes a token. If no token is left request reserves a future one: token
+    count becomes negative and caller sleeps exactly until the token is
+    refilled. Callers are served in order of reservation without polling.
+
+    Args:
+        rate (float): tokens per second.
+
+        burst (int): bucket capacity.
+
+    Attributes:
+        rate (float).
+
+        burst (int).
+
+        tokens (float): available tokens, negative if reserved in advance.
+
+        update_time (float): monotonic time of last refill.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.update_time = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.update_time) * self.rate)
+        self.update_time = now
+
+    def hold(self, now, delay):
+        """
+        Make tokens not reserved yet available no sooner than after delay.
+
+        Args:
+            now (float): monotonic time.
+
+            delay (float): seconds.
+        """
+        self.refill(now)
+        self.tokens = min(self.tokens, 1 - delay * self.rate)
+
+    def reserve(self, now):
+        """
+        Take a token.
+
+        Args:
+            now (float): monotonic time.
+
+        Returns:
+            float: delay in seconds until the token is available.
+        """
+        self.refill(now)
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+
+class RateLimiter:
+    """Per-host request rate limiter
+
+    Keeps token bucket per host. Thread-safe: lock is held only while
+    a token is reserved, waiting is done by time.sleep in threads or
+    by asyncio.sleep in coroutines, so limiter may be shared by both.
+    Rate of throttled host is halved by throttle and restored step by step
+    by recover on successful requests.
+
+    Args:
+        rate (float): default requests per second of host, 1.
+
+        burst (int): default bucket capacity, 1 means that requests are
+        spaced by 1 / rate seconds.
+
+        host_rates (dict): host to (rate, burst) pair overriding defaults.
+
+    Class attributes:
+        MIN_RATE_FACTOR (float): throttled rate is not lowered below
+        configured one multiplied by the factor, 1/16.
+
+        RECOVERY_STEP (float): part of configured rate added by recover, 0.1.
+
+    Attributes:
+        rate (float).
+
+        burst (int).
+
+        host_rates (dict).
+
+        buckets (dict): host to TokenBucket, created on first request.
+
+        lock (threading.Lock): guards buckets.
+    """
+
+    MIN_RATE_FACTOR = 1 / 16
+    RECOVERY_STEP = 0.1
+
+    def __init__(self, rate=1, burst=1, host_rates=None):
+        self.rate = rate
+        self.burst = burst
+        self.host_rates = dict(host_rates) if host_rates is not None else {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def host(url):
+        """
+        Args:
+            url (str): URL or bare host name.
+
+        Returns:
+            str: lowercase host name without www. prefix.
+        """
+        host = (urlparse(url).netloc if "//" in url else url).lower()
+        if host.startswith("www."):
+            host = host[len("www."):]
+        return host
+
+    def get_rate(self, url):
+        """
+        Returns:
+            tuple: (rate, burst) of URL host.
+        """
+        return self.host_rates.get(self.host(url), (self.rate, self.burst))
+
+    def set_rate(self, url, rate, burst=None):
+        """
+        Change rate of URL host, reservations already made are kept.
+
+        Args:
+            url (str): URL or host name.
+
+            rate (float): requests per second.
+
+            burst (int): bucket capacity, unchanged if None.
+
+        Raises:
+            ValueError: rate is not positive or burst is less than 1.
+        """
+        if not rate > 0:
+            raise ValueError(f"Rate must be > 0, given {rate}")
+        if burst is not None and burst < 1:
+            raise ValueError(f"Burst must be >= 1, given {burst}")
+
+        host = self.host(url)
+        if burst is None:
+            burst = self.get_rate(host)[1]
+        with self.lock:
+            self.host_rates[host] = (rate, burst)
+            bucket = self.buckets.get(host)
+            if bucket is not None:
+                bucket.refill(time.monotonic())
+                bucket.rate = rate
+                bucket.burst = burst
+
+    def throttle(self, url, delay=0):
+        """
+        Halve current rate of URL host and hold it's requests for delay.
+        Is called when host responds it is overloaded.
+
+        Args:
+            url (str): URL or host name.
+
+            delay (float): seconds to hold requests for, e.g. Retry-After.
+        """
+        host = self.host(url)
+        rate = self.get_rate(host)[0]
+        with self.lock:
+            bucket = self.__bucket(host)
+            now = time.monotonic()
+            bucket.refill(now)
+            bucket.rate = max(rate * self.MIN_RATE_FACTOR, bucket.rate / 2)
+            bucket.hold(now, delay)
+
+    def recover(self, url):
+        """
+        Raise rate of throttled URL host by RECOVERY_STEP of configured rate.
+        Is called on successful requests.
+
+        Args:
+            url (str): URL or host name.
+        """
+        host = self.host(url)
+        rate = self.get_rate(host)[0]
+        with self.lock:
+            bucket = self.__bucket(host)
+            if bucket.rate < rate:
+                bucket.refill(time.monotonic())
+                bucket.rate = min(rate, bucket.rate + rate * self.RECOVERY_STEP)
+
+    def reserve(self, url):
+        """
+        Take a token of URL host.
+
+        Returns:
+            float: delay in seconds before request may be sent.
+        """
+        host = self.host(url)
+        with self.lock:
+            return self.__bucket(host).reserve(time.monotonic())
+
+    def __bucket(self, host):
+        """
+        Returns:
+            TokenBucket: bucket of host, created on first use.
+            Is called with lock acquired.
+        """
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = TokenBucket(*self.host_rates.get(host, (self.rate, self.burst)))
+            self.buckets[host] = bucket
+        return bucket
+
+    def acquire(self, url):
+        """Block until request to URL host is allowed."""
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, url):
+        """Sleep asynchronously until request to URL host is allowed."""
+        delay = self.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+DEFAULT_LIMITER = RateLimiter(rate=1, burst=1, host_rates={"old.reddit.com": (0.5, 1)})
+"""Process-wide limiter used by default: one request per 2s to old.reddit.com,
+one request per second to any other host."""
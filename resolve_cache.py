@@ -0,0 +1,338 @@
+"""Persistent cache of resolved and unresolvable submission URLs"""
+
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse, urlunparse
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "quick-peek",
+                                  "resolve.sqlite3")
+
+
+def normalize_url(url):
+    """
+    Normalize submitted URL to be used as cache key: scheme is set to https,
+    domain is lowercased and stripped of www. and m. prefixes, query, fragment
+    and trailing slash are dropped.
+
+    Args:
+        url (str).
+
+    Returns:
+        str: normalized URL.
+    """
+    url_parts = urlparse(url.strip())
+    domain = url_parts.netloc.lower()
+    for prefix in ("www.", "m."):
+        if domain.startswith(prefix):
+            domain = domain[len(prefix):]
+            break
+    return urlunparse(("https", domain, url_parts.path.rstrip("/"), "", "", ""))
+
+
+class ResolveCache:
+    """SQLite based cache of submission resolutions
+
+    Maps normalized submitted URL to direct URL of media file, extra URL
+    and HTTP referer obtained by resolver. Entries expire after ttl seconds.
+    If count of entries exceeds max_entries least recently used ones
+    are evicted.
+    Failures of resolution are kept separately with their reasons,
+    these expire sooner, after failure_ttl seconds or their own ttl
+    given on store. Failures which depend
+    on wanted media extensions, e.g. no media of the extensions is found
+    on page, are kept with the extensions and are ignored by resolvers
+    wanting other ones.
+    Probes of direct URLs, i.e. media type and size of file, are kept
+    by exact URL and expire after ttl seconds.
+    Cache file may be shared by several processes, instance may be shared
+    by several threads.
+
+    Args:
+        path (str): cache file path, directory is created if needed.
+        If not specified DEFAULT_CACHE_PATH is used.
+
+        ttl (int): lifetime of entries in seconds, 7 days by default.
+
+        max_entries (int): 100000 by default, limits resolutions, failures
+        and probes separately.
+
+        failure_ttl (int): lifetime of failures in seconds, 1 day by default.
+
+    Attributes:
+        path (str).
+
+        ttl (int).
+
+        failure_ttl (int).
+
+        max_entries (int).
+
+        connection (sqlite3.Connection): autocommit connection.
+
+        lock (threading.Lock): guards connection.
+
+        puts_since_eviction (int): count of insertions since last eviction.
+
+        EVICTION_PERIOD (int): count of insertions between evictions, 100.
+    """
+
+    EVICTION_PERIOD = 100
+
+    def __init__(self, path=None, ttl=7 * 24 * 3600, max_entries=100000,
+                 failure_ttl=24 * 3600):
+        if path is None:
+            path = DEFAULT_CACHE_PATH
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.failure_ttl = failure_ttl
+        self.lock = threading.Lock()
+        self.puts_since_eviction = 0
+        self.connection = sqlite3.connect(path, timeout=10, isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # commits aren't synced: entry lost on OS crash is only resolved again
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS resolutions ("
+            " url TEXT PRIMARY KEY,"
+            " url_direct TEXT NOT NULL,"
+            " url_extra TEXT,"
+            " url_referer TEXT,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS resolutions_accessed ON resolutions (accessed)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS failures ("
+            " url TEXT PRIMARY KEY,"
+            " reason TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " extensions TEXT,"
+            " ttl REAL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS failures_created ON failures (created)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS probes ("
+            " url TEXT PRIMARY KEY,"
+            " extension TEXT,"
+            " size INTEGER,"
+            " created REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS probes_created ON probes (created)")
+
+    def get(self, url):
+        """
+        Args:
+            url (str): submitted URL.
+
+        Returns:
+            tuple: (url_direct, url_extra, url_referer) of cached resolution.
+
+            None: no fresh entry is found.
+        """
+        key = normalize_url(url)
+        now = time.time()
+        try:
+            with self.lock:
+                row = self.connection.execute(
+                    "SELECT url_direct, url_extra, url_referer FROM resolutions"
+                    " WHERE url = ? AND created > ?",
+                    (key, now - self.ttl)
+                ).fetchone()
+                if row is not None:
+                    self.connection.execute(
+                        "UPDATE resolutions SET accessed = ? WHERE url = ?", (now, key))
+        except sqlite3.Error as error:
+            print(f"Resolve cache error: {error}")
+            return None
+
+        return row
+
+    def put(self, url, url_direct, url_extra, url_referer):
+        """
+        Store resolution of submitted URL.
+
+        Args:
+            url (str): submitted URL.
+
+            url_direct (str): direct URL of media file.
+
+            url_extra (str): extra URL, may be None.
+
+            url_referer (str): HTTP referer, may be None.
+        """
+        now = time.time()
+        try:
+            with self.lock:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO resolutions VALUES (?, ?, ?, ?, ?, ?)",
+                    (normalize_url(url), url_direct, url_extra, url_referer, now, now)
+                )
+                self.puts_since_eviction += 1
+                if self.puts_since_eviction >= self.EVICTION_PERIOD:
+                    self.puts_since_eviction = 0
+                    self.__evict(now)
+        except sqlite3.Error as error:
+            print(f"Resolve cache error: {error}")
+
+    def get_failure(self, url, extensions=None):
+        """
+        Args:
+            url (str): submitted URL.
+
+            extensions (iterable of str): media extensions wanted by caller,
+            failures cached for other extensions are ignored.
+
+        Returns:
+            str: reason of cached failure.
+
+            None: no fresh failure is found.
+        """
+        try:
+            with self.lock:
+                row = self.connection.execute(
+                    "SELECT reason FROM failures WHERE url = ?"
+                    " AND created > ? - COALESCE(ttl, ?)"
+                    " AND (extensions IS NULL OR extensions = ?)",
+                    (normalize_url(url), time.time(), self.failure_ttl,
+                     self.extensions_key(extensions))
+                ).fetchone()
+        except sqlite3.Error as error:
+            print(f"Resolve cache error: {error}")
+            return None
+
+        return row[0] if row is not None else None
+
+    def put_failure(self, url, reason, extensions=None, ttl=None):
+        """
+        Store failure of submitted URL resolution.
+
+        Args:
+            url (str): submitted URL.
+
+            reason (str): failure description.
+
+            extensions (iterable of str): media extensions failure depends on,
+            None if it holds for any extensions, e.g. page is gone.
+
+            ttl (float): lifetime of failure in seconds, failure_ttl if None.
+        """
+        try:
+            with self.lock:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO failures VALUES (?, ?, ?, ?, ?)",
+                    (normalize_url(url), reason, time.time(),
+                     self.extensions_key(extensions), ttl)
+                )
+                self.puts_since_eviction += 1
+                if self.puts_since_eviction >= self.EVICTION_PERIOD:
+                    self.puts_since_eviction = 0
+                    self.__evict(time.time())
+        except sqlite3.Error as error:
+            print(f"Resolve cache error: {error}")
+
+    def get_probe(self, url):
+        """
+        Args:
+            url (str): direct URL, is not normalized.
+
+        Returns:
+            tuple: (extension, size) of cached probe, extension is None
+            if file is not media, size is None if unknown.
+
+            None: no fresh probe is found.
+        """
+        try:
+            with self.lock:
+                row = self.connection.execute(
+                    "SELECT extension, size FROM probes WHERE url = ? AND created > ?",
+                    (url, time.time() - self.ttl)
+                ).fetchone()
+        except sqlite3.Error as error:
+            print(f"Resolve cache error: {error}")
+            return None
+
+        return row
+
+    def put_probe(self, url, extension, size):
+        """
+        Store probe of direct URL.
+
+        Args:
+            url (str): direct URL.
+
+            extension (str): media file extension, None if file is not media.
+
+            size (int): file size, may be None.
+        """
+        try:
+            with self.lock:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?)",
+                    (url, extension, size, time.time())
+                )
+                self.puts_since_eviction += 1
+                if self.puts_since_eviction >= self.EVICTION_PERIOD:
+                    self.puts_since_eviction = 0
+                    self.__evict(time.time())
+        except sqlite3.Error as error:
+            print(f"Resolve cache error: {error}")
+
+    @staticmethod
+    def extensions_key(extensions):
+        """
+        Returns:
+            str: sorted comma separated extensions, None if extensions are None.
+        """
+        return ",".join(sorted(set(extensions))) if extensions is not None else None
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def __evict(self, now):
+        """
+        Remove expired entries and least recently used ones exceeding
+        max_entries, oldest failures and probes exceeding max_entries.
+        Called with lock acquired.
+        """
+        self.connection.execute("DELETE FROM resolutions WHERE created <= ?",
+                                (now - self.ttl,))
+        excess = (self.connection.execute("SELECT COUNT(*) FROM resolutions")
+                  .fetchone()[0] - self.max_entries)
+        if excess > 0:
+            self.connection.execute(
+                "DELETE FROM resolutions WHERE url IN"
+                " (SELECT url FROM resolutions ORDER BY accessed LIMIT ?)",
+                (excess,)
+            )
+        self.connection.execute(
+            "DELETE FROM failures WHERE created <= ? - COALESCE(ttl, ?)",
+            (now, self.failure_ttl))
+        excess = (self.connection.execute("SELECT COUNT(*) FROM failures")
+                  .fetchone()[0] - self.max_entries)
+        if excess > 0:
+            self.connection.execute(
+                "DELETE FROM failures WHERE url IN"
+                " (SELECT url FROM failures ORDER BY created LIMIT ?)",
+                (excess,)
+            )
+        self.connection.execute("DELETE FROM probes WHERE created <= ?",
+                                (now - self.ttl,))
+        excess = (self.connection.execute("SELECT COUNT(*) FROM probes")
+                  .fetchone()[0] - self.max_entries)
+        if excess > 0:
+            self.connection.execute(
+                "DELETE FROM probes WHERE url IN"
+                " (SELECT url FROM probes ORDER BY created LIMIT ?)",
+                (excess,)
+            )
@@ -0,0 +1,200 @@
+"""Retry policy of HTTP requests shared by adapters"""
+
+import asyncio
+import email.utils
+import random
+import time
+
+import requests
+
+
+class RetryPolicy:
+    """Retry policy with exponential backoff
+
+    Failed attempt is retried only if it's status code is retryable or
+    connection failed, other responses are returned to caller as is.
+    Delay before n-th retry is random, between halves of backoff * 2**n and
+    backoff * 2**n, capped by max_backoff. If server sends Retry-After
+    it is used as delay instead. Throttling responses halve request rate
+    of host in rate limiter and hold it's requests for the delay, successful
+    ones restore the rate gradually.
+
+    Args:
+        tries (int): maximal count of attempts, 4.
+
+        backoff (float): base delay in seconds, 1.
+
+        max_backoff (float): maximal computed delay in seconds, 60.
+
+        max_retry_after (float): request is not retried if server asks
+        to wait longer, seconds, 300. Host is held for the whole delay anyway.
+
+    Class attributes:
+        RETRYABLE_CODES (tuple of int): status codes of transient failures.
+
+        THROTTLING_CODES (tuple of int): status codes of overloaded server.
+
+        CONNECTION_ERRORS (tuple): retryable exceptions of requests.
+    """
+
+    RETRYABLE_CODES = (408, 425, 429, 500, 502, 503, 504)
+    THROTTLING_CODES = (429, 503)
+    CONNECTION_ERRORS = (requests.exceptions.ConnectionError,
+                         requests.exceptions.Timeout)
+
+    def __init__(self, tries=4, backoff=1, max_backoff=60, max_retry_after=300):
+        self.tries = tries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+
+    @staticmethod
+    def parse_retry_after(value):
+        """
+        Args:
+            value (str): Retry-After header value: seconds or HTTP date.
+            May be None.
+
+        Returns:
+            float: seconds to wait, None if value is missing or invalid.
+        """
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_time = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_time is None:
+            return None
+        return max(0.0, retry_time.timestamp() - time.time())
+
+    def retry_delay(self, rate_limiter, url, attempt, status_code=None,
+                    retry_after=None):
+        """
+        Classify failed attempt and feed throttling back into rate limiter.
+
+        Args:
+            rate_limiter (rate_limit.RateLimiter).
+
+            url (str): requested URL.
+
+            attempt (int): number of failed attempt starting from 0.
+
+            status_code (int): response status code, None if connection failed.
+
+            retry_after (str): Retry-After header value, may be None.
+
+        Returns:
+            float: delay in seconds before next attempt, None if request
+            must not be retried.
+        """
+        if status_code is not None and status_code not in self.RETRYABLE_CODES:
+            return None
+
+        delay = self.parse_retry_after(retry_after)
+        if delay is None:
+            delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+            delay = random.uniform(delay / 2, delay)
+
+        if status_code in self.THROTTLING_CODES:
+            # host is held even if request isn't retried
+            rate_limiter.throttle(url, delay)
+        if delay > self.max_retry_after:
+            print(f"Server asks to retry after {delay:.0f}s, {url}")
+            return None
+        if attempt + 1 >= self.tries:
+            return None
+
+        return delay
+
+    def request(self, rate_limiter, url, send):
+        """
+        Send request until it succeeds, fails permanently or tries are
+        exhausted. Each attempt is paced by rate limiter.
+
+        Args:
+            rate_limiter (rate_limit.RateLimiter).
+
+            url (str): requested URL.
+
+            send (callable): sends request, returns requests.Response.
+
+        Returns:
+            requests.Response: last response, it's status code is checked
+            by caller.
+
+        Raises:
+            requests.exceptions.RequestException: last attempt failed to connect
+            or other request error.
+        """
+        attempt = 0
+        while True:
+            rate_limiter.acquire(url)
+            try:
+                response = send()
+            except self.CONNECTION_ERRORS:
+                delay = self.retry_delay(rate_limiter, url, attempt)
+                if delay is None:
+                    raise
+            else:
+                if response.status_code < 400:
+                    rate_limiter.recover(url)
+                    return response
+
+                delay = self.retry_delay(rate_limiter, url, attempt, response.status_code,
+                                         response.headers.get("Retry-After"))
+                if delay is None:
+                    return response
+
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    async def request_async(self, rate_limiter, url, send, errors):
+        """
+        Async counterpart of request.
+
+        Args:
+            rate_limiter (rate_limit.RateLimiter).
+
+            url (str): requested URL.
+
+            send (callable): returns awaitable of aiohttp.ClientResponse.
+
+            errors (tuple): retryable exceptions.
+
+        Returns:
+            aiohttp.ClientResponse: last response, caller releases it.
+
+        Raises:
+            errors: last attempt failed.
+        """
+        attempt = 0
+        while True:
+            await rate_limiter.acquire_async(url)
+            try:
+                response = await send()
+            except errors:
+                delay = self.retry_delay(rate_limiter, url, attempt)
+                if delay is None:
+                    raise
+            else:
+                if response.status < 400:
+                    rate_limiter.recover(url)
+                    return response
+
+                delay = self.retry_delay(rate_limiter, url, attempt, response.status,
+                                         response.headers.get("Retry-After"))
+                if delay is None:
+                    return response
+
+                response.release()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
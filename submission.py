@@ -41,3 +41,10 @@ class SubmissionRL:
                 "extra": submission_rl.url_extra,
                 "referer": submission_rl.url_referer
                }
+
+    @staticmethod
+    def from_json(json_object):
+        """Inverse of to_json"""
+        return SubmissionRL(url=json_object["url"],
+                            url_extra=json_object["extra"],
+                            url_referer=json_object["referer"])
@@ -0,0 +1,185 @@
+"""Tests of duration parsing and file checks of download_filter"""
+
+import os
+import struct
+import tempfile
+import unittest
+
+from download_filter import (DownloadFilter, media_duration, mp4_duration, read_ebml_vint,
+                             webm_duration)
+
+
+def mp4_box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def mvhd_v0(timescale, duration):
+    return mp4_box(b"mvhd", b"\x00\x00\x00\x00" + struct.pack(">IIII", 1, 2, timescale, duration)
+                   + bytes(80))
+
+
+def mvhd_v1(timescale, duration):
+    return mp4_box(b"mvhd", b"\x01\x00\x00\x00" + struct.pack(">QQIQ", 1, 2, timescale, duration)
+                   + bytes(80))
+
+
+FTYP = mp4_box(b"ftyp", b"isom\x00\x00\x02\x00isomiso2avc1mp41")
+
+
+def ebml_element(element_id, data, size=None):
+    """Element with 8 byte size, size may be given as raw encoded bytes."""
+    if size is None:
+        size = (0x01 << 56 | len(data)).to_bytes(8, "big")
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, "big") + size + data
+
+
+WEBM_HEADER = ebml_element(0x1A45DFA3, ebml_element(0x4282, b"webm"))
+UNKNOWN_SIZE = b"\x01\xff\xff\xff\xff\xff\xff\xff"
+
+
+def webm_file(info, is_size_known=False):
+    segment = ebml_element(0x1549A966, info) + ebml_element(0x1F43B675, bytes(16))
+    return WEBM_HEADER + ebml_element(0x18538067, segment,
+                                      None if is_size_known else UNKNOWN_SIZE)
+
+
+class MP4DurationTest(unittest.TestCase):
+
+    def test_version_0(self):
+        head = FTYP + mp4_box(b"moov", mvhd_v0(1000, 12500))
+        self.assertEqual(mp4_duration(head), 12.5)
+
+    def test_version_1(self):
+        head = FTYP + mp4_box(b"moov", mvhd_v1(90000, 90000 * 2 ** 33))
+        self.assertEqual(mp4_duration(head), 2 ** 33)
+
+    def test_large_size_box(self):
+        moov = mvhd_v0(600, 1200)
+        head = FTYP + struct.pack(">I4sQ", 1, b"moov", 16 + len(moov)) + moov
+        self.assertEqual(mp4_duration(head), 2)
+
+    def test_zero_timescale(self):
+        self.assertIsNone(mp4_duration(FTYP + mp4_box(b"moov", mvhd_v0(0, 100))))
+
+    def test_media_data_first(self):
+        head = FTYP + mp4_box(b"mdat", bytes(64)) + mp4_box(b"moov", mvhd_v0(1000, 1000))
+        self.assertEqual(mp4_duration(head), 1)
+        self.assertIsNone(mp4_duration(head[:len(FTYP) + 32]))
+
+    def test_truncated(self):
+        head = FTYP + mp4_box(b"moov", mvhd_v1(1000, 5000))
+        for end in (0, 4, len(FTYP) + 4, len(FTYP) + 20, len(FTYP) + 40):
+            self.assertIsNone(mp4_duration(head[:end]), end)
+
+    def test_invalid_box_size(self):
+        self.assertIsNone(mp4_duration(FTYP + struct.pack(">I4s", 4, b"moov")))
+
+
+class ReadEBMLVintTest(unittest.TestCase):
+
+    def test_size(self):
+        self.assertEqual(read_ebml_vint(b"\x81", 0), (1, 1))
+        self.assertEqual(read_ebml_vint(b"\x00\x40\x02", 1), (2, 3))
+        self.assertEqual(read_ebml_vint(b"\x10\x00\x01\x00", 0), (256, 4))
+
+    def test_id_keeps_marker(self):
+        self.assertEqual(read_ebml_vint(b"\x1a\x45\xdf\xa3", 0, keep_marker=True),
+                         (0x1A45DFA3, 4))
+        self.assertEqual(read_ebml_vint(b"\x44\x89", 0, keep_marker=True), (0x4489, 2))
+
+    def test_unknown_size(self):
+        self.assertEqual(read_ebml_vint(b"\xff", 0), (None, 1))
+        self.assertEqual(read_ebml_vint(UNKNOWN_SIZE, 0), (None, 8))
+        self.assertEqual(read_ebml_vint(b"\xff", 0, keep_marker=True), (0xFF, 1))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            read_ebml_vint(b"\x00\x81", 0)
+
+    def test_truncated(self):
+        with self.assertRaises(IndexError):
+            read_ebml_vint(b"\x40", 0)
+        with self.assertRaises(IndexError):
+            read_ebml_vint(b"\x81", 1)
+
+
+class WebMDurationTest(unittest.TestCase):
+
+    def test_unknown_size_segment(self):
+        info = (ebml_element(0x2AD7B1, (1000000).to_bytes(3, "big"))
+                + ebml_element(0x4489, struct.pack(">d", 7500.0)))
+        self.assertEqual(webm_duration(webm_file(info)), 7.5)
+
+    def test_known_size_segment(self):
+        info = ebml_element(0x4489, struct.pack(">d", 2000.0))
+        self.assertEqual(webm_duration(webm_file(info, is_size_known=True)), 2)
+
+    def test_float_duration_and_timecode_scale(self):
+        info = (ebml_element(0x2AD7B1, (500000).to_bytes(3, "big"))
+                + ebml_element(0x4489, struct.pack(">f", 3000.0)))
+        self.assertEqual(webm_duration(webm_file(info)), 1.5)
+
+    def test_missing_duration(self):
+        info = ebml_element(0x2AD7B1, (1000000).to_bytes(3, "big"))
+        self.assertIsNone(webm_duration(webm_file(info)))
+
+    def test_unknown_size_info(self):
+        info = ebml_element(0x4489, struct.pack(">d", 2000.0))
+        head = WEBM_HEADER + ebml_element(0x18538067, ebml_element(0x1549A966, info, UNKNOWN_SIZE),
+                                          UNKNOWN_SIZE)
+        self.assertIsNone(webm_duration(head))
+
+    def test_truncated(self):
+        info = ebml_element(0x4489, struct.pack(">d", 2000.0))
+        head = webm_file(info)
+        duration_end = head.index(b"\x44\x89") + 2 + 8 + 8
+        for end in range(duration_end):
+            self.assertIsNone(webm_duration(head[:end]), end)
+        self.assertEqual(webm_duration(head[:duration_end]), 2)
+
+
+class MediaDurationTest(unittest.TestCase):
+
+    def test_container_detection(self):
+        self.assertEqual(media_duration(FTYP + mp4_box(b"moov", mvhd_v0(10, 30))), 3)
+        info = ebml_element(0x4489, struct.pack(">d", 4000.0))
+        self.assertEqual(media_duration(webm_file(info)), 4)
+        self.assertIsNone(media_duration(b"\xff\xd8\xff\xe0" + bytes(60)))
+        self.assertIsNone(media_duration(b""))
+
+
+class CheckFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def save(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "wb") as outf:
+            outf.write(content)
+        return path
+
+    def test_size(self):
+        path = self.save("a.jpg", bytes(100))
+        DownloadFilter(max_size=100).check_file("url", path)
+        with self.assertRaises(DownloadFilter.MediaIsFiltered):
+            DownloadFilter(max_size=99).check_file("url", path)
+        with self.assertRaises(DownloadFilter.MediaIsFiltered):
+            DownloadFilter(min_size=101).check_file("url", path)
+
+    def test_mime_type(self):
+        path = self.save("a.webm", bytes(10))
+        DownloadFilter(mime_types=["video/*"]).check_file("url", path)
+        with self.assertRaises(DownloadFilter.MediaIsFiltered):
+            DownloadFilter(mime_types=["image/jpeg"]).check_file("url", path)
+
+    def test_duration(self):
+        path = self.save("a.mp4", FTYP + mp4_box(b"moov", mvhd_v0(1000, 61000)))
+        DownloadFilter(max_duration=61).check_file("url", path)
+        with self.assertRaises(DownloadFilter.MediaIsFiltered):
+            DownloadFilter(max_duration=60).check_file("url", path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+"""Tests of throttling feedback of retry policy"""
+
+import unittest
+
+from rate_limit import RateLimiter
+from retry import RetryPolicy
+
+
+class RetryDelayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rate_limiter = RateLimiter(rate=10, burst=10)
+        self.policy = RetryPolicy()
+
+    def test_long_retry_after_holds_host(self):
+        url = "https://example.com/a.jpg"
+        self.assertIsNone(self.policy.retry_delay(self.rate_limiter, url, 0, 429, "3600"))
+        self.assertGreater(self.rate_limiter.reserve(url), 3500)
+        self.assertLess(self.rate_limiter.reserve("https://other.com/b.jpg"), 1)
+
+    def test_short_retry_after_is_retried(self):
+        url = "https://example.com/a.jpg"
+        self.assertEqual(self.policy.retry_delay(self.rate_limiter, url, 0, 503, "5"), 5)
+        self.assertGreater(self.rate_limiter.reserve(url), 4)
+
+    def test_permanent_failure(self):
+        url = "https://example.com/a.jpg"
+        self.assertIsNone(self.policy.retry_delay(self.rate_limiter, url, 0, 404, "3600"))
+        self.assertLess(self.rate_limiter.reserve(url), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Per-host counter of transferred bytes of fetched pages"""
+
+import threading
+
+from rate_limit import RateLimiter
+
+
+class TransferCounter:
+    """Per-host counter of responses and their bytes
+
+    Counts bytes received over the wire, i.e. compressed if content is
+    transfer-encoded, and bytes of decoded content, so effect of
+    compression is seen per host. Instance may be shared by several
+    threads and coroutines.
+
+    Attributes:
+        hosts (dict): host to list [responses, wire bytes, content bytes].
+
+        lock (threading.Lock): guards hosts.
+    """
+
+    def __init__(self):
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def add(self, url, wire_bytes, content_bytes):
+        """
+        Args:
+            url (str): URL of response.
+
+            wire_bytes (int): count of received bytes.
+
+            content_bytes (int): count of decoded bytes.
+        """
+        host = RateLimiter.host(url)
+        with self.lock:
+            counts = self.hosts.setdefault(host, [0, 0, 0])
+            counts[0] += 1
+            counts[1] += wire_bytes
+            counts[2] += content_bytes
+
+    def add_response(self, response, content_bytes):
+        """
+        Count requests response, wire bytes are taken from urllib3.
+
+        Args:
+            response (requests.Response): response read completely or partly.
+
+            content_bytes (int): count of read decoded bytes.
+        """
+        try:
+            wire_bytes = response.raw.tell()
+        except (AttributeError, OSError):
+            wire_bytes = content_bytes
+        self.add(response.url, wire_bytes, content_bytes)
+
+    def add_async_response(self, response, content_bytes):
+        """
+        Count aiohttp response. Wire bytes are equal to decoded ones
+        on aiohttp versions which don't count them.
+
+        Args:
+            response (aiohttp.ClientResponse): response read completely or partly.
+
+            content_bytes (int): count of read decoded bytes.
+        """
+        wire_bytes = getattr(response.content, "total_raw_bytes", content_bytes)
+        self.add(str(response.url), wire_bytes, content_bytes)
+
+    def get(self, url):
+        """
+        Args:
+            url (str): URL or host name.
+
+        Returns:
+            tuple: count of responses, wire bytes and content bytes of host.
+        """
+        with self.lock:
+            return tuple(self.hosts.get(RateLimiter.host(url), (0, 0, 0)))
+
+    def report(self):
+        """
+        Returns:
+            str: line per host, busiest hosts first.
+        """
+        with self.lock:
+            hosts = sorted(self.hosts.items(), key=lambda item: item[1][1], reverse=True)
+        lines = []
+        for host, (responses, wire_bytes, content_bytes) in hosts:
+            ratio = wire_bytes / content_bytes if content_bytes else 1
+            lines.append(f"{host}: {responses} responses,"
+                         f" {wire_bytes / 1024:.1f} KiB received"
+                         f" ({wire_bytes / responses / 1024:.1f} KiB per response),"
+                         f" {content_bytes / 1024:.1f} KiB decoded, ratio {ratio:.3f}")
+        return "\n".join(lines)
+
+
+DEFAULT_COUNTER = TransferCounter()
+"""Process-wide counter of fetched pages used by adapters."""